@@ -1,3 +1,9 @@
+import time
+
+# Début de l'exécution du script ; la première exécution d'un processus (démarrage à froid)
+# comprend le chargement des modules
+_run_started = time.perf_counter()
+
 import streamlit as st
 
 st.set_page_config(
@@ -6,20 +12,190 @@ st.set_page_config(
     layout="wide"
 )
 
-import os, json
-from utils.note_manager import load_notes, save_note, delete_note, update_note
-from utils.question_generator import generate_questions, evaluate_answer
-from config import QUESTIONS_DIR
-from utils.stats_manager import get_all_stats, save_quiz_result, delete_note_stats, delete_all_stats
+import logging
+from collections import deque
+from types import SimpleNamespace
+from utils.note_manager import list_note_titles, count_notes, get_note_content, save_note, delete_note, update_note
+from utils.metrics import registry as metrics, tags as metrics_tags
+from config import (
+    GRADING_BATCH_MODE,
+    HISTORY_PAGE_SIZE,
+    NOTES_PAGE_SIZE,
+    QUIZ_PAGE_SIZE,
+    PERFORMANCE_NOTES_PAGE_SIZE,
+    METRICS_MAX_RECORDS,
+    MULTI_USER,
+    WORKSPACE_USER_HEADER,
+    ADMIN_USERS,
+    USER_DAILY_TOKEN_QUOTA,
+    ensure_dirs,
+)
+from utils import workspace
+from utils.question_store import load_note_questions, delete_note_questions
+from utils.cache import invalidate_note_questions
+from utils.search_index import search
+from utils.scheduler import get_due_questions, count_due
+from utils.stats_manager import get_stats_summary, get_note_attempts, save_quiz_session, delete_note_stats, get_daily_scores, delete_all_stats
+
+@st.cache_resource(show_spinner=False)
+def init_app():
+    """
+    Initialisation unique par processus, partagée par toutes les sessions (et non refaite à
+    chaque exécution du script) : dossiers de données et journalisation
+    :return: Durées d'exécution du script : {"cold_start": première exécution, "runs": suivantes}
+    """
+    ensure_dirs()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    return {"cold_start": None, "runs": deque(maxlen=METRICS_MAX_RECORDS)}
+
+@st.cache_resource(show_spinner=False)
+def model_services():
+    """
+    Fonctions qui appellent le modèle, chargées par la première page qui en a besoin
+    """
+    from utils import question_generator, llm_client, jobs
+
+    return SimpleNamespace(
+        stream_questions=question_generator.stream_questions,
+        evaluate_answers=question_generator.evaluate_answers,
+        is_stale=jobs.is_stale,
+        reset_client=llm_client.reset_client,
+        circuit_breaker=llm_client.circuit_breaker,
+        start_bulk_generation=jobs.start_bulk_generation,
+        get_job_status=jobs.get_job_status,
+        is_running=jobs.is_running,
+    )
+
+def paginate(total, page_size, key, label="Page"):
+    """
+    Sélecteur de page : seuls les éléments de la page choisie sont lus et affichés
+    :param total: Nombre total d'éléments
+    :param key: Clé du sélecteur dans la session
+    :return: Couple (position du premier élément de la page, nombre d'éléments par page)
+    """
+    page_count = max(1, (total - 1) // page_size + 1)
+    if page_count == 1:
+        return 0, page_size
+    # Après une suppression, la page choisie peut ne plus exister
+    if st.session_state.get(key, 1) > page_count:
+        st.session_state[key] = page_count
+    page = st.number_input(f"{label} (sur {page_count})", min_value=1, max_value=page_count, value=1, key=key)
+    return (page - 1) * page_size, page_size
+
+def reset_answers(prefix, results_key):
+    """
+    Oublie les réponses saisies et les résultats d'un quiz
+    :param prefix: Préfixe des clés des champs de réponse
+    :param results_key: Clé des résultats dans la session
+    """
+    for key in [key for key in st.session_state if str(key).startswith(prefix)]:
+        del st.session_state[key]
+    st.session_state.pop(results_key, None)
+
+def change_quiz_page(page_numbers, page_key, page):
+    """
+    Rappel des boutons de changement de page du quiz : garde les réponses soumises de la page
+    affichée, puis affiche la page demandée
+    :param page_numbers: Numéros des questions de la page affichée
+    :param page_key: Clé de la page choisie dans la session
+    :param page: Page à afficher
+    """
+    saved_answers = st.session_state.setdefault("answer_saved", {})
+    for i in page_numbers:
+        saved_answers[i] = st.session_state.get(f"answer_{i}", "")
+    st.session_state[page_key] = page
+
+def grade_submission(services, entries, batch=GRADING_BATCH_MODE):
+    """
+    Corrige une soumission de quiz, puis enregistre les réponses notées en une seule écriture
+    (historique, résumés et planning des révisions). Les réponses dont l'évaluation a échoué
+    ne sont pas enregistrées.
+    :param entries: Liste de couples (titre de la note, dictionnaire avec les clés 'question_id', 'question', 'user_answer' et 'correct_answer')
+    :param batch: Si True, regroupe les réponses dans une seule requête à l'API
+    :return: Liste de couples (réponse, évaluation), dans l'ordre de la soumission
+    """
+    items = [item for _, item in entries]
+    with st.spinner("Évaluation des réponses en cours..."):
+        evaluations = services.evaluate_answers(items, batch=batch)
+    results_by_note = {}
+    for (note_title, item), evaluation in zip(entries, evaluations):
+        if "error" not in evaluation:
+            results_by_note.setdefault(note_title, []).append(dict(item, score=evaluation["score"]))
+    save_quiz_session(results_by_note)
+    return list(zip(items, evaluations))
+
+def show_results(results):
+    """
+    Affiche le résultat de chaque réponse et le score moyen d'une soumission
+    :param results: Liste de couples (réponse, évaluation), voir grade_submission
+    """
+    scores = [evaluation["score"] for _, evaluation in results if "error" not in evaluation]
+    for item, evaluation in results:
+        with st.expander(f"Résultat : {item['question']}"):
+            st.write(f"**Votre réponse:** {item['user_answer']}")
+            st.write(f"**Réponse correcte:** {item['correct_answer']}")
+            if "error" in evaluation:
+                st.error(f"Erreur lors de l'évaluation : {evaluation['error']}")
+            else:
+                st.write(f"**Score:** {evaluation['score']}/5")
+                if evaluation.get("source") == "local":
+                    st.caption("Noté localement, sans appel à l'API")
+
+    if scores:
+        st.success(f"Score total : {sum(scores) / len(scores):.1f}/5")
+    local_count = sum(evaluation.get("source") == "local" for _, evaluation in results)
+    if local_count:
+        st.caption(f"⚡ {local_count} réponse(s) notée(s) localement : {local_count} appel(s) à l'API évité(s).")
+    if len(scores) < len(results):
+        st.warning(f"{len(results) - len(scores)} réponse(s) n'ont pas pu être évaluées et n'ont pas été enregistrées.")
+
+def session_user():
+    """
+    Identifiant de l'utilisateur de la session (mode multi-utilisateur), lu dans l'en-tête posé
+    par le proxy d'authentification. Sans en-tête configuré, l'application refuse de démarrer :
+    un identifiant saisi donnerait accès aux notes, à la clé API et à la page Admin de n'importe
+    quel utilisateur.
+    :return: Identifiant normalisé, ou None s'il est absent ou invalide
+    """
+    if not WORKSPACE_USER_HEADER:
+        st.error(
+            "Le mode multi-utilisateur nécessite un proxy d'authentification : indiquez l'en-tête "
+            "qui porte l'identifiant de l'utilisateur avec NOTEMASTER_USER_HEADER."
+        )
+        return None
+    user = st.context.headers.get(WORKSPACE_USER_HEADER)
+    if not user:
+        st.error("Utilisateur non identifié : accédez à l'application par le proxy d'authentification.")
+        return None
+    try:
+        return workspace.normalize_user(user)
+    except ValueError:
+        st.error("Identifiant invalide : lettres minuscules, chiffres, « . », « _ » et « - » uniquement.")
+        return None
+
+run_timings = init_app()
 
 # Application principale
 
 # Sidebar 
 st.sidebar.title("📝 **NoteMaster**")
+
+# Espace de travail de l'utilisateur, activé au début de chaque exécution du script
+current_user = None
+if MULTI_USER:
+    current_user = session_user()
+    if current_user is None:
+        st.stop()
+    workspace.set_current(current_user).ensure_dirs()
+    st.sidebar.caption(f"Connecté en tant que **{current_user}**")
+
+pages = ["Dashboard", "Prise de Notes", "Mode Quiz", "Révisions", "Performances", "API", "Admin", "Docs"]
+if MULTI_USER and current_user not in ADMIN_USERS:
+    pages.remove("Admin")
 st.sidebar.markdown("<h3>Menu</h3>", unsafe_allow_html=True)
 menu = st.sidebar.radio(
     "📂 <span style='color: #0066CC;'>Choisissez une option :</span>", 
-    ["Dashboard", "Prise de Notes", "Mode Quiz", "Performances", "API", "Docs"], 
+    pages, 
     format_func=lambda x: f"🔹 {x}", 
     index=0,
     label_visibility="hidden", 
@@ -51,28 +227,48 @@ if menu == "Dashboard":
 
 elif menu == "Prise de Notes":
     st.header("Prise de Notes")
-    
-    if "notes" not in st.session_state:
-        st.session_state.notes = load_notes()
-    
+
     if "editing_note" not in st.session_state:
         st.session_state.editing_note = None
 
-    # Affichage des notes existantes
+    # Recherche dans les notes et les questions générées
+    search_query = st.text_input("🔍 Rechercher dans les notes et les questions", key="search_query")
+    if search_query:
+        results = search(search_query)
+        if not results:
+            st.info("Aucun résultat.")
+        for i, result in enumerate(results):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                icon = "📝" if result["kind"] == "note" else "❓"
+                st.markdown(f"{icon} **{result['title']}**  \n{result['snippet']}")
+            with col2:
+                if st.button("Ouvrir", key=f"search_open_{i}"):
+                    st.session_state.editing_note = {
+                        "title": result["title"],
+                        "content": get_note_content(result["title"]) or ""
+                    }
+        st.markdown("---")
+
+    # Affichage des notes existantes, page par page
     st.write("### Vos notes :")
-    if st.session_state.notes:
-        for note in st.session_state.notes:
+    notes_count = count_notes()
+    if notes_count:
+        offset, limit = paginate(notes_count, NOTES_PAGE_SIZE, key="notes_page")
+        for title in list_note_titles(offset, limit):
             col1, col2, col3 = st.columns([3, 1, 1])
             with col1:
-                st.write(f"📝 {note['title']}")
+                st.write(f"📝 {title}")
             with col2:
-                if st.button("Voir/Modifier", key=f"edit_{note['title']}"):
-                    st.session_state.editing_note = note
+                if st.button("Voir/Modifier", key=f"edit_{title}"):
+                    st.session_state.editing_note = {
+                        "title": title,
+                        "content": get_note_content(title) or ""
+                    }
             with col3:
-                if st.button("Supprimer", key=f"delete_{note['title']}"):
-                    delete_note(note['title'])
-                    st.session_state.notes = load_notes()
-                    if st.session_state.editing_note and st.session_state.editing_note['title'] == note['title']:
+                if st.button("Supprimer", key=f"delete_{title}"):
+                    delete_note(title)
+                    if st.session_state.editing_note and st.session_state.editing_note['title'] == title:
                         st.session_state.editing_note = None
                     st.rerun()
     else:
@@ -93,7 +289,6 @@ elif menu == "Prise de Notes":
             if st.button("Sauvegarder les modifications"):
                 if update_note(st.session_state.editing_note['title'], edited_content):
                     st.success("Note mise à jour avec succès!")
-                    st.session_state.notes = load_notes()
                     st.session_state.editing_note = None
                     st.rerun()
                 else:
@@ -111,7 +306,6 @@ elif menu == "Prise de Notes":
     if st.button("Sauvegarder"):
         if note_title and note_content:
             save_note(note_title, note_content)
-            st.session_state.notes = load_notes()
             st.success(f"Note '{note_title}' sauvegardée avec succès !")
             st.rerun()
         else:
@@ -121,109 +315,160 @@ elif menu == "Prise de Notes":
 
 elif menu == "Mode Quiz":
     st.header("Mode Quiz")
+    services = model_services()
+
+    # Génération groupée en tâche de fond : l'état est relu périodiquement sans relancer toute la page
+    def bulk_generation_panel():
+        # Une réexécution du fragment seul ne passe pas par le début du script
+        workspace.set_current(current_user)
+        job_status = services.get_job_status()
+        if job_status:
+            notes_status = list(job_status["notes"].values())
+            processed = sum(1 for entry in notes_status if entry["status"] != "pending")
+            failed = sum(1 for entry in notes_status if entry["status"] == "failed")
+            st.progress(
+                processed / len(notes_status) if notes_status else 1.0,
+                text=f"Tâche {job_status['job_id']} ({job_status['status']}) : {processed}/{len(notes_status)} notes traitées, {failed} échec(s)"
+            )
+        if not services.is_running():
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("🚀 Générer les questions des notes obsolètes"):
+                    services.start_bulk_generation()
+                    st.rerun()
+            with col2:
+                if st.button("🔁 Tout régénérer"):
+                    services.start_bulk_generation(force=True)
+                    st.rerun()
+
+    with st.expander("⚙️ Génération groupée (toutes les notes)"):
+        st.fragment(bulk_generation_panel, run_every=2 if services.is_running() else None)()
     
     # Charger les notes disponibles
-    notes = load_notes()
-    note_titles = [note["title"] for note in notes]
+    note_titles = list_note_titles()
     selected_note = st.selectbox("Choisissez une note", note_titles)
 
     if selected_note:
-        note_content = next(note["content"] for note in notes if note["title"] == selected_note)
-        json_file_path = os.path.join(QUESTIONS_DIR, f"{selected_note}.json")
-        
         # Initialisation des questions
         if "questions" not in st.session_state or st.session_state.get("current_note") != selected_note:
-            if os.path.exists(json_file_path):
-                with open(json_file_path, "r") as file:
-                    st.session_state.questions = json.load(file)
-            else:
-                st.session_state.questions = []
+            # Banque de questions de la note ; elle est signalée comme ancienne si elle n'a pas
+            # été générée à partir du contenu actuel de la note (même critère que la génération
+            # groupée, voir utils.jobs.is_stale)
+            st.session_state.questions = load_note_questions(selected_note) or []
+            st.session_state.questions_outdated = bool(st.session_state.questions) and services.is_stale(
+                selected_note, get_note_content(selected_note) or ""
+            )
             st.session_state.current_note = selected_note
-            # Initialiser un dictionnaire pour stocker les réponses
-            st.session_state.user_answers = {}
+            reset_answers("answer_", "quiz_results")
+
+        if st.session_state.get("questions_outdated"):
+            st.caption("Ces questions ne correspondent peut-être plus au contenu actuel de la note.")
 
         # Générer de nouvelles questions
+        force_regenerate = st.checkbox("Forcer la régénération (ignorer le cache)", key="force_regenerate")
         if st.button("Générer des questions"):
+            bank_size = len(load_note_questions(selected_note) or [])
+            new_questions = []
             try:
-                with st.spinner("Génération des questions en cours..."):
-                    new_questions = generate_questions(selected_note, note_content)
+                # Les questions s'affichent au fur et à mesure de leur génération
+                with st.status("Génération des questions en cours...", expanded=True) as status:
+                    note_content = get_note_content(selected_note) or ""
+                    for question in services.stream_questions(selected_note, note_content, force=force_regenerate):
+                        new_questions.append(question)
+                        st.write(f"**Question {len(new_questions)}:** {question['text']}")
+                    status.update(label=f"{len(new_questions)} questions générées", state="complete", expanded=False)
                 
                 if new_questions:
-                    with open(json_file_path, "w") as file:
-                        json.dump(new_questions, file, indent=4, ensure_ascii=False)
-                    
-                    st.session_state.questions = new_questions
-                    st.session_state.user_answers = {}  # Réinitialiser les réponses
                     st.success("Questions générées et sauvegardées avec succès !")
                 else:
                     st.error("L'API n'a retourné aucune question.")
             except Exception as e:
                 st.error(f"Une erreur s'est produite : {e}")
+                if new_questions:
+                    st.warning(f"Les {len(new_questions)} questions reçues avant l'erreur ont été sauvegardées.")
+
+            if new_questions:
+                # Les questions générées sont fusionnées dans la banque de la note, sans doublons
+                st.session_state.questions = load_note_questions(selected_note) or new_questions
+                st.session_state.questions_outdated = False
+                added = len(st.session_state.questions) - bank_size
+                st.info(f"{added} nouvelle(s) question(s) ajoutée(s) à la banque, {len(new_questions) - added} doublon(s) écarté(s).")
+                reset_answers("answer_", "quiz_results")
 
         # Afficher les questions
         if st.session_state.questions:
             st.write("### Questions :")
-            
-            # Afficher toutes les questions avec des champs de réponse
-            for i, question in enumerate(st.session_state.questions, 1):
-                st.write(f"**Question {i}:** {question['text']}")
-                # Stocker la réponse dans session_state
-                answer_key = f"answer_{i}"
-                user_answer = st.text_area(
-                    "Votre réponse",
-                    key=answer_key,
-                    height=100
+
+            # Les réponses restent dans le navigateur jusqu'à la soumission : la saisie ne
+            # réexécute pas le script. Seule la page choisie est affichée ; les boutons de
+            # changement de page soumettent le formulaire, et les réponses des autres pages
+            # sont gardées dans la session ("answer_saved", oublié par reset_answers).
+            questions = st.session_state.questions
+            saved_answers = st.session_state.setdefault("answer_saved", {})
+            page_key = f"quiz_page_{selected_note}"
+            page_count = max(1, (len(questions) - 1) // QUIZ_PAGE_SIZE + 1)
+            page = min(st.session_state.get(page_key, 1), page_count)
+            page_numbers = range((page - 1) * QUIZ_PAGE_SIZE + 1, min(len(questions), page * QUIZ_PAGE_SIZE) + 1)
+            with st.form("quiz_form"):
+                for i in page_numbers:
+                    if f"answer_{i}" not in st.session_state:
+                        st.session_state[f"answer_{i}"] = saved_answers.get(i, "")
+                    st.write(f"**Question {i}:** {questions[i - 1]['text']}")
+                    st.text_area("Votre réponse", key=f"answer_{i}", height=100)
+                    st.markdown("---")
+
+                if page_count > 1:
+                    col1, col2, col3 = st.columns(3)
+                    col1.form_submit_button(
+                        "◀ Page précédente", disabled=page == 1,
+                        on_click=change_quiz_page, args=(page_numbers, page_key, page - 1),
+                    )
+                    col2.caption(f"Page {page} sur {page_count}")
+                    col3.form_submit_button(
+                        "Page suivante ▶", disabled=page == page_count,
+                        on_click=change_quiz_page, args=(page_numbers, page_key, page + 1),
+                    )
+
+                # Correction groupée : une seule requête pour tout le quiz
+                batch_grading = st.checkbox(
+                    "Correction groupée (une seule requête à l'API)",
+                    value=GRADING_BATCH_MODE,
+                    key="batch_grading"
                 )
-                st.session_state.user_answers[answer_key] = user_answer
-                st.markdown("---")
+                submitted = st.form_submit_button("📝 Vérifier toutes les réponses")
+
+            if submitted:
+                for i in page_numbers:
+                    saved_answers[i] = st.session_state.get(f"answer_{i}", "")
+                # Toutes les questions sont corrigées : les réponses vides sont notées 0
+                # localement (voir utils.pregrader), sans appel à l'API
+                entries = [
+                    (selected_note, {
+                        "question_id": question.get('id'),
+                        "question": question['text'],
+                        "user_answer": saved_answers.get(i, ""),
+                        "correct_answer": question['reponse'],
+                    })
+                    for i, question in enumerate(questions, 1)
+                ]
+                with metrics_tags(note=selected_note):
+                    st.session_state.quiz_results = grade_submission(services, entries, batch=batch_grading)
+
+            if st.session_state.get("quiz_results"):
+                show_results(st.session_state.quiz_results)
 
-            # Bouton unique pour vérifier toutes les réponses
-            if st.button("📝 Vérifier toutes les réponses"):
-                total_score = 0
-                with st.spinner("Évaluation des réponses en cours..."):
-                    for i, question in enumerate(st.session_state.questions, 1):
-                        answer_key = f"answer_{i}"
-                        user_answer = st.session_state.user_answers.get(answer_key, "")
-                        
-                        # Évaluer la réponse
-                        evaluation = evaluate_answer(
-                            question['text'],
-                            user_answer,
-                            question['reponse']
-                        )
-                        
-                        # Sauvegarder le résultat
-                        save_quiz_result(
-                            selected_note,
-                            question['text'],
-                            user_answer,
-                            question['reponse'],
-                            evaluation['score']
-                        )
-                        
-                        total_score += evaluation['score']
-                        
-                        # Afficher le résultat pour cette question
-                        with st.expander(f"Résultat Question {i}"):
-                            st.write(f"**Votre réponse:** {user_answer}")
-                            st.write(f"**Réponse correcte:** {question['reponse']}")
-                            st.write(f"**Score:** {evaluation['score']}/5")
-                
-                # Afficher le score total
-                avg_score = total_score / len(st.session_state.questions)
-                st.success(f"Score total : {avg_score:.1f}/5")
-                
                 # Option pour recommencer
                 if st.button("🔄 Recommencer le quiz"):
-                    st.session_state.user_answers = {}
+                    reset_answers("answer_", "quiz_results")
                     st.rerun()
 
             # Bouton pour supprimer les questions
             if st.button("🗑️ Supprimer toutes les questions"):
                 try:
-                    os.remove(json_file_path)
+                    delete_note_questions(selected_note)
+                    invalidate_note_questions(selected_note)
                     st.session_state.questions = []
-                    st.session_state.user_answers = {}
+                    reset_answers("answer_", "quiz_results")
                     st.success("Les questions ont été supprimées avec succès !")
                     st.rerun()
                 except Exception as e:
@@ -233,68 +478,134 @@ elif menu == "Mode Quiz":
             st.info("Aucune question disponible. Cliquez sur 'Générer des questions' pour commencer.")
 
 
+elif menu == "Révisions":
+    services = model_services()
+    st.header("Révisions du jour")
+    st.write("Les questions déjà travaillées reviennent selon vos résultats : une question bien réussie est revue de plus en plus tard, une question ratée revient dès le lendemain.")
+
+    # La session est figée à son ouverture : les questions corrigées ne disparaissent pas de l'écran
+    if "review_questions" not in st.session_state:
+        existing_titles = set(list_note_titles())
+        st.session_state.review_questions = get_due_questions(note_titles=existing_titles)
+
+    review_questions = st.session_state.review_questions
+    due_count = count_due()
+    if not review_questions:
+        st.success("Aucune question à réviser pour le moment. Revenez demain !")
+    else:
+        st.caption(f"{len(review_questions)} question(s) dans cette session, {due_count} à réviser au total.")
+        with st.form("review_form"):
+            for i, state in enumerate(review_questions, 1):
+                st.write(f"**Question {i}** ({state['note_title']}) : {state['question']}")
+                st.text_area("Votre réponse", key=f"review_answer_{i}", height=100)
+                st.markdown("---")
+            submitted = st.form_submit_button("📝 Vérifier mes révisions")
+
+        if submitted:
+            entries = [
+                (state["note_title"], {
+                    "question_id": state["key"],
+                    "question": state["question"],
+                    "user_answer": st.session_state.get(f"review_answer_{i}", ""),
+                    "correct_answer": state["reponse"],
+                })
+                for i, state in enumerate(review_questions, 1)
+            ]
+            st.session_state.review_results = grade_submission(services, entries)
+
+        if st.session_state.get("review_results"):
+            show_results(st.session_state.review_results)
+
+    if st.button("🔄 Nouvelle session"):
+        del st.session_state.review_questions
+        reset_answers("review_answer_", "review_results")
+        st.rerun()
+
+
 elif menu == "Performances":
     st.header("📊 Performances d'apprentissage")
     
-    stats = get_all_stats()
-    if not stats:
+    summary = get_stats_summary()
+    if not summary:
         st.info("Aucune statistique disponible pour le moment. Commencez à répondre à des quiz pour voir vos performances !")
     else:
         # Vue d'ensemble globale
         st.subheader("Vue d'ensemble")
         
-        # Calculer les statistiques globales
-        all_scores = []
-        notes_avg_scores = {}
-        for note_title, note_stats in stats.items():
-            if note_stats["attempts"]:
-                scores = [attempt["score"] for attempt in note_stats["attempts"]]
-                notes_avg_scores[note_title] = sum(scores) / len(scores)
-                all_scores.extend(scores)
+        # Calculer les statistiques globales à partir des agrégats par note
+        total_count = sum(note_summary["count"] for note_summary in summary.values())
+        total_sum = sum(note_summary["sum"] for note_summary in summary.values())
+        notes_avg_scores = {
+            note_title: note_summary["sum"] / note_summary["count"]
+            for note_title, note_summary in summary.items()
+        }
         
         # Afficher le score moyen global
-        if all_scores:
-            global_avg = sum(all_scores) / len(all_scores)
+        if total_count:
+            global_avg = total_sum / total_count
             st.metric("Score moyen global", f"{global_avg:.1f}/5")
             
             # Graphique des scores moyens par note
             st.bar_chart(notes_avg_scores)
+
+            # Progression globale : score moyen par jour, toutes notes confondues
+            days, daily_scores = get_daily_scores()
+            if len(days) > 1:
+                st.line_chart({"Jour": days, "Score moyen": daily_scores}, x="Jour", y="Score moyen")
         
-        # Détails par note
+        # Détails par note, page par page
         st.subheader("Détails par note")
-        for note_title, note_stats in stats.items():
+        detail_titles = list(summary)
+        offset, limit = paginate(len(detail_titles), PERFORMANCE_NOTES_PAGE_SIZE, key="performance_notes_page")
+        for note_title in detail_titles[offset:offset + limit]:
+            note_summary = summary[note_title]
             with st.expander(f"📝 {note_title}"):
-                if note_stats["attempts"]:
+                if note_summary["count"]:
                     col1, col2, col3 = st.columns(3)
                     
                     # Statistiques de base
-                    scores = [attempt["score"] for attempt in note_stats["attempts"]]
-                    avg_score = sum(scores) / len(scores)
                     with col1:
-                        st.metric("Score moyen", f"{avg_score:.1f}/5")
+                        st.metric("Score moyen", f"{notes_avg_scores[note_title]:.1f}/5")
                     with col2:
-                        st.metric("Meilleur score", f"{max(scores)}/5")
+                        st.metric("Meilleur score", f"{note_summary['max']}/5")
                     with col3:
-                        st.metric("Nombre de questions", len(scores))
+                        st.metric("Nombre de questions", note_summary["count"])
                     
-                    # Graphique d'évolution des scores
+                    # Graphique d'évolution des derniers scores
+                    scores = note_summary["last_scores"]
+                    first_question = note_summary["count"] - len(scores) + 1
                     scores_df = {
-                        "Question": range(1, len(scores) + 1),
+                        "Question": range(first_question, note_summary["count"] + 1),
                         "Score": scores
                     }
                     st.line_chart(scores_df, x="Question", y="Score")
+
+                    # Score moyen par jour
+                    days = sorted(note_summary["days"])
+                    if len(days) > 1:
+                        st.bar_chart({
+                            "Jour": days,
+                            "Score moyen": [
+                                note_summary["days"][day]["sum"] / note_summary["days"][day]["count"]
+                                for day in days
+                            ]
+                        }, x="Jour", y="Score moyen")
                     
-                    # Historique détaillé
-                    st.write("### Historique détaillé")
-                    for attempt in reversed(note_stats["attempts"]):
-                        st.markdown(f"""
-                        **📅 {attempt['timestamp'][:16].replace('T', ' à ')}**
-                        - **Question:** {attempt['question']}
-                        - **Votre réponse:** {attempt['user_answer']}
-                        - **Réponse correcte:** {attempt['correct_answer']}
-                        - **Score:** {attempt['score']}/5
-                        ---
-                        """)
+                    # Historique détaillé, chargé uniquement à la demande et par page
+                    if st.toggle("Afficher l'historique détaillé", key=f"history_{note_title}"):
+                        history_offset, history_limit = paginate(
+                            note_summary["count"], HISTORY_PAGE_SIZE, key=f"history_page_{note_title}"
+                        )
+                        attempts = get_note_attempts(note_title, history_offset, history_limit)
+                        for attempt in attempts:
+                            st.markdown(f"""
+                            **📅 {attempt['timestamp'][:16].replace('T', ' à ')}**
+                            - **Question:** {attempt['question']}
+                            - **Votre réponse:** {attempt['user_answer']}
+                            - **Réponse correcte:** {attempt['correct_answer']}
+                            - **Score:** {attempt['score']}/5
+                            ---
+                            """)
                     
                     # Bouton pour supprimer l'historique de cette note
                     if st.button("🗑️ Supprimer l'historique", key=f"delete_{note_title}"):
@@ -317,11 +628,9 @@ elif menu == "Performances":
 elif menu == "API":
     st.header("Configuration de l'API")
 
-    # Charger la clé API existante (si elle existe)
+    # Charger la clé API existante (si elle existe) ; la clé de l'instance n'est pas montrée aux utilisateurs
     if "api_key" not in st.session_state:
-        from dotenv import load_dotenv
-        load_dotenv()
-        st.session_state.api_key = os.getenv("DEEPSEEK_KEY", "")
+        st.session_state.api_key = workspace.current().api_key(inherit=not MULTI_USER)
 
     # Formulaire pour entrer ou mettre à jour la clé API
     st.write("Entrez votre clé API de OpenRouter pour activer les fonctionnalités de génération.")
@@ -339,21 +648,109 @@ elif menu == "API":
     with col1:
         if st.button("Enregistrer la clé API"):
             if len(api_key_input) == 73:
-                with open(".env", "w") as file:
-                    file.write(f'DEEPSEEK_KEY="{api_key_input}"')
+                workspace.current().save_api_key(api_key_input)
                 st.session_state.api_key = api_key_input
+                model_services().reset_client()
                 st.success("Clé API enregistrée avec succès !")
             else:
                 st.error("Clé API invalide. Elle doit comporter exactement 73 caractères.")
 
     with col2:
         if st.button("Réinitialiser la clé API"):
-            if os.path.exists(".env"):
-                os.remove(".env")
+            workspace.current().delete_api_key()
             st.session_state.api_key = ""
+            model_services().reset_client()
             st.warning("Clé API réinitialisée. Veuillez en entrer une nouvelle.")
 
 
+elif menu == "Admin":
+    st.header("🛠️ Administration")
+    services = model_services()
+    st.write("Mesures des appels au modèle depuis le démarrage de l'application.")
+
+    by_operation = metrics.summary()
+    calls = sum(row["calls"] for row in by_operation)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Appels au modèle", calls)
+    col2.metric("Tokens", sum(row["prompt_tokens"] + row["completion_tokens"] for row in by_operation))
+    col3.metric("Coût estimé", f"${sum(row['cost'] for row in by_operation):.4f}")
+    col4.metric("Erreurs", sum(row["errors"] for row in by_operation))
+
+    # Le disjoncteur est propre à chaque espace de travail : celui de l'administrateur ici,
+    # ceux des autres utilisateurs dans le tableau de consommation
+    if services.circuit_breaker().opened_at is not None:
+        st.error("Disjoncteur ouvert : les appels au modèle sont suspendus temporairement.")
+
+    # Consommation du jour de chaque utilisateur, à comparer au quota quotidien
+    if MULTI_USER:
+        from utils import quotas
+        from utils.cache import generation_cache, grading_cache
+
+        usage = []
+        for user in workspace.list_users():
+            with workspace.activate(user):
+                cache_stats = [generation_cache().stats(), grading_cache().stats()]
+                lookups = sum(stats["hits"] + stats["misses"] for stats in cache_stats)
+                usage.append({
+                    "user": user,
+                    "tokens": quotas.tokens_used_today(),
+                    "cache_hit_rate": 100 * sum(stats["hits"] for stats in cache_stats) / lookups if lookups else None,
+                    "suspended": services.circuit_breaker().opened_at is not None,
+                })
+        if USER_DAILY_TOKEN_QUOTA:
+            tokens_column = st.column_config.ProgressColumn("Tokens", format="%d", min_value=0, max_value=USER_DAILY_TOKEN_QUOTA)
+        else:
+            tokens_column = st.column_config.NumberColumn("Tokens")
+        st.subheader("Consommation du jour")
+        st.dataframe(usage, column_config={
+            "user": "Utilisateur",
+            "tokens": tokens_column,
+            "cache_hit_rate": st.column_config.NumberColumn("Taux de cache", format="%.0f%%"),
+            "suspended": "Appels suspendus",
+        }, use_container_width=True)
+
+    # Durées d'exécution du script : démarrage à froid (chargement des modules compris) et réexécutions
+    runs = sorted(run_timings["runs"])
+    col1, col2, col3 = st.columns(3)
+    if run_timings["cold_start"] is not None:
+        col1.metric("Démarrage à froid", f"{run_timings['cold_start'] * 1000:.0f} ms")
+    if runs:
+        col2.metric("Réexécution (p50)", f"{runs[len(runs) // 2] * 1000:.0f} ms")
+        col3.metric("Réexécution (p95)", f"{runs[min(len(runs) - 1, int(len(runs) * 0.95))] * 1000:.0f} ms")
+
+    if not by_operation:
+        st.info("Aucun appel au modèle pour le moment.")
+    else:
+        group_by = st.radio(
+            "Regrouper par",
+            ["operation", "note", "user"] if MULTI_USER else ["operation", "note"],
+            horizontal=True,
+            format_func=lambda x: {"operation": "Opération", "note": "Note", "user": "Utilisateur"}[x],
+        )
+        st.dataframe(
+            [dict(row, cache_hit_rate=row["cache_hit_rate"] * 100) for row in metrics.summary(group_by=group_by)],
+            column_config={
+                "p50": st.column_config.NumberColumn("p50 (s)", format="%.2f"),
+                "p95": st.column_config.NumberColumn("p95 (s)", format="%.2f"),
+                "p99": st.column_config.NumberColumn("p99 (s)", format="%.2f"),
+                "ttft_p50": st.column_config.NumberColumn("1er token p50 (s)", format="%.2f"),
+                "cost": st.column_config.NumberColumn("Coût ($)", format="%.4f"),
+                "cache_hit_rate": st.column_config.NumberColumn("Taux de cache", format="%.0f%%"),
+            },
+            use_container_width=True,
+        )
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button("⬇️ Export JSONL", metrics.export_jsonl(), file_name="llm_metrics.jsonl", mime="application/jsonl")
+        with col2:
+            st.download_button("⬇️ Export Prometheus", metrics.prometheus_text(), file_name="llm_metrics.prom", mime="text/plain")
+        with col3:
+            if st.button("Réinitialiser les mesures"):
+                metrics.reset()
+                st.rerun()
+
+
 elif menu == "Docs":
     st.header("📖 Docs")
 
@@ -421,3 +818,11 @@ with col1:
     st.link_button("📄 Répo Github", url="https://github.com/mamour-dx/NoteMaster")
 with col2:
     st.link_button("📚 Vidéo YouTube", url="https://www.youtube.com/watch?v=1hFGjvgwC_8&t=60s")
+
+# Durée de cette exécution du script (la première du processus : démarrage à froid)
+run_duration = time.perf_counter() - _run_started
+if run_timings["cold_start"] is None:
+    run_timings["cold_start"] = run_duration
+    logging.info("Démarrage de l'application : %.0f ms", run_duration * 1000)
+else:
+    run_timings["runs"].append(run_duration)
@@ -0,0 +1,108 @@
+import os
+import json
+import random
+from datetime import datetime, timedelta
+
+# Générateurs de données synthétiques pour les mesures de performance : notes, historiques
+# de tentatives et quiz. Les données sont écrites directement au format des fichiers de
+# l'application (le moteur SQLite les importe à la création de la base) et ne dépendent que
+# de la graine : deux exécutions avec les mêmes paramètres produisent les mêmes fichiers.
+
+VOCABULARY = (
+    "processus mémoire fichier réseau serveur client requête réponse protocole adresse paquet "
+    "routage commande terminal droits utilisateur groupe système noyau pilote variable fonction "
+    "classe objet méthode tableau boucle condition exception session cookie formulaire base "
+    "données index table clé jointure transaction verrou cache disque partition montage service "
+    "journal signal thread pile tas pointeur compilation interpréteur module paquetage version "
+    "branche fusion dépôt sauvegarde chiffrement certificat authentification pare-feu port"
+).split()
+
+CONNECTORS = ["le", "la", "les", "un", "une", "des", "du", "de", "et", "ou", "pour", "avec", "dans", "sur", "par"]
+
+def make_sentence(rng, min_words=8, max_words=16):
+    words = [
+        rng.choice(CONNECTORS) if position % 3 == 1 else rng.choice(VOCABULARY)
+        for position in range(rng.randint(min_words, max_words))
+    ]
+    return " ".join(words).capitalize() + "."
+
+def make_text(rng, words):
+    """
+    Texte d'environ `words` mots, découpé en paragraphes
+    """
+    sentences, count = [], 0
+    while count < words:
+        sentence = make_sentence(rng)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    paragraphs = [" ".join(sentences[start:start + 5]) for start in range(0, len(sentences), 5)]
+    return "\n\n".join(paragraphs)
+
+def note_titles(count):
+    return [f"Note {index:05d}" for index in range(count)]
+
+def write_notes(notes_dir, count, words=200, seed=0):
+    """
+    Écrit `count` notes synthétiques dans le dossier des notes
+    :return: Titres des notes
+    """
+    rng = random.Random(seed)
+    os.makedirs(notes_dir, exist_ok=True)
+    titles = note_titles(count)
+    for title in titles:
+        with open(os.path.join(notes_dir, f"{title}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"# {title}\n\n{make_text(rng, words)}\n")
+    return titles
+
+def make_questions(rng, count):
+    return [
+        {"text": f"Expliquez : {make_sentence(rng, 5, 9)}", "reponse": make_sentence(rng, 10, 20)}
+        for _ in range(count)
+    ]
+
+def write_attempts(stats_dir, stats_suffix, note_count, attempt_count, questions_per_note=20, days=90, seed=0):
+    """
+    Écrit un historique de `attempt_count` tentatives réparties sur `note_count` notes et sur
+    les `days` derniers jours, dans les journaux de tentatives (une ligne JSON par tentative)
+    :param stats_suffix: Suffixe des journaux (voir utils.stats_manager.STATS_LOG_SUFFIX)
+    """
+    rng = random.Random(seed)
+    os.makedirs(stats_dir, exist_ok=True)
+    start = datetime.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(1, attempt_count)
+    questions = {title: make_questions(rng, questions_per_note) for title in note_titles(note_count)}
+    lines = {title: [] for title in questions}
+    for index in range(attempt_count):
+        title = rng.choice(list(questions))
+        question = rng.choice(questions[title])
+        lines[title].append(json.dumps({
+            "timestamp": (start + step * index).isoformat(),
+            "question": question["text"],
+            "user_answer": make_sentence(rng, 4, 12),
+            "correct_answer": question["reponse"],
+            "score": rng.randint(0, 5),
+        }, ensure_ascii=False, separators=(",", ":")))
+    for title, note_lines in lines.items():
+        if note_lines:
+            with open(os.path.join(stats_dir, f"{title}{stats_suffix}"), "w", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in note_lines))
+    return questions
+
+def make_quiz(rng, size, salt):
+    """
+    Quiz de `size` réponses : environ 10 % de réponses vides, 20 % de réponses recopiées
+    (notées localement) et 70 % de réponses à corriger par le modèle. Le sel rend chaque
+    quiz unique, pour que les réponses ne soient pas servies par le cache de correction.
+    """
+    items = []
+    for index in range(size):
+        question = make_questions(rng, 1)[0]
+        draw = rng.random()
+        if draw < 0.1:
+            user_answer = ""
+        elif draw < 0.3:
+            user_answer = question["reponse"]
+        else:
+            user_answer = f"{make_sentence(rng, 4, 12)} ({salt}-{index})"
+        items.append({"question": question["text"], "user_answer": user_answer, "correct_answer": question["reponse"]})
+    return items
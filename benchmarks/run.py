@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import itertools
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+import numpy as np
+
+# Mesures de performance reproductibles : stockage des notes, historique des tentatives,
+# agrégation de la page Performances et correction des quiz avec un modèle simulé.
+# Chaque mesure s'exécute sur des données synthétiques, dans un dossier temporaire (les
+# données de l'application ne sont jamais touchées), et peut être comparée à une référence.
+#
+#   python -m benchmarks.run                    # mesure et compare à benchmarks/baseline.json
+#   python -m benchmarks.run --quick            # données dix fois plus petites
+#   python -m benchmarks.run --save-baseline    # enregistre les résultats comme référence
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+
+DEFAULT_SIZES = {
+    "notes": 10000,
+    "note_words": 200,
+    "attempts": 100000,
+    "stats_notes": 50,
+    "writes": 200,
+    "quizzes": 20,
+    "quiz_size": 10,
+    "startups": 5,
+    "reruns": 20,
+}
+
+GROUPS = ("notes", "stats", "grading", "startup")
+
+# Tailles réduites par --quick (la forme des données, elle, ne change pas)
+QUICK_SCALED_SIZES = ("notes", "attempts", "writes", "quizzes", "reruns")
+
+# Indicateurs comparés à la référence : True si une valeur plus élevée est meilleure
+COMPARED_METRICS = {"p50": False, "p99": False, "throughput": True, "peak_memory": False}
+
+def measure(operation, repeat, items=1, trace_memory=True):
+    """
+    Mesure une opération
+    :param repeat: Nombre d'exécutions chronométrées
+    :param items: Nombre d'éléments traités par exécution (pour le débit)
+    :param trace_memory: Si True, une exécution supplémentaire, non chronométrée, mesure le pic
+                         de mémoire allouée (tracemalloc ralentit fortement le code mesuré)
+    :return: Dictionnaire avec les clés 'runs', 'items', 'p50', 'p99', 'mean' (secondes),
+             'throughput' (éléments par seconde) et 'peak_memory' (octets, ou None)
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        durations.append(time.perf_counter() - start)
+    peak_memory = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            operation()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return summarize(durations, items, peak_memory)
+
+def summarize(durations, items=1, peak_memory=None):
+    """
+    Résume des durées mesurées (voir measure)
+    """
+    durations = np.array(durations)
+    p50, p99 = np.percentile(durations, [50, 99])
+    return {
+        "runs": len(durations),
+        "items": items,
+        "p50": float(p50),
+        "p99": float(p99),
+        "mean": float(durations.mean()),
+        "throughput": items * len(durations) / float(durations.sum()),
+        "peak_memory": peak_memory,
+    }
+
+def prepare_data(sizes, groups, seed):
+    """
+    Écrit les données synthétiques avant tout accès au stockage de l'application (le moteur
+    SQLite importe les fichiers à la création de la base)
+    """
+    from config import NOTES_DIR, STATS_DIR
+    from utils.stats_manager import STATS_LOG_SUFFIX
+    from benchmarks.generators import write_notes, write_attempts
+
+    if "notes" in groups:
+        write_notes(NOTES_DIR, sizes["notes"], sizes["note_words"], seed=seed)
+    if "stats" in groups:
+        write_attempts(STATS_DIR, STATS_LOG_SUFFIX, sizes["stats_notes"], sizes["attempts"], seed=seed)
+
+def bench_notes(sizes, args):
+    from utils.note_manager import load_notes
+
+    count = sizes["notes"]
+    return {
+        # Premier appel : index des notes à construire, aucun contenu en cache
+        "load_notes_cold": measure(load_notes, 1, count, trace_memory=False),
+        "load_notes": measure(load_notes, 5, count),
+    }
+
+def performances_view(summary):
+    """
+    Calculs de la page Performances à partir des résumés par note (voir app.py)
+    """
+    total_count = sum(note_summary["count"] for note_summary in summary.values())
+    total_sum = sum(note_summary["sum"] for note_summary in summary.values())
+    notes_avg_scores = {
+        note_title: note_summary["sum"] / note_summary["count"]
+        for note_title, note_summary in summary.items()
+    }
+    daily_averages = {
+        note_title: [
+            note_summary["days"][day]["sum"] / note_summary["days"][day]["count"]
+            for day in sorted(note_summary["days"])
+        ]
+        for note_title, note_summary in summary.items()
+    }
+    return total_sum / total_count if total_count else None, notes_avg_scores, daily_averages
+
+def bench_stats(sizes, args):
+    from utils import scheduler
+    from utils.stats_manager import (
+        save_quiz_result, get_all_stats, get_stats_summary, get_note_attempts, rebuild_summaries,
+        get_stats_archive, get_daily_scores,
+    )
+    from benchmarks.generators import note_titles
+
+    attempts = sizes["attempts"]
+    # Résumés et planning des révisions construits avant les mesures
+    get_stats_summary()
+    scheduler.load_schedule()
+
+    results = {
+        "get_all_stats": measure(get_all_stats, 3, attempts),
+        "rebuild_summaries": measure(rebuild_summaries, 3, attempts),
+        "stats_archive_full": measure(lambda: get_stats_archive(rebuild=True), 3, attempts),
+        "daily_scores": measure(get_daily_scores, 20, attempts),
+        "performances": measure(lambda: performances_view(get_stats_summary()), 20, sizes["stats_notes"]),
+        "get_note_attempts": measure(lambda: get_note_attempts(note_titles(1)[0], 0, 20), 50, 20),
+    }
+
+    counter = itertools.count()
+
+    def save_one():
+        index = next(counter)
+        save_quiz_result(note_titles(1)[0], f"Question de mesure {index % 50}", "réponse", "réponse attendue", index % 6)
+
+    results["save_quiz_result"] = measure(save_one, sizes["writes"])
+    return results
+
+def bench_grading(sizes, args):
+    from utils import llm_client
+    from utils.llm_backends import FakeBackend
+    from utils.question_generator import evaluate_answers
+    from benchmarks.generators import make_quiz
+
+    llm_client.set_backend(FakeBackend(latency=args.latency, latency_jitter=args.latency / 4, seed=args.seed))
+    rng = random.Random(args.seed)
+    salts = itertools.count()
+    quiz_size = sizes["quiz_size"]
+    return {
+        "grading": measure(
+            lambda: evaluate_answers(make_quiz(rng, quiz_size, next(salts)), batch=False), sizes["quizzes"], quiz_size
+        ),
+        "grading_batch": measure(
+            lambda: evaluate_answers(make_quiz(rng, quiz_size, next(salts)), batch=True), sizes["quizzes"], quiz_size
+        ),
+    }
+
+def bench_startup(sizes, args):
+    """
+    Démarrage de l'application : chaque démarrage à froid est mesuré dans un processus neuf
+    """
+    cold_starts, reruns = [], []
+    for _ in range(sizes["startups"]):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--reruns", str(sizes["reruns"])],
+            env=dict(os.environ, PYTHONPATH=REPO_ROOT), capture_output=True, text=True, check=True,
+        ).stdout
+        timings = json.loads(output.splitlines()[-1])
+        cold_starts.append(timings["cold_start"])
+        reruns.extend(timings["reruns"])
+    return {"app_cold_start": summarize(cold_starts), "app_rerun": summarize(reruns)}
+
+BENCHMARKS = {"notes": bench_notes, "stats": bench_stats, "grading": bench_grading, "startup": bench_startup}
+
+def compare(results, baseline, tolerance):
+    """
+    Compare les résultats à une référence
+    :param tolerance: Écart relatif toléré avant de signaler une régression (0.2 = 20 %)
+    :return: ({mesure: {indicateur: écart relatif}}, liste des régressions)
+    """
+    changes, regressions = {}, []
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        changes[name] = {}
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not result.get(metric) or not reference.get(metric):
+                continue
+            ratio = result[metric] / reference[metric]
+            changes[name][metric] = ratio - 1
+            if (ratio < 1 / (1 + tolerance)) if higher_is_better else (ratio > 1 + tolerance):
+                regressions.append(f"{name}.{metric} : {reference[metric]:.4g} -> {result[metric]:.4g}")
+    return changes, regressions
+
+def format_report(results, changes):
+    lines = [f"{'mesure':<20} {'p50 (ms)':>10} {'p99 (ms)':>10} {'débit (/s)':>12} {'mémoire (Mo)':>13}  écart / référence"]
+    for name, result in results.items():
+        peak = f"{result['peak_memory'] / 2**20:.1f}" if result["peak_memory"] is not None else "-"
+        change = " ".join(f"{metric} {value:+.0%}" for metric, value in changes.get(name, {}).items())
+        lines.append(
+            f"{name:<20} {result['p50'] * 1000:>10.2f} {result['p99'] * 1000:>10.2f} "
+            f"{result['throughput']:>12.1f} {peak:>13}  {change}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesures de performance sur des données synthétiques.")
+    parser.add_argument("--only", action="append", choices=GROUPS, help="groupe de mesures à exécuter (répétable)")
+    parser.add_argument("--storage", choices=("files", "sqlite"), default="files", help="moteur de stockage mesuré")
+    parser.add_argument("--quick", action="store_true", help="données dix fois plus petites")
+    parser.add_argument("--latency", type=float, default=0.05, help="latence du modèle simulé, en secondes")
+    parser.add_argument("--seed", type=int, default=0, help="graine des données synthétiques")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="fichier de référence")
+    parser.add_argument("--save-baseline", action="store_true", help="enregistre les résultats comme référence")
+    parser.add_argument("--output", help="fichier JSON où écrire les résultats")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="écart relatif toléré (défaut : 0.2)")
+    parser.add_argument("--check", action="store_true", help="code de retour 1 en cas de régression")
+    parser.add_argument("--keep-data", action="store_true", help="conserve le dossier temporaire des données")
+    args = parser.parse_args(argv)
+
+    groups = args.only or list(GROUPS)
+    sizes = dict(DEFAULT_SIZES)
+    if args.quick:
+        sizes.update({name: max(1, sizes[name] // 10) for name in QUICK_SCALED_SIZES})
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    # Les chemins de config.py sont relatifs au dossier courant : l'application travaille
+    # dans le dossier temporaire, et le moteur choisi doit être fixé avant d'importer config
+    work_dir = tempfile.mkdtemp(prefix="notemaster-bench-")
+    os.chdir(work_dir)
+    os.environ["NOTEMASTER_STORAGE"] = args.storage
+    os.environ["NOTEMASTER_LLM_BACKEND"] = "fake"
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    # Configuré avant les modules de l'application, qui journalisent chaque opération
+    logging.basicConfig(level=logging.WARNING)
+    prepare_data(sizes, groups, args.seed)
+
+    results = {}
+    for group in groups:
+        print(f"Mesures : {group}...", file=sys.stderr)
+        results.update(BENCHMARKS[group](sizes, args))
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "storage": args.storage,
+        "latency": args.latency,
+        "sizes": sizes,
+        "results": results,
+    }
+
+    changes, regressions = {}, []
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+        if (baseline.get("sizes"), baseline.get("storage"), baseline.get("latency")) != (sizes, args.storage, args.latency):
+            print("Référence mesurée avec d'autres paramètres : comparaison ignorée", file=sys.stderr)
+        else:
+            changes, regressions = compare(results, baseline, args.tolerance)
+
+    print(format_report(results, changes))
+    for regression in regressions:
+        print(f"Régression : {regression}")
+
+    if args.save_baseline:
+        output_path = baseline_path
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print(f"Résultats enregistrés dans {output_path}", file=sys.stderr)
+
+    if args.keep_data:
+        print(f"Données conservées dans {work_dir}", file=sys.stderr)
+    else:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if args.check and regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Mesure du démarrage de l'application, à exécuter dans un processus neuf (voir run.py) :
+# durée de la première exécution du script (chargement des modules compris), puis des
+# réexécutions de la même page, comme après un clic dans l'interface.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(REPO_ROOT, "app.py")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Durée de démarrage et de réexécution de l'application.")
+    parser.add_argument("--reruns", type=int, default=20, help="nombre de réexécutions mesurées")
+    args = parser.parse_args(argv)
+
+    # Streamlit lui-même est chargé avant la mesure : c'est déjà le cas quand le serveur démarre
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_FILE, default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    cold_start = time.perf_counter() - start
+    reruns = []
+    for _ in range(args.reruns):
+        start = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - start)
+    if app.exception:
+        print(f"Erreur de l'application : {app.exception[0].value}", file=sys.stderr)
+        return 1
+    print(json.dumps({"cold_start": cold_start, "reruns": reruns}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
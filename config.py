@@ -2,18 +2,170 @@ import os
 
 # Dossier ou les notes seront sauvegardées
 NOTES_DIR = "./notes/"
-if not os.path.exists(NOTES_DIR):
-    os.makedirs(NOTES_DIR)
 
 # Dossier ou les questions seront sauvegardées
 QUESTIONS_DIR = "./questions/"
-if not os.path.exists(QUESTIONS_DIR):
-    os.makedirs(QUESTIONS_DIR)
 
-# Chemin du fichier contenant les questions
-QUESTIONS_FILE = os.path.join(QUESTIONS_DIR, "questions.json")
+# Empreinte du contenu dont chaque banque de questions a été générée (stockage par fichiers),
+# dans le dossier des questions : une note dont le contenu a changé est à régénérer
+QUESTION_SOURCES_FILENAME = "_sources.json"
 
 # Ajouter cette ligne avec les autres constantes
 STATS_DIR = "./stats/"
-if not os.path.exists(STATS_DIR):
-    os.makedirs(STATS_DIR)
+
+# Nombre maximal d'appels simultanés à l'API lors de la correction d'un quiz
+GRADING_MAX_CONCURRENCY = 5
+
+# Correction groupée : plusieurs réponses évaluées dans une seule requête à l'API
+GRADING_BATCH_MODE = False
+
+# Budget approximatif (en tokens) d'une requête de correction groupée
+GRADING_BATCH_TOKEN_BUDGET = 3000
+
+# Pré-correction locale : les réponses vides et les réponses quasi identiques à la
+# réponse correcte sont notées sans appel à l'API
+PREGRADE_ENABLED = True
+
+# Seuils d'une réponse quasi identique : similarité cosinus TF-IDF et part des mots-clés
+# de la réponse correcte présents dans la réponse
+PREGRADE_VERBATIM_SIMILARITY = 0.9
+PREGRADE_VERBATIM_KEYWORD_RECALL = 0.9
+
+# Modèle utilisé pour la génération et l'évaluation des questions
+LLM_MODEL = os.getenv("NOTEMASTER_LLM_MODEL", "deepseek/deepseek-chat")
+
+# Version du prompt de génération (à incrémenter quand le prompt change pour invalider le cache)
+GENERATION_PROMPT_VERSION = "1"
+
+# Dossier des caches (questions générées, évaluations)
+CACHE_DIR = "./cache/"
+
+# Nombre maximal de jeux de questions conservés dans le cache de génération
+GENERATION_CACHE_MAX_ENTRIES = 200
+
+# Nombre maximal d'évaluations conservées dans le cache de correction
+GRADING_CACHE_MAX_ENTRIES = 10000
+
+# Durée de vie (en secondes) d'une évaluation en cache : 30 jours
+GRADING_CACHE_TTL = 30 * 24 * 3600
+
+# Moteur de stockage : "files" (fichiers .txt / .json / .jsonl) ou "sqlite"
+STORAGE_BACKEND = os.getenv("NOTEMASTER_STORAGE", "files")
+
+# Base de données utilisée par le moteur de stockage SQLite
+DB_PATH = "./notemaster.sqlite3"
+
+# Nombre de derniers scores conservés par note dans le résumé des performances
+STATS_SUMMARY_LAST_N = 50
+
+# Nombre de tentatives affichées par page dans l'historique détaillé
+HISTORY_PAGE_SIZE = 20
+
+# Nombre de notes, de questions de quiz et de notes détaillées (page Performances) affichées par page
+NOTES_PAGE_SIZE = 25
+QUIZ_PAGE_SIZE = 10
+PERFORMANCE_NOTES_PAGE_SIZE = 10
+
+# Recherche plein texte : paramètres du classement BM25 et nombre maximal de résultats
+SEARCH_BM25_K1 = 1.5
+SEARCH_BM25_B = 0.75
+SEARCH_RESULTS_LIMIT = 20
+
+# Nombre maximal de contenus de notes gardés en mémoire
+NOTE_CONTENT_CACHE_SIZE = 64
+
+# Budget approximatif (en tokens) d'une section de note envoyée pour la génération de questions
+GENERATION_CHUNK_TOKEN_BUDGET = 3000
+
+# Nombre maximal de sections de note traitées simultanément lors de la génération
+GENERATION_MAX_CONCURRENCY = 4
+
+# Dossier de suivi des tâches de fond (génération groupée des questions)
+JOBS_DIR = "./jobs/"
+
+# Banque de questions : deux questions sont des quasi-doublons si la similarité de Jaccard de
+# leurs fragments (suites de 1 à QUESTION_SHINGLE_SIZE mots) atteint le seuil. Les candidats sont trouvés par MinHash et
+# LSH (signature découpée en bandes ; une bande identique suffit à comparer deux questions).
+QUESTION_SHINGLE_SIZE = 2
+QUESTION_MINHASH_PERMUTATIONS = 64
+QUESTION_LSH_BANDS = 16
+QUESTION_DUPLICATE_THRESHOLD = 0.6
+
+# Génération groupée : nombre de notes traitées simultanément et requêtes par minute autorisées
+BULK_GENERATION_WORKERS = 3
+BULK_GENERATION_RATE_PER_MINUTE = 20
+
+# Client LLM : point d'accès, délais, nouvelles tentatives et disjoncteur
+LLM_BASE_URL = "https://openrouter.ai/api/v1"
+LLM_TIMEOUT = 60
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 30.0
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5
+LLM_CIRCUIT_COOLDOWN = 30
+LLM_POOL_MAX_CONNECTIONS = 20
+LLM_POOL_KEEPALIVE_CONNECTIONS = 10
+LLM_POOL_KEEPALIVE_EXPIRY = 60
+
+# Moteur du modèle : "openrouter", "local" (serveur compatible OpenAI) ou "fake" (simulateur hors ligne)
+LLM_BACKEND = os.getenv("NOTEMASTER_LLM_BACKEND", "openrouter")
+
+# Adresse du serveur local compatible OpenAI (llama.cpp, vLLM, Ollama...)
+LLM_LOCAL_BASE_URL = os.getenv("NOTEMASTER_LLM_BASE_URL", "http://localhost:8000/v1")
+
+# Simulateur hors ligne : latence (en secondes), variation de latence et taux d'erreurs injectées
+FAKE_LLM_LATENCY = float(os.getenv("NOTEMASTER_FAKE_LATENCY", "0.2"))
+FAKE_LLM_LATENCY_JITTER = float(os.getenv("NOTEMASTER_FAKE_LATENCY_JITTER", "0.05"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("NOTEMASTER_FAKE_ERROR_RATE", "0"))
+FAKE_LLM_SEED = int(os.getenv("NOTEMASTER_FAKE_SEED", "0"))
+
+# Mesures des appels au modèle : nombre d'appels récents conservés pour les percentiles
+METRICS_MAX_RECORDS = 5000
+
+# Tarifs du modèle (en dollars par million de tokens), pour l'estimation des coûts
+LLM_PRICE_INPUT_PER_MILLION = float(os.getenv("NOTEMASTER_PRICE_INPUT", "0.27"))
+LLM_PRICE_OUTPUT_PER_MILLION = float(os.getenv("NOTEMASTER_PRICE_OUTPUT", "1.10"))
+
+# Journalisation des réponses brutes du modèle (volumineuse, désactivée par défaut)
+LLM_LOG_RAW_RESPONSES = os.getenv("NOTEMASTER_LOG_RAW_RESPONSES", "0") == "1"
+
+# Révisions espacées (SM-2) : facteur de facilité initial et minimal, intervalle maximal en
+# jours (l'intervalle croît géométriquement à chaque bonne réponse) et nombre maximal de
+# questions par session de révision
+REVIEW_INITIAL_EASE = 2.5
+REVIEW_MIN_EASE = 1.3
+REVIEW_MAX_INTERVAL = 36500
+REVIEW_SESSION_SIZE = 20
+
+# Espaces de travail : avec NOTEMASTER_MULTI_USER=1, chaque utilisateur a ses propres notes,
+# questions, statistiques, index et clé API dans WORKSPACES_DIR/<identifiant>/. Sans cette
+# option, l'unique espace de travail est celui des dossiers ci-dessus.
+MULTI_USER = os.getenv("NOTEMASTER_MULTI_USER", "0") == "1"
+WORKSPACES_DIR = os.getenv("NOTEMASTER_WORKSPACES_DIR", "./workspaces/")
+
+# En-tête HTTP portant l'identifiant de l'utilisateur, posé par un proxy d'authentification
+# (par exemple "X-Forwarded-User"). Obligatoire en mode multi-utilisateur : l'application n'accepte
+# pas d'identifiant saisi par le visiteur
+WORKSPACE_USER_HEADER = os.getenv("NOTEMASTER_USER_HEADER", "")
+
+# Utilisateurs ayant accès à la page Admin en mode multi-utilisateur (séparés par des virgules)
+ADMIN_USERS = frozenset(user.strip() for user in os.getenv("NOTEMASTER_ADMIN_USERS", "").split(",") if user.strip())
+
+# Limites de chaque utilisateur (mode multi-utilisateur) : appels au modèle par minute, attente
+# maximale (en secondes) d'un appel au-delà de ce débit, et tokens par jour (0 = illimité pour
+# le débit comme pour les tokens)
+USER_RATE_PER_MINUTE = int(os.getenv("NOTEMASTER_USER_RATE_PER_MINUTE", "30"))
+USER_RATE_MAX_WAIT = 10
+USER_DAILY_TOKEN_QUOTA = int(os.getenv("NOTEMASTER_USER_DAILY_TOKENS", "200000"))
+
+# Appels au modèle par minute avec la clé de l'instance (0 = illimité), toutes sessions
+# confondues : elle sert aux utilisateurs sans clé API à eux et au serveur local
+INSTANCE_RATE_PER_MINUTE = int(os.getenv("NOTEMASTER_INSTANCE_RATE_PER_MINUTE", "60"))
+
+def ensure_dirs():
+    """
+    Crée les dossiers de données manquants. Appelée une fois au démarrage de l'application :
+    importer config n'écrit rien sur le disque.
+    """
+    for directory in (NOTES_DIR, QUESTIONS_DIR, STATS_DIR):
+        os.makedirs(directory, exist_ok=True)
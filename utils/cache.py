@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from contextlib import closing
+from config import (
+    LLM_MODEL,
+    LLM_BACKEND,
+    GENERATION_PROMPT_VERSION,
+    GENERATION_CACHE_MAX_ENTRIES,
+    GRADING_CACHE_MAX_ENTRIES,
+    GRADING_CACHE_TTL,
+)
+from utils import workspace
+
+class DiskCache:
+    """
+    Cache clé/valeur persistant sur disque (SQLite) avec éviction LRU et durée de vie optionnelle.
+    Les valeurs sont sérialisées en JSON. Un tag optionnel permet d'invalider
+    un groupe d'entrées (par exemple toutes celles d'une note).
+    """
+
+    def __init__(self, path, max_entries, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, tag TEXT, "
+                "created REAL NOT NULL DEFAULT 0, accessed REAL NOT NULL)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+            if "created" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN created REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_tag ON entries(tag)")
+            self._initialized = True
+        return conn
+
+    def get(self, key):
+        """
+        Retourne la valeur associée à la clé, ou None si elle est absente ou expirée
+        """
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                now = time.time()
+                row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None and self.ttl is not None and row[1] < now - self.ttl:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return json.loads(row[0])
+        except Exception as e:
+            logging.error("Erreur lors de la lecture du cache %s : %s", self.path, e)
+            return None
+
+    def set(self, key, value, tag=None):
+        """
+        Enregistre une valeur et évince les entrées les moins récemment utilisées
+        au-delà de max_entries
+        """
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, tag, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), tag, now, now),
+                )
+                if self.ttl is not None:
+                    conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    "SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except Exception as e:
+            logging.error("Erreur lors de l'écriture dans le cache %s : %s", self.path, e)
+
+    def delete(self, key):
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def invalidate_tag(self, tag):
+        """
+        Supprime toutes les entrées associées à un tag
+        :return: Nombre d'entrées supprimées
+        """
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                return conn.execute("DELETE FROM entries WHERE tag = ?", (tag,)).rowcount
+        except Exception as e:
+            logging.error("Erreur lors de l'invalidation du cache %s : %s", self.path, e)
+            return 0
+
+    def clear(self):
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM entries")
+
+    def stats(self):
+        """
+        Compteurs du cache depuis le démarrage de l'application
+        :return: Dictionnaire avec les clés 'hits', 'misses', 'hit_rate' et 'entries'
+        """
+        try:
+            with self._lock, closing(self._connect()) as conn:
+                entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except Exception as e:
+            logging.error("Erreur lors de la lecture du cache %s : %s", self.path, e)
+            entries = 0
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+# Les réponses d'un autre moteur (serveur local, simulateur) ne se mélangent pas dans les caches
+CACHE_MODEL = LLM_MODEL if LLM_BACKEND == "openrouter" else f"{LLM_BACKEND}:{LLM_MODEL}"
+
+def normalize_text(text):
+    """
+    Normalise un texte pour le calcul des clés de cache (Unicode NFC, espaces compactés)
+    """
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+def generation_cache():
+    """
+    Cache des questions générées de l'espace de travail actif, indexé par le contenu de la note
+    """
+    current = workspace.current()
+    return current.state(
+        "generation_cache",
+        lambda: DiskCache(os.path.join(current.cache_dir, "generation.sqlite3"), GENERATION_CACHE_MAX_ENTRIES),
+    )
+
+def generation_cache_key(note_content, model=CACHE_MODEL, prompt_version=GENERATION_PROMPT_VERSION):
+    """
+    Clé du cache de génération : empreinte du contenu normalisé, du modèle et de la version du prompt
+    """
+    payload = "\0".join([normalize_text(note_content), model, prompt_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def invalidate_note_questions(note_title):
+    """
+    Invalide les questions mises en cache pour une note
+    """
+    return generation_cache().invalidate_tag(note_title)
+
+def grading_cache():
+    """
+    Cache des évaluations de l'espace de travail actif, pour ne pas repayer la correction
+    d'une réponse identique
+    """
+    current = workspace.current()
+    return current.state(
+        "grading_cache",
+        lambda: DiskCache(os.path.join(current.cache_dir, "grading.sqlite3"), GRADING_CACHE_MAX_ENTRIES, ttl=GRADING_CACHE_TTL),
+    )
+
+def grading_cache_key(question, correct_answer, user_answer, model=CACHE_MODEL):
+    """
+    Clé du cache d'évaluation : empreinte de la question, des réponses normalisées et du modèle
+    """
+    payload = "\0".join([normalize_text(question), normalize_text(correct_answer), normalize_text(user_answer), model])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,415 @@
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime
+from config import QUESTION_SOURCES_FILENAME
+from utils import workspace
+
+# Moteur de stockage SQLite : notes, jeux de questions et tentatives dans une seule base,
+# une par espace de travail (voir utils.workspace)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    title TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    content_hash TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS question_sets (
+    note_title TEXT PRIMARY KEY,
+    questions TEXT NOT NULL,
+    content_hash TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    note_title TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    question TEXT NOT NULL,
+    user_answer TEXT NOT NULL,
+    correct_answer TEXT NOT NULL,
+    score NUMERIC NOT NULL,
+    question_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_note_timestamp ON attempts(note_title, timestamp);
+CREATE TABLE IF NOT EXISTS note_summaries (
+    note_title TEXT PRIMARY KEY,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS review_states (
+    key TEXT PRIMARY KEY,
+    note_title TEXT NOT NULL,
+    question TEXT NOT NULL,
+    reponse TEXT NOT NULL,
+    ease REAL NOT NULL,
+    interval INTEGER NOT NULL,
+    repetitions INTEGER NOT NULL,
+    due TEXT NOT NULL,
+    last_review TEXT NOT NULL,
+    last_score NUMERIC NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_review_states_due ON review_states(due);
+"""
+
+_init_lock = threading.Lock()
+# Bases déjà initialisées (schéma créé ou mis à jour), par chemin
+_initialized = set()
+
+def _connect():
+    conn = sqlite3.connect(workspace.current().db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _init_db():
+    db_path = workspace.current().db_path
+    with _init_lock:
+        if db_path in _initialized:
+            return
+        is_new = not os.path.exists(db_path)
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with closing(_connect()) as conn:
+            conn.executescript(SCHEMA)
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(notes)")]
+            if "content_hash" not in columns:
+                conn.execute("ALTER TABLE notes ADD COLUMN content_hash TEXT")
+            attempt_columns = [row["name"] for row in conn.execute("PRAGMA table_info(attempts)")]
+            if "question_id" not in attempt_columns:
+                conn.execute("ALTER TABLE attempts ADD COLUMN question_id TEXT")
+            question_set_columns = [row["name"] for row in conn.execute("PRAGMA table_info(question_sets)")]
+            if "content_hash" not in question_set_columns:
+                conn.execute("ALTER TABLE question_sets ADD COLUMN content_hash TEXT")
+        _initialized.add(db_path)
+    if is_new:
+        import_from_files()
+
+@contextmanager
+def connection():
+    """
+    Connexion en lecture à la base
+    """
+    _init_db()
+    with closing(_connect()) as conn:
+        yield conn
+
+@contextmanager
+def transaction():
+    """
+    Connexion dans une transaction d'écriture, validée en sortie ou annulée en cas d'erreur
+    """
+    _init_db()
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+def import_from_files():
+    """
+    Importe dans la base les notes, questions et statistiques stockées sous forme de fichiers.
+    Appelée automatiquement à la création de la base.
+    """
+    try:
+        notes_dir, questions_dir = workspace.current().notes_dir, workspace.current().questions_dir
+        with transaction() as conn:
+            now = datetime.now().isoformat()
+            if os.path.exists(notes_dir):
+                for filename in os.listdir(notes_dir):
+                    if filename.endswith(".txt"):
+                        with open(os.path.join(notes_dir, filename), "r", encoding="utf-8") as f:
+                            content = f.read()
+                        conn.execute(
+                            "INSERT OR IGNORE INTO notes (title, content, content_hash, updated_at) VALUES (?, ?, ?, ?)",
+                            (filename[:-len(".txt")], content, _content_hash(content), now),
+                        )
+            if os.path.exists(questions_dir):
+                sources_file = os.path.join(questions_dir, QUESTION_SOURCES_FILENAME)
+                sources = {}
+                if os.path.exists(sources_file):
+                    with open(sources_file, "r", encoding="utf-8") as f:
+                        sources = json.load(f)
+                for filename in os.listdir(questions_dir):
+                    if filename.endswith(".json") and filename not in ("questions.json", QUESTION_SOURCES_FILENAME):
+                        note_title = filename[:-len(".json")]
+                        with open(os.path.join(questions_dir, filename), "r", encoding="utf-8") as f:
+                            conn.execute(
+                                "INSERT OR IGNORE INTO question_sets (note_title, questions, content_hash, updated_at) VALUES (?, ?, ?, ?)",
+                                (note_title, json.dumps(json.load(f), ensure_ascii=False), sources.get(note_title), now),
+                            )
+        # Les statistiques passent par le gestionnaire de fichiers (journaux et anciens fichiers JSON)
+        from utils.stats_manager import get_all_stats_from_files
+        for note_title, note_stats in get_all_stats_from_files().items():
+            save_attempts(note_title, note_stats["attempts"])
+    except Exception as e:
+        logging.error("Erreur lors de l'import des fichiers dans la base : %s", e)
+
+# Notes
+
+def _content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def list_notes():
+    """
+    Index des notes sans leur contenu
+    """
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT title, LENGTH(CAST(content AS BLOB)) AS size, updated_at, content_hash FROM notes ORDER BY title"
+        ).fetchall()
+    return [
+        {"title": row["title"], "size": row["size"], "mtime": row["updated_at"], "hash": row["content_hash"]}
+        for row in rows
+    ]
+
+def list_note_titles(offset=0, limit=None):
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT title FROM notes ORDER BY title LIMIT ? OFFSET ?", (-1 if limit is None else limit, offset)
+        ).fetchall()
+    return [row["title"] for row in rows]
+
+def count_notes():
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+def get_note_content(title):
+    with connection() as conn:
+        row = conn.execute("SELECT content FROM notes WHERE title = ?", (title,)).fetchone()
+    return row["content"] if row else None
+
+def load_notes():
+    with connection() as conn:
+        rows = conn.execute("SELECT title, content FROM notes ORDER BY title").fetchall()
+    return [{"title": row["title"], "content": row["content"]} for row in rows]
+
+def _note_version(content, updated_at):
+    """
+    Version d'une note, au format de list_notes : [taille en octets, date de mise à jour]
+    """
+    return [len(content.encode("utf-8")), updated_at]
+
+def save_note(title, content):
+    """
+    :return: Version de la note enregistrée (voir _note_version)
+    """
+    updated_at = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO notes (title, content, content_hash, updated_at) VALUES (?, ?, ?, ?)",
+            (title, content, _content_hash(content), updated_at),
+        )
+    return _note_version(content, updated_at)
+
+def delete_note(title):
+    with transaction() as conn:
+        conn.execute("DELETE FROM notes WHERE title = ?", (title,))
+
+def update_note(title, new_content):
+    """
+    :return: Version de la note mise à jour (voir _note_version), ou None si elle n'existe pas
+    """
+    updated_at = datetime.now().isoformat()
+    with transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE notes SET content = ?, content_hash = ?, updated_at = ? WHERE title = ?",
+            (new_content, _content_hash(new_content), updated_at, title),
+        )
+        updated = cursor.rowcount > 0
+    return _note_version(new_content, updated_at) if updated else None
+
+# Jeux de questions
+
+def load_questions(note_title):
+    with connection() as conn:
+        row = conn.execute("SELECT questions FROM question_sets WHERE note_title = ?", (note_title,)).fetchone()
+    return json.loads(row["questions"]) if row else None
+
+def save_questions(note_title, questions):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO question_sets (note_title, questions, updated_at) VALUES (?, ?, ?)",
+            (note_title, json.dumps(questions, ensure_ascii=False), datetime.now().isoformat()),
+        )
+
+def update_questions(note_title, update, content_hash=None):
+    """
+    Lecture-modification-écriture du jeu de questions d'une note dans une seule transaction
+    :param update: Fonction qui reçoit les questions actuelles (ou None) et retourne les nouvelles
+    :param content_hash: Empreinte du contenu dont les questions ont été générées (si None,
+                         l'empreinte enregistrée est conservée)
+    :return: Nouvelles questions
+    """
+    with transaction() as conn:
+        row = conn.execute("SELECT questions, content_hash FROM question_sets WHERE note_title = ?", (note_title,)).fetchone()
+        questions = update(json.loads(row["questions"]) if row else None)
+        conn.execute(
+            "INSERT OR REPLACE INTO question_sets (note_title, questions, content_hash, updated_at) VALUES (?, ?, ?, ?)",
+            (note_title, json.dumps(questions, ensure_ascii=False),
+             content_hash if content_hash is not None else (row["content_hash"] if row else None),
+             datetime.now().isoformat()),
+        )
+    return questions
+
+def load_questions_source(note_title):
+    """
+    Empreinte du contenu dont les questions d'une note ont été générées
+    :return: Empreinte, ou None si elle n'a pas été enregistrée
+    """
+    with connection() as conn:
+        row = conn.execute("SELECT content_hash FROM question_sets WHERE note_title = ?", (note_title,)).fetchone()
+    return row["content_hash"] if row else None
+
+def delete_questions(note_title):
+    with transaction() as conn:
+        return conn.execute("DELETE FROM question_sets WHERE note_title = ?", (note_title,)).rowcount > 0
+
+# Tentatives
+
+def save_attempts(note_title, attempts, update_summary=None):
+    """
+    Enregistre des tentatives. Si update_summary est fourni, le résumé de la note est
+    mis à jour dans la même transaction : update_summary(résumé ou None, tentatives) -> résumé
+    """
+    save_attempts_by_note({note_title: attempts}, update_summary)
+
+def save_attempts_by_note(attempts_by_note, update_summary=None):
+    """
+    Enregistre les tentatives de plusieurs notes dans une seule transaction
+    :param attempts_by_note: Dictionnaire {titre de la note: tentatives}
+    """
+    with transaction() as conn:
+        for note_title, attempts in attempts_by_note.items():
+            conn.executemany(
+                "INSERT INTO attempts (note_title, timestamp, question, user_answer, correct_answer, score, question_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (note_title, a["timestamp"], a["question"], a["user_answer"], a["correct_answer"], a["score"], a.get("question_id"))
+                    for a in attempts
+                ],
+            )
+            if update_summary is not None:
+                row = conn.execute("SELECT summary FROM note_summaries WHERE note_title = ?", (note_title,)).fetchone()
+                note_summary = update_summary(json.loads(row["summary"]) if row else None, attempts)
+                conn.execute(
+                    "INSERT OR REPLACE INTO note_summaries (note_title, summary) VALUES (?, ?)",
+                    (note_title, json.dumps(note_summary, ensure_ascii=False)),
+                )
+
+def _attempt_from_row(row):
+    attempt = {
+        "timestamp": row["timestamp"],
+        "question": row["question"],
+        "user_answer": row["user_answer"],
+        "correct_answer": row["correct_answer"],
+        "score": row["score"],
+    }
+    if row["question_id"] is not None:
+        attempt["question_id"] = row["question_id"]
+    return attempt
+
+def get_note_stats(note_title):
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM attempts WHERE note_title = ? ORDER BY timestamp, id", (note_title,)
+        ).fetchall()
+    return {"attempts": [_attempt_from_row(row) for row in rows]}
+
+def get_all_stats():
+    all_stats = {}
+    with connection() as conn:
+        for row in conn.execute("SELECT * FROM attempts ORDER BY note_title, timestamp, id"):
+            all_stats.setdefault(row["note_title"], {"attempts": []})["attempts"].append(_attempt_from_row(row))
+    return all_stats
+
+def get_note_attempts(note_title, offset, limit):
+    """
+    Page de l'historique d'une note, de la tentative la plus récente à la plus ancienne
+    """
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM attempts WHERE note_title = ? ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            (note_title, limit, offset),
+        ).fetchall()
+    return [_attempt_from_row(row) for row in rows]
+
+def get_attempts_after(last_id):
+    """
+    Tentatives enregistrées après l'identifiant donné, dans l'ordre d'enregistrement
+    :return: Liste de (identifiant, titre de la note, tentative)
+    """
+    with connection() as conn:
+        rows = conn.execute("SELECT * FROM attempts WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+    return [(row["id"], row["note_title"], _attempt_from_row(row)) for row in rows]
+
+def count_attempts(max_id):
+    """
+    Nombre de tentatives dont l'identifiant ne dépasse pas max_id
+    """
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM attempts WHERE id <= ?", (max_id,)).fetchone()[0]
+
+def notes_with_attempts():
+    with connection() as conn:
+        return {row["note_title"] for row in conn.execute("SELECT DISTINCT note_title FROM attempts")}
+
+def load_summaries():
+    with connection() as conn:
+        rows = conn.execute("SELECT note_title, summary FROM note_summaries ORDER BY note_title").fetchall()
+    return {row["note_title"]: json.loads(row["summary"]) for row in rows}
+
+def replace_summaries(summaries):
+    with transaction() as conn:
+        conn.execute("DELETE FROM note_summaries")
+        conn.executemany(
+            "INSERT INTO note_summaries (note_title, summary) VALUES (?, ?)",
+            [(note_title, json.dumps(note_summary, ensure_ascii=False)) for note_title, note_summary in summaries.items()],
+        )
+
+def delete_note_stats(note_title):
+    with transaction() as conn:
+        conn.execute("DELETE FROM note_summaries WHERE note_title = ?", (note_title,))
+        return conn.execute("DELETE FROM attempts WHERE note_title = ?", (note_title,)).rowcount > 0
+
+def delete_all_stats():
+    with transaction() as conn:
+        conn.execute("DELETE FROM attempts")
+        conn.execute("DELETE FROM note_summaries")
+    return True
+
+# Planning des révisions
+
+REVIEW_STATE_FIELDS = ("key", "note_title", "question", "reponse", "ease", "interval", "repetitions", "due", "last_review", "last_score")
+
+def load_review_states():
+    with connection() as conn:
+        rows = conn.execute("SELECT * FROM review_states").fetchall()
+    return {row["key"]: {field: row[field] for field in REVIEW_STATE_FIELDS} for row in rows}
+
+def save_review_states(states, replace=False):
+    """
+    Enregistre des états de révision
+    :param replace: Si True, remplace tous les états existants
+    """
+    with transaction() as conn:
+        if replace:
+            conn.execute("DELETE FROM review_states")
+        conn.executemany(
+            f"INSERT OR REPLACE INTO review_states ({', '.join(REVIEW_STATE_FIELDS)}) "
+            f"VALUES ({', '.join('?' for _ in REVIEW_STATE_FIELDS)})",
+            [tuple(state[field] for field in REVIEW_STATE_FIELDS) for state in states],
+        )
+
+def delete_review_states(note_title=None):
+    with transaction() as conn:
+        if note_title is None:
+            conn.execute("DELETE FROM review_states")
+        else:
+            conn.execute("DELETE FROM review_states WHERE note_title = ?", (note_title,))
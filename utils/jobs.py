@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import uuid
+import hashlib
+import logging
+import argparse
+import threading
+import contextvars
+from types import SimpleNamespace
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import BULK_GENERATION_WORKERS, BULK_GENERATION_RATE_PER_MINUTE
+from utils import workspace
+from utils.metrics import bind_context
+from utils.quotas import RateLimiter
+from utils.note_manager import list_notes, get_note_content
+from utils.question_store import load_note_questions, load_questions_source
+from utils.question_generator import generate_questions, get_cached_questions, split_note
+from utils.cache import generation_cache_key
+from utils.llm_client import LLMError
+from utils.persistence import atomic_write_json, try_file_lock
+
+# Génération groupée des questions de toutes les notes, en tâche de fond.
+# L'avancement est écrit dans un fichier après chaque note : l'interface le lit sans
+# bloquer, et une tâche interrompue (arrêt ou plantage) reprend là où elle s'était arrêtée.
+# Un verrou sur le fichier d'état empêche deux processus (l'application et la ligne de
+# commande) d'exécuter la même tâche en même temps.
+# Chaque espace de travail (voir utils.workspace) a sa propre tâche.
+
+def _job_file():
+    return os.path.join(workspace.current().jobs_dir, "bulk_generation.json")
+
+def _content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def is_stale(note_title, note_content):
+    """
+    Une note est à (re)générer si sa banque de questions n'a pas été générée à partir de son
+    contenu actuel. Pour une banque enregistrée sans empreinte (avant leur ajout), la note est
+    à générer si son contenu n'a pas de questions dans le cache de génération.
+    """
+    source = load_questions_source(note_title)
+    if source is None:
+        return get_cached_questions(note_content) is None or not load_note_questions(note_title)
+    return source != generation_cache_key(note_content)
+
+def get_job_status():
+    """
+    Lit l'état de la dernière tâche de génération groupée, sans bloquer
+    :return: Dictionnaire d'état, ou None si aucune tâche n'a été lancée
+    """
+    try:
+        with open(_job_file(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error("Erreur lors de la lecture de l'état de la génération groupée : %s", e)
+        return None
+
+class BulkGenerationJob:
+    """
+    Génère ou rafraîchit les questions des notes obsolètes avec un groupe de threads
+    et un débit limité
+    """
+
+    def __init__(self, force=False, workers=BULK_GENERATION_WORKERS, rate_per_minute=BULK_GENERATION_RATE_PER_MINUTE):
+        self.force = force
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate_per_minute)
+        self._lock = threading.Lock()
+        self.state = None
+
+    def _save_state(self):
+        self.state["updated_at"] = datetime.now().isoformat()
+        atomic_write_json(_job_file(), self.state, indent=4)
+
+    def _prepare(self):
+        """
+        Reprend une tâche interrompue (état « running » sans processus qui tienne le verrou),
+        ou construit la liste des notes à traiter
+        """
+        previous = get_job_status()
+        if previous and previous["status"] == "running":
+            logging.info("Reprise de la génération groupée %s", previous["job_id"])
+            self.state = previous
+            self.force = previous.get("force", self.force)
+            return
+
+        notes = {}
+        for note in list_notes():
+            content = get_note_content(note["title"])
+            if content is None:
+                continue
+            if self.force or is_stale(note["title"], content):
+                notes[note["title"]] = {"status": "pending", "hash": _content_hash(content)}
+        self.state = {
+            "job_id": uuid.uuid4().hex[:8],
+            "status": "running",
+            "force": self.force,
+            "started_at": datetime.now().isoformat(),
+            "notes": notes,
+        }
+
+    def _process(self, note_title):
+        content = get_note_content(note_title)
+        entry = self.state["notes"][note_title]
+        if content is None:
+            result = {"status": "skipped", "error": "Note supprimée"}
+        else:
+            # Une note longue est générée en plusieurs requêtes, une par section ; une note
+            # déjà en cache ne fait aucune requête et ne consomme pas de débit
+            if self.force or get_cached_questions(content) is None:
+                self.rate_limiter.acquire(len(split_note(content)))
+            try:
+                questions = generate_questions(note_title, content, force=self.force)
+                result = {"status": "done", "questions": len(questions)}
+            except LLMError as e:
+                result = {"status": "failed", "error": str(e)}
+        with self._lock:
+            entry.update(result, hash=_content_hash(content) if content is not None else entry["hash"])
+            self._save_state()
+        logging.info("Génération groupée : %s -> %s", note_title, result["status"])
+
+    def run(self):
+        """
+        Exécute la tâche jusqu'au bout (bloquant)
+        :return: État final de la tâche, ou None si une tâche est déjà en cours ailleurs
+        """
+        with try_file_lock(_job_file()) as acquired:
+            if not acquired:
+                logging.warning("Une génération groupée est déjà en cours dans un autre processus")
+                return None
+            self._prepare()
+            self._save_state()
+            pending = [title for title, entry in self.state["notes"].items() if entry["status"] == "pending"]
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+                    list(executor.map(bind_context(self._process), pending))
+                self.state["status"] = "completed"
+            except Exception as e:
+                logging.exception("Erreur lors de la génération groupée")
+                self.state["status"] = "failed"
+                self.state["error"] = str(e)
+            with self._lock:
+                self._save_state()
+            return self.state
+
+_start_lock = threading.Lock()
+
+def _state():
+    """
+    Thread de la tâche en cours dans l'espace de travail actif
+    """
+    return workspace.current().state("jobs", lambda: SimpleNamespace(thread=None))
+
+def is_running():
+    thread = _state().thread
+    return thread is not None and thread.is_alive()
+
+def start_bulk_generation(force=False):
+    """
+    Lance la génération groupée dans un thread de fond
+    :param force: Si True, régénère les questions de toutes les notes
+    :return: True si la tâche a été lancée, False si une tâche est déjà en cours
+    """
+    with _start_lock:
+        if is_running():
+            return False
+        job = BulkGenerationJob(force=force)
+        # Le thread hérite de l'espace de travail actif
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(job.run,), name="bulk-generation", daemon=True)
+        _state().thread = thread
+        thread.start()
+        return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère les questions de toutes les notes obsolètes.")
+    parser.add_argument("--force", action="store_true", help="régénère les questions de toutes les notes")
+    parser.add_argument("--workers", type=int, default=BULK_GENERATION_WORKERS, help="nombre de notes traitées simultanément")
+    parser.add_argument("--rate", type=int, default=BULK_GENERATION_RATE_PER_MINUTE, help="requêtes par minute (0 : sans limite)")
+    parser.add_argument("--user", help="espace de travail de cet utilisateur (mode multi-utilisateur)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    with workspace.activate(args.user):
+        state = BulkGenerationJob(force=args.force, workers=args.workers, rate_per_minute=args.rate).run()
+    if state is None:
+        print("Une génération groupée est déjà en cours.")
+        return 1
+    counts = {}
+    for entry in state["notes"].values():
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    print(f"Génération groupée {state['job_id']} : {state['status']} {counts}")
+    return 0 if state["status"] == "completed" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import Counter
+from config import (
+    LLM_POOL_MAX_CONNECTIONS,
+    LLM_POOL_KEEPALIVE_CONNECTIONS,
+    LLM_POOL_KEEPALIVE_EXPIRY,
+    LLM_TIMEOUT,
+)
+
+# Moteurs interchangeables derrière utils.llm_client : tout moteur expose complete() et
+# stream() et lève les exceptions de l'API OpenAI ou des LLMError en cas d'échec.
+# La consommation de tokens est retournée sous la forme {"prompt_tokens": N, "completion_tokens": M},
+# ou None si le moteur ne la fournit pas.
+
+class LLMBackend:
+    """
+    Interface d'un moteur de modèle
+    """
+
+    name = "backend"
+
+    def complete(self, messages, operation, model, timeout):
+        """
+        :return: Couple (texte de la réponse, consommation de tokens)
+        """
+        raise NotImplementedError
+
+    def stream(self, messages, operation, model, timeout):
+        """
+        :return: Itérateur de couples (morceau de texte, consommation de tokens) ; la
+                 consommation n'est connue qu'à la fin du flux et vaut None avant
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+def _usage(usage):
+    if usage is None:
+        return None
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Moteur pour toute API compatible OpenAI (OpenRouter, serveur local), avec un
+    groupe de connexions HTTP réutilisées
+    """
+
+    def __init__(self, base_url, api_key, name="openai"):
+        # Imports locaux : le SDK OpenAI est long à charger, et inutile avec le simulateur
+        # ou tant qu'aucun appel au modèle n'est fait
+        import httpx
+        import openai
+
+        self.name = name
+        self.base_url = base_url
+        self.client = openai.OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_POOL_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+                ),
+                timeout=LLM_TIMEOUT,
+            ),
+            max_retries=0,
+        )
+
+    def complete(self, messages, operation, model, timeout):
+        response = self.client.chat.completions.create(
+            extra_body={},
+            model=model,
+            messages=messages,
+            timeout=timeout,
+        )
+        if not response or not response.choices:
+            return "", None
+        return response.choices[0].message.content or "", _usage(response.usage)
+
+    def stream(self, messages, operation, model, timeout):
+        response = self.client.chat.completions.create(
+            extra_body={},
+            model=model,
+            messages=messages,
+            timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        def chunks():
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content, None
+                if getattr(chunk, "usage", None):
+                    yield "", _usage(chunk.usage)
+        return chunks()
+
+    def close(self):
+        self.client.close()
+
+class FakeBackend(LLMBackend):
+    """
+    Simulateur hors ligne et déterministe, pour les tests de charge et les mesures :
+    les réponses ne dépendent que du prompt, avec une latence et des erreurs injectées
+    configurables. Une même requête retentée peut réussir, comme avec un vrai fournisseur.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, error_rate=0.0, seed=0, stream_chunk_size=24):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self._attempts = Counter()
+        self._lock = threading.Lock()
+
+    def _random(self, prompt):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.calls += 1
+            self._attempts[digest] += 1
+            attempt = self._attempts[digest]
+        return random.Random(f"{self.seed}:{digest}:{attempt}"), digest
+
+    def _simulate_call(self, prompt):
+        # Import local : llm_client importe ce module
+        from utils.llm_client import LLMTimeoutError, LLMUnavailableError
+
+        rng, digest = self._random(prompt)
+        time.sleep(max(0.0, self.latency + rng.uniform(-self.latency_jitter, self.latency_jitter)))
+        if rng.random() < self.error_rate:
+            if rng.random() < 0.5:
+                raise LLMUnavailableError("Erreur injectée par le simulateur (503)")
+            raise LLMTimeoutError("Délai dépassé injecté par le simulateur")
+        return digest
+
+    def _respond(self, prompt, operation, digest):
+        if operation == "grade":
+            return json.dumps({"score": int(digest, 16) % 6})
+        if operation == "grade_batch":
+            ids = [int(index) for index in re.findall(r"^\[(\d+)\]$", prompt, flags=re.MULTILINE)]
+            return json.dumps([
+                {"id": index, "score": int(hashlib.sha256(f"{digest}:{index}".encode()).hexdigest(), 16) % 6}
+                for index in ids
+            ])
+        if operation == "generate":
+            match = re.search(r"Texte : (.*)\nRetourne uniquement", prompt, flags=re.DOTALL)
+            text = match.group(1) if match else prompt
+            sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if len(s.strip()) > 20]
+            return json.dumps([
+                {"text": f"Expliquez : {sentence[:80]}", "reponse": sentence}
+                for sentence in sentences[:8]
+            ], ensure_ascii=False)
+        return "OK"
+
+    @staticmethod
+    def _usage(prompt, text):
+        # Estimation d'environ 4 caractères par token
+        return {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(text) // 4 + 1}
+
+    def complete(self, messages, operation, model, timeout):
+        prompt = messages[-1]["content"]
+        digest = self._simulate_call(prompt)
+        text = self._respond(prompt, operation, digest)
+        return text, self._usage(prompt, text)
+
+    def stream(self, messages, operation, model, timeout):
+        prompt = messages[-1]["content"]
+        digest = self._simulate_call(prompt)
+        text = self._respond(prompt, operation, digest)
+
+        def chunks():
+            for start in range(0, len(text), self.stream_chunk_size):
+                yield text[start:start + self.stream_chunk_size], None
+            yield "", self._usage(prompt, text)
+        return chunks()
@@ -0,0 +1,326 @@
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from config import (
+    LLM_BACKEND,
+    LLM_BASE_URL,
+    LLM_LOCAL_BASE_URL,
+    LLM_MODEL,
+    LLM_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_COOLDOWN,
+    FAKE_LLM_LATENCY,
+    FAKE_LLM_LATENCY_JITTER,
+    FAKE_LLM_ERROR_RATE,
+    FAKE_LLM_SEED,
+)
+from utils import workspace, quotas
+from utils.llm_backends import OpenAICompatibleBackend, FakeBackend
+from utils.metrics import registry as metrics
+
+# Client partagé pour tous les appels au modèle : moteur interchangeable (voir
+# utils.llm_backends), délai par appel, nouvelles tentatives avec attente exponentielle
+# et disjoncteur. Un appel qui échoue lève une LLMError au lieu de retourner une valeur par défaut.
+# Chaque espace de travail a son moteur (avec la clé API de son utilisateur) et ses limites
+# d'appels (voir utils.quotas).
+
+class LLMError(Exception):
+    """
+    L'appel au modèle a échoué (à distinguer d'une réponse valide du modèle)
+    """
+
+class LLMTimeoutError(LLMError):
+    """
+    Le modèle n'a pas répondu dans le délai imparti
+    """
+
+class LLMRateLimitError(LLMError):
+    """
+    Le fournisseur a refusé l'appel (429) et les nouvelles tentatives sont épuisées
+    """
+
+class LLMUnavailableError(LLMError):
+    """
+    Erreur réseau ou erreur serveur (5xx) persistante
+    """
+
+class LLMResponseError(LLMError):
+    """
+    Le modèle a répondu, mais la réponse est vide ou inexploitable
+    """
+
+class CircuitOpenError(LLMError):
+    """
+    Trop d'échecs récents : les appels sont suspendus pendant un délai de refroidissement
+    """
+
+class QuotaExceededError(LLMError):
+    """
+    L'utilisateur a atteint sa limite d'appels par minute ou son quota quotidien de tokens
+    """
+
+class CircuitBreaker:
+    """
+    Disjoncteur : après failure_threshold échecs consécutifs, les appels sont refusés
+    pendant cooldown secondes, puis un appel d'essai est autorisé
+    """
+
+    def __init__(self, failure_threshold=LLM_CIRCUIT_FAILURE_THRESHOLD, cooldown=LLM_CIRCUIT_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        # Un appel d'essai est en cours (état demi-ouvert) : les autres appels sont refusés
+        self.trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        :return: True si l'appel autorisé est l'appel d'essai, à clore avec end_trial()
+        :raises CircuitOpenError: si le disjoncteur est ouvert ou si un appel d'essai est en cours
+        """
+        with self._lock:
+            if self.trial_in_progress:
+                raise CircuitOpenError("Appels au modèle suspendus pendant un appel d'essai après des échecs répétés.")
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(f"Appels au modèle suspendus pendant encore {remaining:.0f} s après des échecs répétés.")
+            # Demi-ouvert : un seul appel d'essai, le disjoncteur se rouvre s'il échoue
+            self.opened_at = None
+            self.failures = self.failure_threshold - 1
+            self.trial_in_progress = True
+            return True
+
+    def end_trial(self):
+        """
+        Termine l'appel d'essai, quelle que soit son issue (une erreur non transitoire ne
+        rouvre pas le disjoncteur)
+        """
+        with self._lock:
+            self.trial_in_progress = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.trial_in_progress = False
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                logging.warning("Disjoncteur ouvert après %d échecs consécutifs", self.failures)
+
+# Moteurs créés, par utilisateur (None : espace de travail par défaut)
+_backends = {}
+_backend_lock = threading.Lock()
+
+def circuit_breaker():
+    """
+    Disjoncteur de l'espace de travail actif : les échecs d'un utilisateur ne suspendent pas
+    les appels des autres
+    """
+    return workspace.current().state("circuit_breaker", CircuitBreaker)
+
+def create_backend(name=LLM_BACKEND):
+    """
+    Crée le moteur configuré : "openrouter", "local" ou "fake"
+    """
+    if name == "openrouter":
+        return OpenAICompatibleBackend(LLM_BASE_URL, workspace.current().api_key(), name="openrouter")
+    if name == "local":
+        return OpenAICompatibleBackend(LLM_LOCAL_BASE_URL, os.getenv("NOTEMASTER_LLM_API_KEY") or "local", name="local")
+    if name == "fake":
+        return FakeBackend(
+            latency=FAKE_LLM_LATENCY,
+            latency_jitter=FAKE_LLM_LATENCY_JITTER,
+            error_rate=FAKE_LLM_ERROR_RATE,
+            seed=FAKE_LLM_SEED,
+        )
+    raise ValueError(f"Moteur de modèle inconnu : {name}")
+
+def get_backend():
+    """
+    Retourne le moteur de l'espace de travail actif, créé au premier appel
+    """
+    user = workspace.current().user
+    with _backend_lock:
+        if user not in _backends:
+            _backends[user] = create_backend()
+        return _backends[user]
+
+def set_backend(backend):
+    """
+    Remplace le moteur de l'espace de travail actif (par exemple par un FakeBackend pour les mesures)
+    """
+    user = workspace.current().user
+    with _backend_lock:
+        previous, _backends[user] = _backends.get(user), backend
+    if previous is not None and previous is not backend:
+        previous.close()
+
+def reset_client():
+    """
+    Oublie le moteur de l'espace de travail actif (par exemple après un changement de clé API)
+    """
+    with _backend_lock:
+        backend = _backends.pop(workspace.current().user, None)
+    if backend is not None:
+        backend.close()
+
+def _check_quota():
+    """
+    :raises QuotaExceededError: si l'utilisateur actif a atteint l'une de ses limites
+    """
+    reason = quotas.acquire_call()
+    if reason is not None:
+        raise QuotaExceededError(reason)
+
+def _record_usage(record):
+    quotas.record_usage((record.data["prompt_tokens"] or 0) + (record.data["completion_tokens"] or 0))
+
+def _retry_after(error):
+    """
+    Délai demandé par le fournisseur via l'en-tête Retry-After, en secondes
+    """
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _translate_error(error):
+    """
+    Convertit une erreur du SDK en LLMError
+    :return: Couple (erreur convertie, True si l'appel peut être retenté)
+    """
+    if isinstance(error, LLMError):
+        return error, isinstance(error, (LLMTimeoutError, LLMRateLimitError, LLMUnavailableError))
+    # Import local : le SDK est déjà chargé si l'erreur en provient (voir utils.llm_backends)
+    import openai
+
+    if isinstance(error, openai.APITimeoutError):
+        return LLMTimeoutError(f"Délai dépassé lors de l'appel au modèle : {error}"), True
+    if isinstance(error, openai.APIConnectionError):
+        return LLMUnavailableError(f"Erreur de connexion au modèle : {error}"), True
+    if isinstance(error, openai.RateLimitError):
+        return LLMRateLimitError(f"Limite de requêtes atteinte : {error}"), True
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code >= 500:
+            return LLMUnavailableError(f"Erreur du serveur ({error.status_code}) : {error}"), True
+        return LLMError(f"Requête refusée ({error.status_code}) : {error}"), False
+    return LLMError(f"Erreur lors de l'appel au modèle : {error}"), False
+
+def _backoff_delay(attempt, error):
+    delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return min(LLM_BACKOFF_MAX, retry_after)
+    # Attente aléatoire (« full jitter ») pour étaler les nouvelles tentatives des threads
+    return random.uniform(0, delay)
+
+def _call_with_retries(request, operation, record):
+    """
+    Exécute request() avec nouvelles tentatives sur les erreurs transitoires. Chaque
+    tentative est décomptée des limites de l'utilisateur actif.
+    :param record: Mesure de l'appel, qui reçoit le nombre de nouvelles tentatives
+    :raises QuotaExceededError: si une limite est atteinte avant une tentative
+    """
+    breaker = circuit_breaker()
+    trial = breaker.before_call()
+    try:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            record.data["retries"] = attempt
+            _check_quota()
+            try:
+                result = request()
+                breaker.record_success()
+                return result
+            except Exception as e:
+                llm_error, retryable = _translate_error(e)
+                if attempt == LLM_MAX_RETRIES and retryable:
+                    breaker.record_failure()
+                if not retryable or attempt == LLM_MAX_RETRIES:
+                    if llm_error is e:
+                        raise
+                    raise llm_error from e
+                delay = _backoff_delay(attempt, e)
+                logging.warning(
+                    "Appel au modèle (%s) en échec, nouvelle tentative %d/%d dans %.1f s : %s",
+                    operation, attempt + 1, LLM_MAX_RETRIES, delay, llm_error,
+                )
+                time.sleep(delay)
+    finally:
+        if trial:
+            breaker.end_trial()
+
+def complete(messages, operation="chat", model=LLM_MODEL, timeout=LLM_TIMEOUT, note=None):
+    """
+    Envoie une requête de complétion et retourne le texte de la réponse
+    :param messages: Messages au format de l'API chat
+    :param operation: Nom de l'opération ("generate", "grade", "grade_batch"...)
+    :param model: Modèle à utiliser
+    :param timeout: Délai maximal de l'appel, en secondes
+    :param note: Note concernée, pour les mesures (par défaut, celle de metrics.tags)
+    :return: Contenu de la réponse
+    :raises LLMError: si l'appel échoue ou si la réponse est vide
+    """
+    backend = get_backend()
+    record = metrics.start(operation, model, backend.name, note=note)
+    try:
+        content, usage = _call_with_retries(lambda: backend.complete(messages, operation, model, timeout), operation, record)
+        record.set_usage(usage)
+        if not content:
+            raise LLMResponseError("La réponse de l'API est vide.")
+        return content
+    except Exception as e:
+        record.fail(e)
+        raise
+    finally:
+        record.finish()
+        _record_usage(record)
+
+def stream(messages, operation="chat", model=LLM_MODEL, timeout=LLM_TIMEOUT, note=None):
+    """
+    Envoie une requête de complétion en flux et retourne les morceaux de texte au fil de l'eau.
+    Seule l'ouverture du flux est retentée : une erreur en cours de flux est levée telle quelle.
+    :return: Générateur de morceaux de texte
+    :raises LLMError: si l'appel échoue
+    """
+    backend = get_backend()
+    record = metrics.start(operation, model, backend.name, note=note)
+    try:
+        chunks = _call_with_retries(lambda: backend.stream(messages, operation, model, timeout), operation, record)
+        for chunk, usage in chunks:
+            record.set_usage(usage)
+            if chunk:
+                record.first_token()
+                yield chunk
+    except LLMError as e:
+        record.fail(e)
+        raise
+    except Exception as e:
+        record.fail(e)
+        raise _translate_error(e)[0] from e
+    finally:
+        # Un flux abandonné par l'appelant est mesuré jusqu'à son interruption
+        record.finish()
+        _record_usage(record)
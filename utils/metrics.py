@@ -0,0 +1,238 @@
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from utils import workspace
+from utils.persistence import append_lines
+from config import METRICS_MAX_RECORDS, LLM_PRICE_INPUT_PER_MILLION, LLM_PRICE_OUTPUT_PER_MILLION
+
+# Mesures des appels au modèle : une entrée par appel (durée, délai avant le premier token,
+# tokens, nouvelles tentatives, cache), étiquetée par opération et par note. Les totaux sont
+# cumulés depuis le démarrage ; les percentiles portent sur les METRICS_MAX_RECORDS derniers appels.
+
+# Note en cours de traitement, héritée par les appels au modèle (voir tags et bind_context)
+_current_note = contextvars.ContextVar("metrics_note", default=None)
+
+@contextmanager
+def tags(note=None):
+    """
+    Étiquette les appels au modèle effectués dans ce bloc avec la note donnée
+    """
+    token = _current_note.set(note)
+    try:
+        yield
+    finally:
+        _current_note.reset(token)
+
+def bind_context(function):
+    """
+    Transmet les étiquettes courantes et l'espace de travail actif à une fonction exécutée
+    dans un autre thread (les threads d'un ThreadPoolExecutor ne les héritent pas)
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return run
+
+def estimate_cost(prompt_tokens, completion_tokens):
+    """
+    Coût estimé d'un appel, en dollars, selon les tarifs configurés
+    """
+    return ((prompt_tokens or 0) * LLM_PRICE_INPUT_PER_MILLION + (completion_tokens or 0) * LLM_PRICE_OUTPUT_PER_MILLION) / 1e6
+
+class CallRecord:
+    """
+    Mesure d'un appel en cours, complétée par le client puis enregistrée par finish()
+    """
+
+    def __init__(self, registry, operation, model=None, backend=None, cache="miss", note=None):
+        self.registry = registry
+        self.started = time.perf_counter()
+        self.data = {
+            "timestamp": datetime.now().isoformat(),
+            "operation": operation,
+            "note": note if note is not None else _current_note.get(),
+            "user": workspace.current().user,
+            "model": model,
+            "backend": backend,
+            "cache": cache,
+            "status": "ok",
+            "error": None,
+            "duration": None,
+            "ttft": None,
+            "retries": 0,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "cost": None,
+        }
+
+    def first_token(self):
+        if self.data["ttft"] is None:
+            self.data["ttft"] = time.perf_counter() - self.started
+
+    def set_usage(self, usage):
+        if usage:
+            self.data["prompt_tokens"] = usage.get("prompt_tokens")
+            self.data["completion_tokens"] = usage.get("completion_tokens")
+
+    def fail(self, error):
+        self.data["status"] = "error"
+        self.data["error"] = type(error).__name__
+
+    def finish(self):
+        if self.data["duration"] is None:
+            self.data["duration"] = time.perf_counter() - self.started
+            if self.data["prompt_tokens"] is not None or self.data["completion_tokens"] is not None:
+                self.data["cost"] = estimate_cost(self.data["prompt_tokens"], self.data["completion_tokens"])
+            self.registry.add(self.data)
+
+class MetricsRegistry:
+    """
+    Agrégation en mémoire des mesures, partagée entre les threads
+    """
+
+    def __init__(self, max_records=METRICS_MAX_RECORDS):
+        self.records = deque(maxlen=max_records)
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def start(self, operation, model=None, backend=None, cache="miss", note=None):
+        """
+        Commence la mesure d'un appel
+        :param note: Note concernée ; par défaut, celle du bloc tags() en cours
+        """
+        return CallRecord(self, operation, model, backend, cache, note)
+
+    def record_cache_hit(self, operation, note=None):
+        """
+        Enregistre un appel évité grâce au cache
+        """
+        self.start(operation, cache="hit", note=note).finish()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+            totals = self.totals.setdefault(
+                (record["operation"], record["status"], record["cache"]),
+                {"calls": 0, "duration": 0.0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0},
+            )
+            totals["calls"] += 1
+            totals["duration"] += record["duration"]
+            totals["retries"] += record["retries"]
+            totals["prompt_tokens"] += record["prompt_tokens"] or 0
+            totals["completion_tokens"] += record["completion_tokens"] or 0
+            totals["cost"] += record["cost"] or 0.0
+
+    def recent(self):
+        with self._lock:
+            return list(self.records)
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+            self.totals.clear()
+
+    def summary(self, group_by="operation"):
+        """
+        Agrège les derniers appels au modèle (hors cache) par opération, par note ou par utilisateur
+        :param group_by: "operation", "note" ou "user"
+        :return: Liste de dictionnaires, un par groupe, avec nombre d'appels, erreurs,
+                 percentiles de durée (p50, p95, p99), délai médian avant le premier token,
+                 tokens, coût, nouvelles tentatives et taux de succès du cache
+        """
+        groups = {}
+        for record in self.recent():
+            groups.setdefault(record[group_by], []).append(record)
+
+        rows = []
+        for key, records in sorted(groups.items(), key=lambda item: str(item[0])):
+            calls = [record for record in records if record["cache"] != "hit"]
+            durations = np.array([record["duration"] for record in calls]) if calls else np.zeros(1)
+            ttfts = [record["ttft"] for record in calls if record["ttft"] is not None]
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+            rows.append({
+                group_by: key if key is not None else "-",
+                "calls": len(calls),
+                "errors": sum(record["status"] == "error" for record in calls),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "ttft_p50": float(np.percentile(ttfts, 50)) if ttfts else None,
+                "prompt_tokens": sum(record["prompt_tokens"] or 0 for record in calls),
+                "completion_tokens": sum(record["completion_tokens"] or 0 for record in calls),
+                "cost": sum(record["cost"] or 0.0 for record in calls),
+                "retries": sum(record["retries"] for record in calls),
+                "cache_hit_rate": (len(records) - len(calls)) / len(records),
+            })
+        return rows
+
+    def export_jsonl(self, path=None):
+        """
+        Exporte les derniers appels, un objet JSON par ligne
+        :param path: Fichier de destination (ajout en fin de fichier) ; si None, retourne le texte
+        """
+        lines = [json.dumps(record, ensure_ascii=False) for record in self.recent()]
+        if path is not None:
+            append_lines(path, lines)
+        return "".join(line + "\n" for line in lines)
+
+    def prometheus_text(self):
+        """
+        Exporte les mesures au format texte de Prometheus. Les compteurs sont cumulés depuis le
+        démarrage ; la note n'est pas une étiquette (trop de valeurs possibles), voir export_jsonl.
+        """
+        with self._lock:
+            totals = dict(self.totals)
+        lines = [
+            "# HELP notemaster_llm_calls_total Appels au modèle, y compris ceux servis par le cache",
+            "# TYPE notemaster_llm_calls_total counter",
+        ]
+        for (operation, status, cache), values in sorted(totals.items()):
+            lines.append(f'notemaster_llm_calls_total{{operation="{operation}",status="{status}",cache="{cache}"}} {values["calls"]}')
+
+        by_operation = {}
+        for (operation, _, cache), values in totals.items():
+            if cache == "hit":
+                continue
+            current = by_operation.setdefault(operation, dict.fromkeys(values, 0))
+            for name, value in values.items():
+                current[name] += value
+
+        for metric, field, help_text in (
+            ("notemaster_llm_retries_total", "retries", "Nouvelles tentatives après une erreur transitoire"),
+            ("notemaster_llm_cost_dollars_total", "cost", "Coût estimé des appels, en dollars"),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for operation, values in sorted(by_operation.items()):
+                lines.append(f'{metric}{{operation="{operation}"}} {values[field]}')
+
+        lines += [
+            "# HELP notemaster_llm_tokens_total Tokens consommés",
+            "# TYPE notemaster_llm_tokens_total counter",
+        ]
+        for operation, values in sorted(by_operation.items()):
+            lines.append(f'notemaster_llm_tokens_total{{operation="{operation}",type="prompt"}} {values["prompt_tokens"]}')
+            lines.append(f'notemaster_llm_tokens_total{{operation="{operation}",type="completion"}} {values["completion_tokens"]}')
+
+        lines += [
+            "# HELP notemaster_llm_call_duration_seconds Durée des appels au modèle (derniers appels pour les quantiles)",
+            "# TYPE notemaster_llm_call_duration_seconds summary",
+        ]
+        for row in self.summary():
+            if not row["calls"]:
+                continue
+            operation = row["operation"]
+            for quantile in ("p50", "p95", "p99"):
+                lines.append(
+                    f'notemaster_llm_call_duration_seconds{{operation="{operation}",quantile="0.{quantile[1:]}"}} {row[quantile]:.6f}'
+                )
+            lines.append(f'notemaster_llm_call_duration_seconds_sum{{operation="{operation}"}} {by_operation[operation]["duration"]:.6f}')
+            lines.append(f'notemaster_llm_call_duration_seconds_count{{operation="{operation}"}} {by_operation[operation]["calls"]}')
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
@@ -1,26 +1,234 @@
 import os
-from config import NOTES_DIR  
+import json
+import time
+import hashlib
+import logging
+import threading
+from types import SimpleNamespace
+from collections import OrderedDict
+from config import STORAGE_BACKEND, NOTE_CONTENT_CACHE_SIZE
+from utils import database, workspace
+from utils.cache import invalidate_note_questions
+from utils import search_index
+from utils.persistence import atomic_write_json, atomic_write_text, file_lock, remove_locked_file
+
+# Index des notes (titre, taille, date de modification, empreinte du contenu), persisté sur
+# disque et tenu à jour par de simples appels à stat : lister les notes ne lit aucun contenu.
+# Les notes, l'index et les caches sont ceux de l'espace de travail actif (voir utils.workspace).
+
+_lock = threading.Lock()
+
+def _new_state():
+    return SimpleNamespace(
+        note_index=None,
+        # L'index a changé en mémoire (empreintes calculées à la lecture) sans être réécrit sur disque
+        index_dirty=False,
+        # Contenus récemment lus : {titre: (mtime_ns, taille, contenu)}, borné à NOTE_CONTENT_CACHE_SIZE
+        content_cache=OrderedDict(),
+        # Titres triés et date de modification du dossier des notes lors de leur lecture : tant
+        # que le dossier n'a pas changé, aucune note n'a été ajoutée, renommée ni supprimée
+        titles_cache=None,
+    )
+
+def _state():
+    return workspace.current().state("note_manager", _new_state)
+
+def _notes_dir():
+    return workspace.current().notes_dir
+
+def _note_index_file():
+    return os.path.join(workspace.current().cache_dir, "note_index.json")
+
+# En deçà de ce délai, une date de modification du dossier peut ne pas refléter un changement
+# survenu dans la même unité de temps du système de fichiers : le cache n'est pas utilisé
+_TITLES_CACHE_MIN_AGE_NS = 2 * 10**9
+
+def _content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def _note_path(title):
+    return os.path.join(_notes_dir(), f"{title}.txt")
+
+def _load_index():
+    state = _state()
+    if state.note_index is None:
+        state.note_index = {}
+        index_file = _note_index_file()
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, "r", encoding="utf-8") as file:
+                    state.note_index = json.load(file)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning("Index des notes illisible, il sera reconstruit : %s", e)
+    return state.note_index
+
+def _save_index():
+    state = _state()
+    state.index_dirty = False
+    atomic_write_json(_note_index_file(), state.note_index)
+
+def _index_entry(title, stat, content_hash=None):
+    return {"title": title, "size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": content_hash}
+
+def _remember_content(title, stat, content, persist=True):
+    """
+    Met en cache le contenu d'une note et met à jour son entrée dans l'index
+    :param persist: Si False, l'index n'est réécrit sur disque qu'au prochain list_notes
+                    ou à la prochaine écriture (évite une réécriture par note lue)
+    """
+    state = _state()
+    state.content_cache[title] = (stat.st_mtime_ns, stat.st_size, content)
+    state.content_cache.move_to_end(title)
+    while len(state.content_cache) > NOTE_CONTENT_CACHE_SIZE:
+        state.content_cache.popitem(last=False)
+    index = _load_index()
+    entry = _index_entry(title, stat, _content_hash(content))
+    if index.get(title) != entry:
+        index[title] = entry
+        if persist:
+            _save_index()
+        else:
+            state.index_dirty = True
+
+def _forget(title):
+    _state().content_cache.pop(title, None)
+    index = _load_index()
+    if index.pop(title, None) is not None:
+        _save_index()
+
+def list_notes():
+    """
+    Liste les notes sans lire leur contenu
+    :return: Liste de dictionnaires avec les clés 'title', 'size', 'mtime' et 'hash', triée par titre
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return database.list_notes()
+    notes_dir = _notes_dir()
+    if not os.path.exists(notes_dir):
+        os.makedirs(notes_dir)
+    with _lock:
+        index = _load_index()
+        seen = set()
+        changed = False
+        with os.scandir(notes_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".txt") or not entry.is_file():
+                    continue
+                title = entry.name[:-len(".txt")]
+                seen.add(title)
+                stat = entry.stat()
+                known = index.get(title)
+                if known is None or known["mtime"] != stat.st_mtime_ns or known["size"] != stat.st_size:
+                    # Fichier nouveau ou modifié hors de l'application : empreinte recalculée à la lecture
+                    index[title] = _index_entry(title, stat)
+                    changed = True
+        for title in set(index) - seen:
+            del index[title]
+            changed = True
+        if changed or _state().index_dirty:
+            _save_index()
+        return [dict(index[title]) for title in sorted(seen)]
+
+def _note_titles():
+    """
+    Titres des notes triés, relus seulement si le dossier a changé. À appeler avec _lock.
+    """
+    state, notes_dir = _state(), _notes_dir()
+    try:
+        directory_mtime = os.stat(notes_dir).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    if (
+        state.titles_cache is not None
+        and state.titles_cache[0] == directory_mtime
+        and time.time_ns() - directory_mtime > _TITLES_CACHE_MIN_AGE_NS
+    ):
+        return state.titles_cache[1]
+    with os.scandir(notes_dir) as entries:
+        titles = sorted(
+            entry.name[:-len(".txt")] for entry in entries if entry.name.endswith(".txt") and entry.is_file()
+        )
+    state.titles_cache = (directory_mtime, titles)
+    return titles
+
+def list_note_titles(offset=0, limit=None):
+    """
+    Liste une page de titres de notes, sans examiner chaque fichier
+    :param offset: Nombre de titres à sauter
+    :param limit: Nombre maximal de titres retournés (tous si None)
+    :return: Liste de titres, triée
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return database.list_note_titles(offset, limit)
+    with _lock:
+        titles = _note_titles()
+    return titles[offset:None if limit is None else offset + limit]
+
+def count_notes():
+    """
+    Nombre de notes
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return database.count_notes()
+    with _lock:
+        return len(_note_titles())
+
+def get_note_content(title):
+    """
+    Charge le contenu d'une note, en le servant depuis le cache s'il n'a pas changé sur le disque
+    :param title: Titre de la note
+    :return: Contenu de la note, ou None si elle n'existe pas
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return database.get_note_content(title)
+    filepath = _note_path(title)
+    with _lock:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            _forget(title)
+            return None
+        content_cache = _state().content_cache
+        cached = content_cache.get(title)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            content_cache.move_to_end(title)
+            return cached[2]
+        with open(filepath, "r", encoding="utf-8") as file:
+            content = file.read()
+        _remember_content(title, stat, content, persist=False)
+        return content
 
 def load_notes():
-    notes = []
-    if not os.path.exists(NOTES_DIR):
-        os.makedirs(NOTES_DIR)
-    for filename in os.listdir(NOTES_DIR):
-        if filename.endswith(".txt"):
-            with open(os.path.join(NOTES_DIR, filename), "r") as file:
-                notes.append({"title": filename.replace(".txt", ""), "content": file.read()})
-    return notes
+    if STORAGE_BACKEND == "sqlite":
+        return database.load_notes()
+    return [{"title": note["title"], "content": get_note_content(note["title"])} for note in list_notes()]
 
 def save_note(title, content):
-    if not os.path.exists(NOTES_DIR):
-        os.makedirs(NOTES_DIR)
-    with open(os.path.join(NOTES_DIR, f"{title}.txt"), "w") as file:
-        file.write(content)
+    if STORAGE_BACKEND == "sqlite":
+        version = database.save_note(title, content)
+        search_index.index_note(title, content, version)
+        return
+    if not os.path.exists(_notes_dir()):
+        os.makedirs(_notes_dir())
+    filepath = _note_path(title)
+    with _lock, file_lock(filepath):
+        atomic_write_text(filepath, content)
+        stat = os.stat(filepath)
+        _remember_content(title, stat, content)
+    search_index.index_note(title, content, [stat.st_size, stat.st_mtime_ns])
 
 def delete_note(title):
-    filepath = os.path.join(NOTES_DIR, f"{title}.txt")
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    if STORAGE_BACKEND == "sqlite":
+        database.delete_note(title)
+        invalidate_note_questions(title)
+        search_index.remove_note(title)
+        return
+    filepath = _note_path(title)
+    with _lock, file_lock(filepath):
+        remove_locked_file(filepath)
+        _forget(title)
+    invalidate_note_questions(title)
+    search_index.remove_note(title)
 
 def update_note(title, new_content):
     """
@@ -29,9 +237,20 @@ def update_note(title, new_content):
     :param new_content: Nouveau contenu
     :return: True si la mise à jour est réussie, False sinon
     """
-    filepath = os.path.join(NOTES_DIR, f"{title}.txt")
-    if os.path.exists(filepath):
-        with open(filepath, "w") as file:
-            file.write(new_content)
+    if STORAGE_BACKEND == "sqlite":
+        version = database.update_note(title, new_content)
+        if version is None:
+            return False
+        invalidate_note_questions(title)
+        search_index.index_note(title, new_content, version)
         return True
-    return False
+    filepath = _note_path(title)
+    with _lock, file_lock(filepath):
+        if not os.path.exists(filepath):
+            return False
+        atomic_write_text(filepath, new_content)
+        stat = os.stat(filepath)
+        _remember_content(title, stat, new_content)
+    invalidate_note_questions(title)
+    search_index.index_note(title, new_content, [stat.st_size, stat.st_mtime_ns])
+    return True
@@ -0,0 +1,220 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from config import CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrous limités au processus
+    fcntl = None
+
+# Écritures sûres pour tous les fichiers de l'application :
+# - écriture atomique (fichier temporaire dans le même dossier, fsync, puis rename) : un
+#   plantage laisse l'ancienne ou la nouvelle version du fichier, jamais un fichier tronqué ;
+# - verrou consultatif par fichier : plusieurs sessions Streamlit, ou plusieurs processus,
+#   peuvent écrire le même fichier sans perdre de mises à jour. Le fichier de verrou est
+#   supprimé avec le fichier qu'il protège (voir remove_locked_file).
+
+# Fichiers de verrou, regroupés à part pour ne pas encombrer les dossiers de données
+LOCKS_DIR = os.path.join(CACHE_DIR, "locks")
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+# Profondeur d'imbrication des verrous tenus par le thread courant : {chemin: profondeur}
+_held = threading.local()
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(path, threading.RLock())
+
+def _ensure_parent(path):
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+def _lock_path(path):
+    """
+    Fichier de verrou d'un fichier (chemin absolu)
+    """
+    return os.path.join(LOCKS_DIR, hashlib.sha1(path.encode("utf-8")).hexdigest() + ".lock")
+
+def _acquire_lock_file(path, blocking):
+    """
+    Ouvre et verrouille le fichier de verrou d'un fichier. Si le fichier de verrou a été
+    supprimé pendant l'attente (voir remove_locked_file), le verrou est repris sur le nouveau.
+    :return: Fichier de verrou ouvert et verrouillé, ou None si blocking est False et que le
+             verrou est déjà tenu ailleurs
+    """
+    os.makedirs(LOCKS_DIR, exist_ok=True)
+    lock_path = _lock_path(path)
+    while True:
+        lock_file = open(lock_path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        try:
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+@contextmanager
+def file_lock(path):
+    """
+    Verrou exclusif sur un fichier, partagé entre les threads et entre les processus.
+    Réentrant dans un même thread.
+    :param path: Fichier à protéger
+    """
+    path = os.path.abspath(path)
+    thread_lock = _thread_lock(path)
+    with thread_lock:
+        # Le verrou de fichier n'est pris qu'au premier niveau (verrou réentrant dans le thread)
+        depths = _held.__dict__.setdefault("depths", {})
+        depth = depths.get(path, 0)
+        depths[path] = depth + 1
+        lock_file = None
+        try:
+            if depth == 0 and fcntl is not None:
+                lock_file = _acquire_lock_file(path, blocking=True)
+            yield
+        finally:
+            depths[path] = depth
+            if lock_file is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+
+@contextmanager
+def try_file_lock(path):
+    """
+    Verrou exclusif non bloquant sur un fichier, tenu pendant tout le bloc (par exemple le
+    temps d'une tâche de fond), partagé entre les threads et entre les processus
+    :param path: Fichier à protéger
+    :return: True si le verrou a été obtenu, False s'il est déjà tenu ailleurs
+    """
+    path = os.path.abspath(path)
+    thread_lock = _thread_lock(path)
+    if not thread_lock.acquire(blocking=False):
+        yield False
+        return
+    lock_file = None
+    try:
+        if fcntl is not None:
+            lock_file = _acquire_lock_file(path, blocking=False)
+            if lock_file is None:
+                yield False
+                return
+        yield True
+    finally:
+        if lock_file is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+        thread_lock.release()
+
+def remove_locked_file(path):
+    """
+    Supprime un fichier et son fichier de verrou, pour ne pas laisser de verrous orphelins.
+    À appeler dans le bloc file_lock(path) : les processus en attente reprennent le verrou
+    sur un nouveau fichier de verrou.
+    :return: True si le fichier existait
+    """
+    existed = os.path.exists(path)
+    if existed:
+        os.remove(path)
+    if fcntl is not None:
+        try:
+            os.remove(_lock_path(os.path.abspath(path)))
+        except FileNotFoundError:
+            pass
+    return existed
+
+def _fsync_directory(path):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(path, data):
+    """
+    Remplace le contenu d'un fichier de façon atomique
+    """
+    _ensure_parent(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(path)
+
+def atomic_write_text(path, text):
+    """
+    Remplace le contenu d'un fichier texte (UTF-8) de façon atomique
+    """
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+def atomic_write_json(path, data, **dump_options):
+    """
+    Remplace le contenu d'un fichier JSON de façon atomique
+    :param dump_options: Options de json.dumps (indent, separators...)
+    """
+    dump_options.setdefault("ensure_ascii", False)
+    atomic_write_text(path, json.dumps(data, **dump_options))
+
+def read_json(path, default=None):
+    """
+    Lit un fichier JSON
+    :return: Contenu du fichier, ou default s'il n'existe pas
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return default
+
+def update_json(path, update, default=None, **dump_options):
+    """
+    Lecture-modification-écriture d'un fichier JSON sous verrou : deux écrivains simultanés
+    ne peuvent pas s'écraser mutuellement leurs mises à jour
+    :param update: Fonction qui reçoit le contenu actuel (ou default) et retourne le nouveau contenu
+    :return: Nouveau contenu
+    """
+    with file_lock(path):
+        data = update(read_json(path, default))
+        atomic_write_json(path, data, **dump_options)
+        return data
+
+def append_lines(path, lines):
+    """
+    Ajoute des lignes à la fin d'un fichier sous verrou, avec une seule synchronisation disque.
+    Si une écriture précédente interrompue a laissé une ligne incomplète, un retour à la ligne
+    est ajouté avant les nouvelles lignes.
+    :param lines: Lignes à ajouter, sans retour à la ligne final
+    """
+    if not lines:
+        return
+    text = "".join(line + "\n" for line in lines)
+    _ensure_parent(path)
+    with file_lock(path):
+        with open(path, "ab") as file:
+            if file.tell() > 0:
+                with open(path, "rb") as reader:
+                    reader.seek(-1, os.SEEK_END)
+                    if reader.read(1) != b"\n":
+                        text = "\n" + text
+            file.write(text.encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
@@ -0,0 +1,97 @@
+import logging
+import numpy as np
+from config import PREGRADE_VERBATIM_SIMILARITY, PREGRADE_VERBATIM_KEYWORD_RECALL
+from utils.text import fold_accents, tokenize
+
+# Pré-correction locale, avant tout appel au modèle : les cas évidents (réponse vide,
+# réponse quasi identique à la réponse correcte) sont notés directement. Les mesures sont
+# calculées pour tout le quiz d'un coup, sur des matrices TF-IDF construites sur ses réponses.
+
+# Réponses qui équivalent à une absence de réponse (comparées sans accents ni ponctuation)
+NO_ANSWER_PHRASES = frozenset({
+    "je ne sais pas",
+    "je sais pas",
+    "sais pas",
+    "jsp",
+    "aucune idee",
+    "pas d idee",
+    "je ne me souviens pas",
+    "idk",
+})
+
+def _is_no_answer(user_answer):
+    words = tokenize(user_answer, keep_stopwords=True)
+    return not tokenize(user_answer) or " ".join(words) in NO_ANSWER_PHRASES
+
+def _tfidf_matrices(correct_tokens, user_tokens):
+    """
+    Construit les matrices TF-IDF (normalisées) des réponses correctes et des réponses de
+    l'étudiant, sur un vocabulaire et des fréquences de documents communs au quiz
+    :return: Couple (matrice des réponses correctes, matrice des réponses de l'étudiant)
+    """
+    vocabulary = {}
+    for tokens in correct_tokens + user_tokens:
+        for token in tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+
+    counts = np.zeros((len(correct_tokens) + len(user_tokens), max(1, len(vocabulary))))
+    for row, tokens in enumerate(correct_tokens + user_tokens):
+        for token in tokens:
+            counts[row, vocabulary[token]] += 1
+
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(counts)) / (1 + document_frequency)) + 1
+    weights = counts * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    weights = np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+    return weights[:len(correct_tokens)], weights[len(correct_tokens):]
+
+def similarity_scores(items):
+    """
+    Mesure la proximité de chaque réponse avec la réponse correcte
+    :param items: Liste de dictionnaires avec les clés 'user_answer' et 'correct_answer'
+    :return: Couple de tableaux (similarité cosinus TF-IDF, part des mots-clés de la réponse
+             correcte présents dans la réponse), dans l'ordre de items
+    """
+    correct_tokens = [tokenize(item["correct_answer"]) for item in items]
+    user_tokens = [tokenize(item["user_answer"]) for item in items]
+    correct_weights, user_weights = _tfidf_matrices(correct_tokens, user_tokens)
+
+    cosine = (correct_weights * user_weights).sum(axis=1)
+    correct_keywords, user_keywords = correct_weights > 0, user_weights > 0
+    keyword_counts = correct_keywords.sum(axis=1)
+    recall = np.divide(
+        (correct_keywords & user_keywords).sum(axis=1),
+        keyword_counts,
+        out=np.zeros(len(items)),
+        where=keyword_counts > 0,
+    )
+    return cosine, recall
+
+def pregrade(items):
+    """
+    Note localement les réponses évidentes
+    :param items: Liste de dictionnaires avec les clés 'question', 'user_answer' et 'correct_answer'
+    :return: Liste alignée sur items : {"score": X, "source": "local"} pour une réponse notée
+             localement, None pour une réponse à faire évaluer par le modèle
+    """
+    if not items:
+        return []
+
+    cosine, recall = similarity_scores(items)
+    evaluations = []
+    for index, item in enumerate(items):
+        if _is_no_answer(item["user_answer"]):
+            evaluations.append({"score": 0, "source": "local"})
+        elif (
+            fold_accents(item["user_answer"]).split() == fold_accents(item["correct_answer"]).split()
+            or (cosine[index] >= PREGRADE_VERBATIM_SIMILARITY and recall[index] >= PREGRADE_VERBATIM_KEYWORD_RECALL)
+        ):
+            evaluations.append({"score": 5, "source": "local"})
+        else:
+            evaluations.append(None)
+
+    local_count = sum(evaluation is not None for evaluation in evaluations)
+    if local_count:
+        logging.info("Pré-correction locale : %d réponse(s) sur %d notées sans appel à l'API", local_count, len(items))
+    return evaluations
@@ -0,0 +1,123 @@
+import re
+import zlib
+import hashlib
+import logging
+import numpy as np
+from config import QUESTION_SHINGLE_SIZE, QUESTION_MINHASH_PERMUTATIONS, QUESTION_LSH_BANDS, QUESTION_DUPLICATE_THRESHOLD
+from utils.text import tokenize, stem
+
+# Banque de questions d'une note : chaque génération y est fusionnée au lieu de remplacer les
+# questions existantes. Une question nouvelle trop proche d'une question de la banque (même
+# question reformulée, ponctuation ou accords différents) est écartée ; les autres reçoivent
+# un identifiant permanent, utilisé par l'historique et le planning des révisions.
+#
+# Les quasi-doublons sont cherchés par MinHash : chaque question est réduite à une signature
+# dont deux composantes sont égales avec une probabilité égale à la similarité de Jaccard des
+# fragments (mots et suites de mots) des deux questions. Les signatures sont découpées en
+# bandes (LSH) : seules les questions partageant au moins une bande sont comparées exactement.
+
+# Nombre premier supérieur à 2^32 : les permutations sont h -> (a * h + b) mod p
+_PRIME = 4294967311
+_random = np.random.default_rng(0)
+_A = _random.integers(1, 2**32, size=QUESTION_MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _random.integers(0, 2**32, size=QUESTION_MINHASH_PERMUTATIONS, dtype=np.uint64)
+_ROWS_PER_BAND = QUESTION_MINHASH_PERMUTATIONS // QUESTION_LSH_BANDS
+
+def question_key(note_title, question_text):
+    """
+    Identifiant stable d'une question : note et texte normalisé (casse et ponctuation ignorées)
+    """
+    normalized = re.sub(r"[\W_]+", " ", question_text.casefold()).strip()
+    return hashlib.sha256(f"{note_title}\n{normalized}".encode("utf-8")).hexdigest()[:24]
+
+def shingles(text, size=QUESTION_SHINGLE_SIZE):
+    """
+    Fragments d'une question : suites de 1 à `size` mots consécutifs du texte normalisé (mots
+    vides retirés, pluriels ramenés au singulier, accents et ponctuation ignorés). Sur des
+    textes aussi courts, un mot-clé différent suffit à séparer deux questions.
+    :return: Ensemble de fragments
+    """
+    # Une question faite uniquement de mots vides garde tous ses mots
+    words = [stem(token) for token in tokenize(text)] or tokenize(text, keep_stopwords=True) or [""]
+    return {
+        " ".join(words[start:start + length])
+        for length in range(1, size + 1)
+        for start in range(len(words) - length + 1)
+    }
+
+def minhash_signature(fragments):
+    """
+    Signature MinHash d'un ensemble de fragments
+    :return: Tableau de QUESTION_MINHASH_PERMUTATIONS entiers
+    """
+    hashes = np.fromiter((zlib.crc32(fragment.encode("utf-8")) for fragment in fragments), dtype=np.uint64)
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+class LSHIndex:
+    """
+    Index des signatures par bande : retrouve les questions susceptibles d'être proches
+    """
+    def __init__(self):
+        self.buckets = {}
+
+    def _bands(self, signature):
+        for band in range(QUESTION_LSH_BANDS):
+            yield band, signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND].tobytes()
+
+    def add(self, key, signature):
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, []).append(key)
+
+    def candidates(self, signature):
+        """
+        Clés des signatures partageant au moins une bande avec la signature donnée
+        """
+        found = set()
+        for band in self._bands(signature):
+            found.update(self.buckets.get(band, ()))
+        return found
+
+def with_ids(note_title, questions):
+    """
+    Complète les questions d'un identifiant (banques enregistrées avant l'ajout des identifiants)
+    """
+    return [
+        question if "id" in question else {"id": question_key(note_title, question["text"]), **question}
+        for question in questions
+    ]
+
+def merge_questions(note_title, bank, new_questions, threshold=QUESTION_DUPLICATE_THRESHOLD):
+    """
+    Fusionne des questions générées dans la banque d'une note. Les questions de la banque
+    gardent leur texte et leur identifiant ; les nouvelles questions qui ne sont proches
+    d'aucune question (de la banque ou de la même génération) y sont ajoutées.
+    :param bank: Questions de la banque (ou None)
+    :param new_questions: Questions générées
+    :param threshold: Similarité de Jaccard à partir de laquelle deux questions sont des doublons
+    :return: Couple (banque fusionnée, nombre de questions ajoutées)
+    """
+    merged = with_ids(note_title, bank or [])
+    index, fragments = LSHIndex(), {}
+    for position, question in enumerate(merged):
+        fragments[position] = shingles(question["text"])
+        index.add(position, minhash_signature(fragments[position]))
+
+    added = 0
+    for question in new_questions:
+        question_fragments = shingles(question["text"])
+        signature = minhash_signature(question_fragments)
+        if any(jaccard(question_fragments, fragments[candidate]) >= threshold for candidate in index.candidates(signature)):
+            continue
+        position = len(merged)
+        merged.append({"id": question_key(note_title, question["text"]), **question})
+        fragments[position] = question_fragments
+        index.add(position, signature)
+        added += 1
+    if len(new_questions) > added:
+        logging.info("%d doublon(s) écarté(s) de la banque de questions de : %s", len(new_questions) - added, note_title)
+    return merged, added
@@ -2,74 +2,341 @@ import os
 import re
 import json
 import logging
-from openai import OpenAI
-from dotenv import load_dotenv
-from config import QUESTIONS_DIR, QUESTIONS_FILE
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    GRADING_MAX_CONCURRENCY,
+    GRADING_BATCH_MODE,
+    GRADING_BATCH_TOKEN_BUDGET,
+    GENERATION_CHUNK_TOKEN_BUDGET,
+    GENERATION_MAX_CONCURRENCY,
+    PREGRADE_ENABLED,
+    LLM_LOG_RAW_RESPONSES,
+)
+from utils import llm_client, workspace
+from utils.llm_client import LLMError, LLMResponseError
+from utils.cache import generation_cache, generation_cache_key, grading_cache, grading_cache_key
+from utils.question_store import save_note_questions
+from utils.persistence import atomic_write_json
+from utils.pregrader import pregrade
+from utils.metrics import registry as metrics, bind_context
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# Barème commun à la correction unitaire et à la correction groupée
+GRADING_RULES = (
+    "Règles d'évaluation:\n"
+    "- Une réponse courte mais qui contient les éléments essentiels mérite une très bonne note\n"
+    "- Si les mots-clés principaux sont présents, la note doit être élevée (4 ou 5)\n"
+    "- La forme de la réponse importe moins que le fond\n"
+    "- Une réponse concise et précise vaut autant qu'une réponse détaillée\n"
+)
 
-# Load environment variables
-load_dotenv()
+def _generation_prompt(note_content):
+    return (
+        f"À partir de ce texte, crée des questions relativement ouvertes qui permettent l'apprentissage actif. "
+        f"Tu choisiras un nombre de questions adéquat en fonction de la longueur du texte.\n"
+        f"Pour chaque question, retourne un JSON avec deux clés : "
+        f"'text' pour la question et 'reponse' pour la réponse correcte.\n"
+        f"Texte : {note_content}\n"
+        f"Retourne uniquement du JSON, rien d'autre."
+    )
 
-# Configuration API
-api_key = os.getenv("DEEPSEEK_KEY")
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=api_key,
-)
+class QuestionStreamParser:
+    """
+    Analyseur JSON incrémental : reçoit le texte de la réponse morceau par morceau et
+    extrait chaque objet question dès qu'il est complet, sans attendre la fin du tableau.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        """
+        Ajoute un morceau de texte
+        :return: Liste des questions complètes trouvées dans ce morceau
+        """
+        self._buffer += chunk
+        questions = []
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._stack:
+                self._in_string = True
+            elif char in "[{":
+                self._stack.append((char, self._position))
+            elif char in "]}" and self._stack:
+                opening, start = self._stack.pop()
+                # Un objet directement contenu dans un tableau est une question candidate
+                if char == "}" and opening == "{" and self._stack and self._stack[-1][0] == "[":
+                    question = self._parse_question(self._buffer[start:self._position + 1])
+                    if question is not None:
+                        questions.append(question)
+            self._position += 1
+
+        # Le texte qui précède l'objet le plus externe encore ouvert n'est plus utile
+        if not self._stack:
+            self._buffer, self._position = "", 0
+        return questions
+
+    @staticmethod
+    def _parse_question(text):
+        try:
+            question = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(question, dict) and "text" in question and "reponse" in question:
+            return question
+        return None
 
-def generate_questions(note_title, note_content):
+def get_cached_questions(note_content):
+    """
+    Retourne les questions déjà générées pour ce contenu de note, sans appel à l'API
+    :param note_content: Contenu de la note
+    :return: Liste des questions, ou None si le contenu n'a jamais été traité
+    """
+    return generation_cache().get(generation_cache_key(note_content))
+
+def _request_questions(note_content, note_title=None):
+    """
+    Demande à l'API des questions pour un texte
+    :param note_title: Note concernée, pour les mesures
+    :return: Liste des questions générées
+    """
+    generated_text = llm_client.complete(
+        [{"role": "user", "content": _generation_prompt(note_content)}],
+        operation="generate",
+        note=note_title,
+    )
+
+    # Vérification de la réponse (réponse brute journalisée uniquement sur demande)
+    if LLM_LOG_RAW_RESPONSES:
+        logging.info("Réponse brute de l'API : %s", generated_text)
+    generated_text = generated_text.strip()
+    if generated_text.startswith("```json") and generated_text.endswith("```"):
+        generated_text = generated_text.strip("```json").strip("```")
+    if not generated_text:
+        raise LLMResponseError("Réponse vide retournée par l'API.")
+
+    # Chargement du JSON
+    try:
+        questions = json.loads(generated_text)
+    except json.JSONDecodeError as json_err:
+        logging.error("Erreur lors de l'analyse du JSON : %s", json_err)
+        raise LLMResponseError("La réponse de l'API n'est pas un JSON valide.")
+    return questions
+
+def split_note(note_content, token_budget=GENERATION_CHUNK_TOKEN_BUDGET):
+    """
+    Découpe une note en sections qui tiennent dans le budget de tokens, en coupant de
+    préférence aux titres puis entre les paragraphes
+    :param note_content: Contenu de la note
+    :param token_budget: Budget approximatif de tokens par section
+    :return: Liste des sections
+    """
+    paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", note_content) if paragraph.strip()]
+
+    # Un paragraphe trop long est découpé par lignes, puis par phrases
+    blocks = []
+    for paragraph in paragraphs:
+        if _estimate_tokens(paragraph) <= token_budget:
+            blocks.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            if _estimate_tokens(line) <= token_budget:
+                blocks.append(line)
+            else:
+                blocks.extend(sentence for sentence in re.split(r"(?<=[.!?])\s+", line) if sentence)
+
+    chunks, current, current_tokens = [], [], 0
+    for block in blocks:
+        block_tokens = _estimate_tokens(block)
+        is_heading = block.lstrip().startswith("#")
+        if current and (
+            current_tokens + block_tokens > token_budget
+            or (is_heading and current_tokens >= token_budget // 2)
+        ):
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += block_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def _question_key(question):
+    return re.sub(r"[\W_]+", " ", question["text"].casefold()).strip()
+
+def _valid_questions(questions):
+    """
+    Questions exploitables d'une réponse du modèle (dictionnaires avec 'text' et 'reponse')
+    """
+    return [
+        question for question in (questions if isinstance(questions, list) else [])
+        if isinstance(question, dict) and "text" in question and "reponse" in question
+    ]
+
+def _iter_section_questions(sections, note_title=None, max_concurrency=GENERATION_MAX_CONCURRENCY):
+    """
+    Génère les questions des sections en parallèle
+    :return: Générateur de couples (indice de la section, questions), dans l'ordre de fin des
+             appels. Fermer le générateur annule les sections restantes.
+    """
+    failures = 0
+    abandoned = False
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(sections))))
+    try:
+        futures = {
+            executor.submit(bind_context(_request_questions), section, note_title): index
+            for index, section in enumerate(sections)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                questions = future.result()
+            except Exception as e:
+                failures += 1
+                logging.error("Erreur lors de la génération des questions de la section %d : %s", index + 1, e)
+                continue
+            yield index, _valid_questions(questions)
+    except GeneratorExit:
+        # Flux abandonné par l'appelant : les sections pas encore commencées sont annulées et
+        # les appels en cours ne sont pas attendus
+        abandoned = True
+        raise
+    finally:
+        executor.shutdown(wait=not abandoned, cancel_futures=abandoned)
+    if failures == len(sections):
+        raise LLMError("La génération a échoué pour toutes les sections de la note.")
+
+def _merge_section_questions(section_questions):
+    """
+    Fusionne les questions des sections dans l'ordre de la note, sans doublons
+    :param section_questions: Dictionnaire {indice de la section: questions}
+    """
+    merged, seen = [], set()
+    for index in sorted(section_questions):
+        for question in section_questions[index]:
+            key = _question_key(question)
+            if key not in seen:
+                seen.add(key)
+                merged.append(question)
+    return merged
+
+def generate_questions(note_title, note_content, force=False):
     """
     Génère des questions à partir du contenu des notes en utilisant l'API DeepSeek.
+    Si le contenu de la note n'a pas changé depuis la dernière génération, les questions
+    sont servies depuis le cache sans appel à l'API. Une note longue est découpée en
+    sections traitées en parallèle, puis les questions sont fusionnées sans doublons.
     :param note_title: Titre de la note
     :param note_content: Contenu de la note
+    :param force: Si True, ignore le cache et régénère les questions
     :return: Une liste de questions générées
+    :raises LLMError: si l'appel échoue ou si la réponse ne contient aucune question valide
     """
-    try:
-        prompt = (
-            f"À partir de ce texte, crée des questions relativement ouvertes qui permettent l'apprentissage actif. "
-            f"Tu choisiras un nombre de questions adéquat en fonction de la longueur du texte.\n"
-            f"Pour chaque question, retourne un JSON avec deux clés : "
-            f"'text' pour la question et 'reponse' pour la réponse correcte.\n"
-            f"Texte : {note_content}\n"
-            f"Retourne uniquement du JSON, rien d'autre."
-        )
+    cache_key = generation_cache_key(note_content)
+    if not force:
+        questions = generation_cache().get(cache_key)
+        if questions:
+            logging.info("Questions servies depuis le cache pour : %s", note_title)
+            metrics.record_cache_hit("generate", note=note_title)
+            save_note_questions(note_title, questions, content_hash=cache_key)
+            return questions
 
-        # Envoyer la requête à l'API
-        response = client.chat.completions.create(
-            extra_body={},
-            model="deepseek/deepseek-chat",
-            messages=[
-                {"role": "user", "content": prompt},
-            ],
-        )
+    sections = split_note(note_content)
+    if len(sections) <= 1:
+        questions = _valid_questions(_request_questions(note_content, note_title))
+    else:
+        logging.info("Note découpée en %d sections : %s", len(sections), note_title)
+        questions = _merge_section_questions(dict(_iter_section_questions(sections, note_title)))
+    if not questions:
+        raise LLMResponseError("La réponse de l'API ne contient aucune question valide.")
 
-        # Vérification de la réponse
-        logging.info("Réponse brute de l'API : %s", response)
-        generated_text = response.choices[0].message.content.strip()
-        if generated_text.startswith("```json") and generated_text.endswith("```"):
-            generated_text = generated_text.strip("```json").strip("```")
-        if not generated_text:
-            raise ValueError("Réponse vide retournée par l'API.")
+    # Sauvegarder les questions
+    save_note_questions(note_title, questions, content_hash=cache_key)
+    generation_cache().set(cache_key, questions, tag=note_title)
+    return questions
 
-        # Chargement du JSON
+def stream_questions(note_title, note_content, force=False):
+    """
+    Génère des questions en flux : chaque question est retournée dès que l'API l'a produite.
+    Les questions déjà reçues sont sauvegardées même si le flux est interrompu ; seul un
+    jeu de questions complet est mis en cache.
+    :param note_title: Titre de la note
+    :param note_content: Contenu de la note
+    :param force: Si True, ignore le cache et régénère les questions
+    :return: Générateur de questions
+    """
+    cache_key = generation_cache_key(note_content)
+    if not force:
+        cached_questions = generation_cache().get(cache_key)
+        if cached_questions:
+            logging.info("Questions servies depuis le cache pour : %s", note_title)
+            metrics.record_cache_hit("generate", note=note_title)
+            save_note_questions(note_title, cached_questions, content_hash=cache_key)
+            yield from cached_questions
+            return
+
+    sections = split_note(note_content)
+    if len(sections) > 1:
+        # Note longue : les sections sont générées en parallèle et leurs questions
+        # retournées dès qu'une section est terminée
+        logging.info("Note découpée en %d sections : %s", len(sections), note_title)
+        section_questions = {}
+        seen = set()
+        section_results = _iter_section_questions(sections, note_title)
         try:
-            questions = json.loads(generated_text)
-        except json.JSONDecodeError as json_err:
-            logging.error("Erreur lors de l'analyse du JSON : %s", json_err)
-            raise ValueError("La réponse de l'API n'est pas un JSON valide.")
-
-        # Sauvegarder les questions dans un fichier JSON
-        json_file_path = os.path.join(QUESTIONS_DIR, f"{note_title}.json")
-        with open(json_file_path, "w") as file:
-            json.dump(questions, file, indent=4, ensure_ascii=False)
-        logging.info("Questions sauvegardées dans : %s", json_file_path)
-        return questions
+            for index, questions in section_results:
+                section_questions[index] = questions
+                for question in questions:
+                    key = _question_key(question)
+                    if key not in seen:
+                        seen.add(key)
+                        yield question
+        finally:
+            # Flux interrompu : les sections restantes sont annulées avant la sauvegarde partielle
+            section_results.close()
+            questions = _merge_section_questions(section_questions)
+            if questions:
+                complete = len(section_questions) == len(sections)
+                save_note_questions(note_title, questions, content_hash=cache_key if complete else None)
+                if complete:
+                    generation_cache().set(cache_key, questions, tag=note_title)
+        return
 
-    except Exception as e:
-        logging.error("Erreur lors de la génération des questions : %s", e)
-        return []
+    questions = []
+    completed = False
+    try:
+        parser = QuestionStreamParser()
+        for delta in llm_client.stream(
+            [{"role": "user", "content": _generation_prompt(note_content)}],
+            operation="generate",
+            note=note_title,
+        ):
+            for question in parser.feed(delta):
+                questions.append(question)
+                yield question
+        completed = True
+    finally:
+        if questions:
+            save_note_questions(note_title, questions, content_hash=cache_key if completed else None)
+            if completed:
+                generation_cache().set(cache_key, questions, tag=note_title)
+            else:
+                logging.warning("Flux interrompu, %d question(s) partielle(s) sauvegardée(s) pour : %s", len(questions), note_title)
+        elif completed:
+            raise LLMResponseError("La réponse de l'API ne contient aucune question valide.")
+
+def _questions_file():
+    return os.path.join(workspace.current().questions_dir, "questions.json")
 
 def save_questions(questions):
     """
@@ -77,11 +344,8 @@ def save_questions(questions):
     :param questions: Liste des questions
     """
     try:
-        if not os.path.exists(os.path.dirname(QUESTIONS_FILE)):
-            os.makedirs(os.path.dirname(QUESTIONS_FILE))
-        with open(QUESTIONS_FILE, "w") as file:
-            json.dump(questions, file, indent=4)
-        logging.info("Questions sauvegardées dans le fichier principal : %s", QUESTIONS_FILE)
+        atomic_write_json(_questions_file(), questions, indent=4, ensure_ascii=True)
+        logging.info("Questions sauvegardées dans le fichier principal : %s", _questions_file())
     except Exception as e:
         logging.error("Erreur lors de la sauvegarde des questions : %s", e)
 
@@ -91,65 +355,230 @@ def load_questions():
     :return: Liste des questions
     """
     try:
-        if os.path.exists(QUESTIONS_FILE):
-            with open(QUESTIONS_FILE, "r") as file:
+        questions_file = _questions_file()
+        if os.path.exists(questions_file):
+            with open(questions_file, "r", encoding="utf-8") as file:
                 return json.load(file)
     except Exception as e:
         logging.error("Erreur lors du chargement des questions : %s", e)
     return []
 
+def _is_valid_score(score):
+    """
+    Un score est un nombre entre 0 et 5
+    """
+    return not isinstance(score, bool) and isinstance(score, (int, float)) and 0 <= score <= 5
+
 def evaluate_answer(question, user_answer, correct_answer):
     """
-    Évalue la réponse de l'utilisateur en utilisant l'API
+    Évalue la réponse de l'utilisateur en utilisant l'API.
+    Une réponse déjà évaluée (aux espaces près) est servie depuis le cache de correction.
+    :return: Dictionnaire {"score": X}, X étant la note donnée par le modèle
+    :raises LLMError: si l'appel échoue ou si la réponse du modèle est inexploitable
     """
+    cache_key = grading_cache_key(question, correct_answer, user_answer)
+    cached_evaluation = grading_cache().get(cache_key)
+    # Les scores invalides mis en cache avant leur vérification sont ignorés
+    if cached_evaluation is not None and _is_valid_score(cached_evaluation.get("score")):
+        metrics.record_cache_hit("grade")
+        return cached_evaluation
+
+    prompt = (
+        f"Tu es un professeur qui évalue une réponse d'étudiant de manière bienveillante.\n"
+        f"Question: {question}\n"
+        f"Réponse correcte: {correct_answer}\n"
+        f"Réponse de l'étudiant: {user_answer}\n\n"
+        f"{GRADING_RULES}\n"
+        f"Retourne UNIQUEMENT un JSON valide avec ce format exact: {{\"score\": X}} où X est un nombre entre 0 et 5.\n"
+        f"Utilise les guillemets doubles pour la clé \"score\"."
+    )
+
+    raw_content = llm_client.complete([{"role": "user", "content": prompt}], operation="grade")
+
+    # Nettoyage plus robuste du JSON
+    cleaned_content = re.sub(r"^```json\s*|\s*```$", "", raw_content.strip(), flags=re.MULTILINE)
+    
+    # Correction des guillemets simples en doubles si nécessaire
+    cleaned_content = cleaned_content.replace("'", '"')
+    
     try:
-        prompt = (
-            f"Tu es un professeur qui évalue une réponse d'étudiant de manière bienveillante.\n"
-            f"Question: {question}\n"
-            f"Réponse correcte: {correct_answer}\n"
-            f"Réponse de l'étudiant: {user_answer}\n\n"
-            f"Règles d'évaluation:\n"
-            f"- Une réponse courte mais qui contient les éléments essentiels mérite une très bonne note\n"
-            f"- Si les mots-clés principaux sont présents, la note doit être élevée (4 ou 5)\n"
-            f"- La forme de la réponse importe moins que le fond\n"
-            f"- Une réponse concise et précise vaut autant qu'une réponse détaillée\n\n"
-            f"Retourne UNIQUEMENT un JSON valide avec ce format exact: {{\"score\": X}} où X est un nombre entre 0 et 5.\n"
-            f"Utilise les guillemets doubles pour la clé \"score\"."
-        )
+        evaluation = json.loads(cleaned_content)
+    except json.JSONDecodeError:
+        # Si le parsing échoue, tentative de correction du format
+        score_match = re.search(r'score["\']?\s*:\s*(\d+)', cleaned_content)
+        if not score_match:
+            raise LLMResponseError(f"La réponse d'évaluation n'est pas un JSON valide : {raw_content[:200]}")
+        evaluation = {"score": int(score_match.group(1))}
+
+    if not isinstance(evaluation, dict) or "score" not in evaluation:
+        raise LLMResponseError("Le JSON retourné ne contient pas la clé 'score'")
+    if not _is_valid_score(evaluation["score"]):
+        raise LLMResponseError(f"Score invalide retourné par l'API : {evaluation['score']!r}")
+
+    evaluation = {"score": evaluation["score"]}
+    grading_cache().set(cache_key, evaluation)
+    return evaluation
+
+def _estimate_tokens(text):
+    """
+    Estimation grossière du nombre de tokens d'un texte (environ 4 caractères par token)
+    """
+    return len(text) // 4 + 1
+
+def _format_batch_item(index, item):
+    return (
+        f"[{index}]\n"
+        f"Question: {item['question']}\n"
+        f"Réponse correcte: {item['correct_answer']}\n"
+        f"Réponse de l'étudiant: {item['user_answer']}\n"
+    )
+
+def _chunk_items(items, token_budget):
+    """
+    Découpe les réponses en groupes dont le prompt tient dans le budget de tokens
+    :return: Liste de groupes, chaque groupe étant une liste d'indices dans items
+    """
+    base_tokens = _estimate_tokens(GRADING_RULES) + 100
+    chunks, current, current_tokens = [], [], base_tokens
+    for index, item in enumerate(items):
+        item_tokens = _estimate_tokens(_format_batch_item(index, item))
+        if current and current_tokens + item_tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(index)
+        current_tokens += item_tokens
+    if current:
+        chunks.append(current)
+    return chunks
 
-        response = client.chat.completions.create(
-            extra_body={},
-            model="deepseek/deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
+def _parse_batch_scores(raw_content, indices):
+    """
+    Extrait les scores d'une réponse de correction groupée
+    :return: Dictionnaire {indice: score} ne contenant que les scores valides
+    """
+    cleaned_content = re.sub(r"^```json\s*|\s*```$", "", raw_content.strip(), flags=re.MULTILINE)
+    try:
+        evaluations = json.loads(cleaned_content)
+    except json.JSONDecodeError:
+        logging.error("La correction groupée n'a pas retourné un JSON valide")
+        return {}
+    if not isinstance(evaluations, list):
+        return {}
+
+    scores = {}
+    for evaluation in evaluations:
+        if not isinstance(evaluation, dict):
+            continue
+        index, score = evaluation.get("id"), evaluation.get("score")
+        if index in indices and _is_valid_score(score):
+            scores[index] = score
+    return scores
+
+def _evaluate_chunk(items, indices):
+    """
+    Évalue un groupe de réponses en une seule requête à l'API
+    :return: Dictionnaire {indice: score} pour les réponses correctement évaluées
+    """
+    try:
+        prompt = (
+            f"Tu es un professeur qui évalue des réponses d'étudiant de manière bienveillante.\n"
+            f"{GRADING_RULES}\n"
+            f"Réponses à évaluer:\n\n"
+            + "\n".join(_format_batch_item(index, items[index]) for index in indices)
+            + "\nRetourne UNIQUEMENT un tableau JSON valide avec un objet par réponse, au format exact: "
+            "[{\"id\": N, \"score\": X}] où N est le numéro entre crochets et X un nombre entre 0 et 5.\n"
+            "Utilise les guillemets doubles pour les clés."
         )
 
-        if not response or not response.choices:
-            raise ValueError("L'API n'a pas retourné de choix valides.")
+        raw_content = llm_client.complete([{"role": "user", "content": prompt}], operation="grade_batch")
+        return _parse_batch_scores(raw_content, set(indices))
 
-        raw_content = response.choices[0].message.content
-        if not raw_content:
-            raise ValueError("La réponse de l'API est vide.")
+    except Exception:
+        logging.exception("Erreur lors de la correction groupée")
+        return {}
 
-        # Nettoyage plus robuste du JSON
-        cleaned_content = re.sub(r"^```json\s*|\s*```$", "", raw_content.strip(), flags=re.MULTILINE)
-        
-        # Correction des guillemets simples en doubles si nécessaire
-        cleaned_content = cleaned_content.replace("'", '"')
-        
+def _evaluate_each(items, max_concurrency):
+    def _evaluate(item):
         try:
-            evaluation = json.loads(cleaned_content)
-        except json.JSONDecodeError:
-            # Si le parsing échoue, tentative de correction du format
-            score_match = re.search(r'score["\']?\s*:\s*(\d+)', cleaned_content)
-            if score_match:
-                return {"score": int(score_match.group(1))}
-            raise
+            return evaluate_answer(item["question"], item["user_answer"], item["correct_answer"])
+        except Exception as e:
+            # L'échec reste propre à cette question : pas de note, l'erreur est remontée à l'appelant
+            logging.error("Erreur lors de l'évaluation de la question %s : %s", item.get("question"), e)
+            return {"score": None, "error": str(e)}
 
-        if "score" not in evaluation:
-            raise ValueError("Le JSON retourné ne contient pas la clé 'score'")
+    if not items:
+        return []
 
-        return {"score": evaluation["score"]}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items)))) as executor:
+        # map conserve l'ordre des questions, quel que soit l'ordre de fin des appels
+        return list(executor.map(bind_context(_evaluate), items))
 
-    except Exception as e:
-        logging.exception("Erreur lors de l'évaluation de la réponse")
-        return {"score": 0}
\ No newline at end of file
+def evaluate_answers_batch(items, max_concurrency=GRADING_MAX_CONCURRENCY, token_budget=GRADING_BATCH_TOKEN_BUDGET):
+    """
+    Évalue plusieurs réponses en regroupant les questions dans une seule requête à l'API.
+    Le quiz est découpé en plusieurs requêtes si le budget de tokens est dépassé, et les
+    réponses dont le score est absent ou invalide sont réévaluées une par une.
+    :param items: Liste de dictionnaires avec les clés 'question', 'user_answer' et 'correct_answer'
+    :param max_concurrency: Nombre maximal d'appels simultanés à l'API
+    :param token_budget: Budget approximatif de tokens par requête
+    :return: Liste des évaluations, dans le même ordre que items
+    """
+    if not items:
+        return []
+
+    # Les réponses déjà évaluées sont servies depuis le cache de correction
+    cache_keys = [grading_cache_key(item["question"], item["correct_answer"], item["user_answer"]) for item in items]
+    scores = {}
+    for index, cache_key in enumerate(cache_keys):
+        cached_evaluation = grading_cache().get(cache_key)
+        if cached_evaluation is not None and _is_valid_score(cached_evaluation.get("score")):
+            metrics.record_cache_hit("grade_batch")
+            scores[index] = cached_evaluation["score"]
+
+    pending = [index for index in range(len(items)) if index not in scores]
+    chunks = [
+        [pending[position] for position in chunk]
+        for chunk in _chunk_items([items[index] for index in pending], token_budget)
+    ]
+    if chunks:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks)))) as executor:
+            chunk_scores = list(executor.map(bind_context(lambda indices: _evaluate_chunk(items, indices)), chunks))
+
+        for chunk_result in chunk_scores:
+            for index, score in chunk_result.items():
+                grading_cache().set(cache_keys[index], {"score": score})
+            scores.update(chunk_result)
+
+    missing = [index for index in range(len(items)) if index not in scores]
+    if missing:
+        logging.warning("Correction groupée incomplète, %d réponse(s) réévaluée(s) une par une", len(missing))
+        fallback = _evaluate_each([items[index] for index in missing], max_concurrency)
+    else:
+        fallback = []
+    fallback_results = dict(zip(missing, fallback))
+
+    return [
+        {"score": scores[index]} if index in scores else fallback_results[index]
+        for index in range(len(items))
+    ]
+
+def evaluate_answers(items, max_concurrency=GRADING_MAX_CONCURRENCY, batch=GRADING_BATCH_MODE, pregrade_locally=PREGRADE_ENABLED):
+    """
+    Évalue plusieurs réponses en parallèle, avec un nombre limité d'appels simultanés
+    :param items: Liste de dictionnaires avec les clés 'question', 'user_answer' et 'correct_answer'
+    :param max_concurrency: Nombre maximal d'appels simultanés à l'API
+    :param batch: Si True, regroupe les réponses dans une seule requête (voir evaluate_answers_batch)
+    :param pregrade_locally: Si True, les réponses évidentes sont notées localement (voir utils.pregrader)
+    :return: Liste des évaluations, dans le même ordre que items. Une évaluation en échec
+             vaut {"score": None, "error": message}, une évaluation locale contient "source": "local"
+    """
+    evaluations = pregrade(items) if pregrade_locally else [None] * len(items)
+    pending = [index for index, evaluation in enumerate(evaluations) if evaluation is None]
+    pending_items = [items[index] for index in pending]
+    if batch:
+        model_evaluations = evaluate_answers_batch(pending_items, max_concurrency)
+    else:
+        model_evaluations = _evaluate_each(pending_items, max_concurrency)
+    for index, evaluation in zip(pending, model_evaluations):
+        evaluations[index] = evaluation
+    return evaluations
@@ -0,0 +1,100 @@
+import os
+import json
+import logging
+from config import STORAGE_BACKEND, QUESTION_SOURCES_FILENAME
+from utils import database, search_index, workspace
+from utils.persistence import file_lock, read_json, remove_locked_file, update_json
+from utils.question_bank import merge_questions, with_ids
+
+# Banque de questions de chaque note : les générations successives y sont fusionnées sans
+# doublons (voir utils.question_bank), et chaque question garde son identifiant. L'empreinte
+# du contenu dont la banque a été générée est enregistrée avec elle (voir is_stale dans utils.jobs).
+
+def _questions_path(note_title):
+    return os.path.join(workspace.current().questions_dir, f"{note_title}.json")
+
+def _sources_path():
+    return os.path.join(workspace.current().questions_dir, QUESTION_SOURCES_FILENAME)
+
+def _set_source(note_title, content_hash):
+    """
+    Enregistre (ou oublie, si content_hash est None) l'empreinte source d'une banque
+    """
+    def update(sources):
+        if content_hash is None:
+            sources.pop(note_title, None)
+        else:
+            sources[note_title] = content_hash
+        return sources
+    update_json(_sources_path(), update, default={}, indent=4)
+
+def load_questions_source(note_title):
+    """
+    Empreinte du contenu dont la banque de questions d'une note a été générée
+    :return: Empreinte (voir utils.cache.generation_cache_key), ou None si elle est inconnue
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return database.load_questions_source(note_title)
+    return read_json(_sources_path(), {}).get(note_title)
+
+def load_note_questions(note_title):
+    """
+    Charge la banque de questions d'une note
+    :param note_title: Titre de la note
+    :return: Liste des questions (clés 'id', 'text' et 'reponse'), ou None si aucune question n'a été générée
+    """
+    if STORAGE_BACKEND == "sqlite":
+        questions = database.load_questions(note_title)
+    else:
+        json_file_path = _questions_path(note_title)
+        if not os.path.exists(json_file_path):
+            return None
+        with open(json_file_path, "r", encoding="utf-8") as file:
+            questions = json.load(file)
+    return with_ids(note_title, questions) if questions is not None else None
+
+def save_note_questions(note_title, questions, content_hash=None):
+    """
+    Fusionne des questions générées dans la banque de questions d'une note, sous verrou : les
+    questions déjà présentes (ou presque identiques) ne sont pas ajoutées une seconde fois
+    :param note_title: Titre de la note
+    :param questions: Liste des questions générées
+    :param content_hash: Empreinte du contenu dont les questions ont été générées, pour une
+                         génération complète (si None, l'empreinte enregistrée est conservée)
+    :return: Nombre de questions ajoutées à la banque
+    """
+    added = 0
+
+    def merge(bank):
+        nonlocal added
+        bank, added = merge_questions(note_title, bank, questions)
+        return bank
+
+    if STORAGE_BACKEND == "sqlite":
+        bank = database.update_questions(note_title, merge, content_hash)
+    else:
+        os.makedirs(workspace.current().questions_dir, exist_ok=True)
+        json_file_path = _questions_path(note_title)
+        bank = update_json(json_file_path, merge, indent=4)
+        if content_hash is not None:
+            _set_source(note_title, content_hash)
+        logging.info("Questions sauvegardées dans : %s", json_file_path)
+    search_index.index_questions(note_title, bank)
+    return added
+
+def delete_note_questions(note_title):
+    """
+    Supprime le jeu de questions d'une note
+    :return: True si des questions ont été supprimées, False sinon
+    """
+    if STORAGE_BACKEND == "sqlite":
+        deleted = database.delete_questions(note_title)
+    else:
+        json_file_path = _questions_path(note_title)
+        with file_lock(json_file_path):
+            deleted = remove_locked_file(json_file_path)
+            if deleted:
+                _set_source(note_title, None)
+    if deleted:
+        search_index.index_questions(note_title, None)
+    return deleted
@@ -0,0 +1,104 @@
+import os
+import time
+import threading
+from datetime import date
+from config import LLM_BACKEND, USER_RATE_PER_MINUTE, USER_RATE_MAX_WAIT, USER_DAILY_TOKEN_QUOTA, INSTANCE_RATE_PER_MINUTE
+from utils import workspace
+from utils.persistence import read_json, update_json
+
+# Limites d'appels au modèle : débit de la génération groupée (voir utils.jobs) et, en mode
+# multi-utilisateur, débit et consommation quotidienne de tokens de chaque utilisateur.
+# L'espace de travail par défaut (mode mono-utilisateur) n'a pas de limite par utilisateur.
+# Les appels faits avec la clé de l'instance passent en plus par un limiteur commun, pour
+# que N utilisateurs sans clé ne la sollicitent pas N fois plus vite.
+
+# Nombre de jours de consommation conservés dans le fichier de chaque utilisateur
+USAGE_HISTORY_DAYS = 31
+
+class RateLimiter:
+    """
+    Limiteur de débit à seau de jetons, partagé entre les threads.
+    Un débit nul ou négatif signifie « sans limite ».
+    """
+
+    def __init__(self, rate_per_minute):
+        self.unlimited = rate_per_minute <= 0
+        self.capacity = max(1, rate_per_minute)
+        self.tokens = float(self.capacity)
+        self.refill_rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1, max_wait=None):
+        """
+        Attend que le nombre de jetons demandé soit disponible
+        :param max_wait: Attente maximale en secondes (None : sans limite)
+        :return: True si les jetons ont été pris, False si l'attente aurait dépassé max_wait
+        """
+        if self.unlimited:
+            return True
+        tokens = min(tokens, self.capacity)
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.refill_rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+# Limiteur commun à toutes les sessions du processus pour la clé de l'instance
+_instance_limiter = RateLimiter(INSTANCE_RATE_PER_MINUTE)
+
+def _usage_file():
+    return os.path.join(workspace.current().cache_dir, "usage.json")
+
+def _user_limiter():
+    return workspace.current().state("quotas", lambda: RateLimiter(USER_RATE_PER_MINUTE))
+
+def _uses_instance_key():
+    """
+    Indique si l'utilisateur actif appelle le modèle avec la clé de l'instance
+    """
+    if LLM_BACKEND == "openrouter":
+        return not workspace.current().api_key(inherit=False)
+    return LLM_BACKEND == "local"
+
+def tokens_used_today():
+    """
+    Tokens consommés aujourd'hui par l'utilisateur de l'espace de travail actif
+    """
+    return read_json(_usage_file(), {}).get(date.today().isoformat(), 0)
+
+def acquire_call():
+    """
+    Réserve un appel au modèle (une tentative) pour l'utilisateur actif
+    :return: None si l'appel est autorisé, sinon le motif du refus
+    """
+    if workspace.current().user is None:
+        return None
+    if USER_DAILY_TOKEN_QUOTA and tokens_used_today() >= USER_DAILY_TOKEN_QUOTA:
+        return f"Quota quotidien de {USER_DAILY_TOKEN_QUOTA} tokens atteint, réessayez demain."
+    if not _user_limiter().acquire(max_wait=USER_RATE_MAX_WAIT):
+        return f"Limite de {USER_RATE_PER_MINUTE} appels par minute atteinte, réessayez dans un instant."
+    if _uses_instance_key() and not _instance_limiter.acquire(max_wait=USER_RATE_MAX_WAIT):
+        return f"Limite de {INSTANCE_RATE_PER_MINUTE} appels par minute de la clé partagée atteinte, réessayez dans un instant."
+    return None
+
+def record_usage(tokens):
+    """
+    Ajoute des tokens à la consommation du jour de l'utilisateur actif
+    """
+    if workspace.current().user is None or not tokens:
+        return
+
+    def add(usage):
+        today = date.today().isoformat()
+        usage[today] = usage.get(today, 0) + tokens
+        return {day: usage[day] for day in sorted(usage)[-USAGE_HISTORY_DAYS:]}
+    update_json(_usage_file(), add, default={})
@@ -0,0 +1,361 @@
+import os
+import json
+import uuid
+import heapq
+import logging
+import threading
+from contextlib import nullcontext
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from config import STORAGE_BACKEND, REVIEW_INITIAL_EASE, REVIEW_MIN_EASE, REVIEW_MAX_INTERVAL, REVIEW_SESSION_SIZE
+from utils import database, workspace
+from utils.persistence import append_lines, atomic_write_text, file_lock, read_json, remove_locked_file
+from utils.question_bank import question_key
+
+# Révisions espacées (algorithme SM-2) : chaque question déjà travaillée a un état (facilité,
+# intervalle, date de la prochaine révision), mis à jour en O(1) à chaque réponse notée.
+# Les questions à réviser sont tirées d'une file de priorité ordonnée par date d'échéance.
+# Une question est identifiée par son identifiant dans la banque de questions de la note ;
+# les tentatives plus anciennes, sans identifiant, par leur texte (voir question_key).
+# Chaque espace de travail a son planning (voir utils.workspace).
+#
+# Stockage en fichier : journal en ajout seul, une ligne JSON par état modifié (la dernière
+# ligne d'une question l'emporte) ou par question oubliée ({"key": ..., "removed": true}).
+# La première ligne porte un identifiant de génération, renouvelé à chaque compaction : un
+# processus qui a déjà lu le journal n'en relit que la fin, et relit tout après une compaction.
+
+SCHEDULE_LOG = "_review_schedule.jsonl"
+LEGACY_SCHEDULE_FILE = "_review_schedule.json"
+# Le journal est compacté (une ligne par question) quand il dépasse ce nombre de lignes et
+# compte plus de deux lignes par question
+SCHEDULE_COMPACT_MIN_LINES = 1000
+
+_lock = threading.Lock()
+
+def _new_state():
+    return SimpleNamespace(
+        # États de révision : {clé de la question: état}
+        states=None,
+        # File de priorité (échéance, clé) ; les entrées périmées sont ignorées à la lecture
+        due_heap=[],
+        # Journal (stockage en fichier) : génération lue, position de lecture et nombre de lignes
+        log_generation=None,
+        log_position=0,
+        log_lines=0,
+    )
+
+def _state():
+    return workspace.current().state("scheduler", _new_state)
+
+def _schedule_file():
+    return os.path.join(workspace.current().stats_dir, SCHEDULE_LOG)
+
+def _legacy_schedule_file():
+    return os.path.join(workspace.current().stats_dir, LEGACY_SCHEDULE_FILE)
+
+def _write_lock():
+    """
+    Verrou des mises à jour du planning : en stockage fichier, le journal est relu puis
+    complété sous le même verrou, pour ne pas calculer un état à partir d'une version périmée
+    """
+    return file_lock(_schedule_file()) if STORAGE_BACKEND != "sqlite" else nullcontext()
+
+def attempt_key(note_title, attempt):
+    """
+    Clé d'une tentative dans le planning : identifiant de la question, ou à défaut son texte
+    """
+    return attempt.get("question_id") or question_key(note_title, attempt["question"])
+
+def next_state(state, note_title, question, reponse, score, reviewed_at, key=None):
+    """
+    Applique l'algorithme SM-2 à une réponse notée
+    :param state: État actuel de la question, ou None pour une première révision
+    :param score: Note de la réponse, entre 0 et 5
+    :param reviewed_at: Date de la réponse (chaîne ISO)
+    :param key: Clé de la question (par défaut, calculée depuis son texte)
+    :return: Nouvel état
+    """
+    quality = max(0, min(5, round(score)))
+    ease = state["ease"] if state else REVIEW_INITIAL_EASE
+    repetitions = state["repetitions"] if state else 0
+    interval = state["interval"] if state else 0
+    if quality >= 3:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = min(REVIEW_MAX_INTERVAL, round(interval * ease))
+        repetitions += 1
+    else:
+        repetitions = 0
+        interval = 1
+    ease = max(REVIEW_MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    due = datetime.fromisoformat(reviewed_at) + timedelta(days=interval)
+    return {
+        "key": key or question_key(note_title, question),
+        "note_title": note_title,
+        "question": question,
+        "reponse": reponse,
+        "ease": ease,
+        "interval": interval,
+        "repetitions": repetitions,
+        "due": due.isoformat(),
+        "last_review": reviewed_at,
+        "last_score": score,
+    }
+
+def _apply(note_title, attempts):
+    """
+    Met à jour les états en mémoire avec des tentatives (dans l'ordre chronologique)
+    :return: États modifiés
+    """
+    schedule, changed = _state(), {}
+    for attempt in attempts:
+        key = attempt_key(note_title, attempt)
+        state = next_state(
+            schedule.states.get(key), note_title, attempt["question"], attempt["correct_answer"],
+            attempt["score"], attempt["timestamp"], key=key,
+        )
+        schedule.states[key] = changed[key] = state
+        heapq.heappush(schedule.due_heap, (state["due"], key))
+    return list(changed.values())
+
+def _dumps(entry):
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+def _sync_log():
+    """
+    Applique les lignes ajoutées au journal depuis la dernière lecture, par ce processus ou par
+    un autre ; relit tout le journal s'il a été compacté entre-temps
+    :return: False si le journal n'existe pas
+    """
+    schedule = _state()
+    try:
+        with open(_schedule_file(), "rb") as f:
+            header = f.readline()
+            try:
+                generation = json.loads(header)["generation"]
+            except (ValueError, KeyError, TypeError):
+                generation = None
+            if generation is None or generation != schedule.log_generation:
+                schedule.states, schedule.due_heap = {}, []
+                schedule.log_generation, schedule.log_position, schedule.log_lines = generation, len(header), 0
+            f.seek(schedule.log_position)
+            data = f.read()
+    except FileNotFoundError:
+        if schedule.log_generation is not None:
+            # Planning supprimé par un autre processus
+            schedule.states, schedule.due_heap = {}, []
+            schedule.log_generation = None
+        return False
+
+    # Une ligne incomplète (écriture interrompue) est ignorée
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            logging.warning("Ligne invalide ignorée dans le planning des révisions")
+            continue
+        if entry.get("removed"):
+            schedule.states.pop(entry["key"], None)
+        else:
+            schedule.states[entry["key"]] = entry
+            heapq.heappush(schedule.due_heap, (entry["due"], entry["key"]))
+        schedule.log_lines += 1
+    schedule.log_position += end
+    return True
+
+def _compact():
+    """
+    Réécrit le journal avec une ligne par question, sous une nouvelle génération. À appeler
+    avec le verrou du journal.
+    """
+    schedule = _state()
+    generation = uuid.uuid4().hex
+    header = _dumps({"generation": generation}) + "\n"
+    atomic_write_text(_schedule_file(), header + "".join(_dumps(state) + "\n" for state in schedule.states.values()))
+    schedule.log_generation = generation
+    schedule.log_position = os.path.getsize(_schedule_file())
+    schedule.log_lines = len(schedule.states)
+
+def _save(changed_states, replace=False, removed_keys=()):
+    """
+    Enregistre les états modifiés. Pour le stockage en fichier, les changements sont ajoutés
+    à la fin du journal, à appeler avec _write_lock() après _ensure_loaded().
+    """
+    if STORAGE_BACKEND == "sqlite":
+        database.save_review_states(changed_states, replace=replace)
+        return
+    schedule = _state()
+    if replace or schedule.log_generation is None:
+        _compact()
+        return
+    entries = [{"key": key, "removed": True} for key in removed_keys] + list(changed_states)
+    append_lines(_schedule_file(), [_dumps(entry) for entry in entries])
+    # Le verrou du journal est tenu : la fin du fichier est celle des lignes ajoutées
+    schedule.log_position = os.path.getsize(_schedule_file())
+    schedule.log_lines += len(entries)
+    if schedule.log_lines > max(SCHEDULE_COMPACT_MIN_LINES, 2 * len(schedule.states)):
+        _compact()
+
+def _migrate_legacy_schedule():
+    """
+    Convertit l'ancien planning _review_schedule.json en journal
+    :return: True si un ancien planning a été converti
+    """
+    legacy_file = _legacy_schedule_file()
+    if not os.path.exists(legacy_file):
+        return False
+    try:
+        states = read_json(legacy_file)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error("Ancien planning des révisions illisible, il sera reconstruit : %s", e)
+        states = None
+    if states is None:
+        os.remove(legacy_file)
+        return False
+    schedule = _state()
+    schedule.states = states
+    schedule.due_heap = [(state["due"], key) for key, state in states.items()]
+    heapq.heapify(schedule.due_heap)
+    _compact()
+    os.remove(legacy_file)
+    return True
+
+def _rebuild():
+    """
+    Reconstruit le planning en rejouant tout l'historique des tentatives. À appeler avec _lock.
+    """
+    # Import local : stats_manager met à jour le planning à chaque quiz enregistré
+    from utils.stats_manager import get_all_stats
+
+    schedule = _state()
+    schedule.states, schedule.due_heap = {}, []
+    for note_title, note_stats in get_all_stats().items():
+        _apply(note_title, sorted(note_stats["attempts"], key=lambda attempt: attempt["timestamp"]))
+    with _write_lock():
+        _save(list(schedule.states.values()), replace=True)
+    logging.info("Planning des révisions reconstruit : %d questions", len(schedule.states))
+
+def _ensure_loaded():
+    """
+    Charge le planning au premier appel ; en stockage fichier, applique ensuite à chaque appel
+    les changements écrits par les autres processus. À appeler avec _lock.
+    """
+    schedule = _state()
+    if STORAGE_BACKEND == "sqlite":
+        if schedule.states is not None:
+            return
+        states = database.load_review_states()
+        if not states and database.notes_with_attempts():
+            _rebuild()
+            return
+        schedule.states = states
+        schedule.due_heap = [(state["due"], key) for key, state in states.items()]
+        heapq.heapify(schedule.due_heap)
+        return
+
+    first_load = schedule.states is None
+    if _sync_log() or not first_load:
+        return
+    with _write_lock():
+        if _migrate_legacy_schedule() or _sync_log():
+            return
+    _rebuild()
+
+def load_schedule():
+    """
+    Charge le planning, en le reconstruisant depuis l'historique s'il n'existe pas encore
+    """
+    with _lock:
+        _ensure_loaded()
+
+def record_results(note_title, attempts):
+    """
+    Met à jour le planning avec les réponses notées d'un quiz
+    :param note_title: Titre de la note
+    :param attempts: Liste de dictionnaires avec les clés 'timestamp', 'question', 'correct_answer' et 'score'
+    """
+    record_session({note_title: attempts})
+
+def record_session(attempts_by_note):
+    """
+    Met à jour le planning avec les réponses d'une soumission, en une seule écriture
+    :param attempts_by_note: Dictionnaire {titre de la note: tentatives}
+    """
+    with _lock, _write_lock():
+        _ensure_loaded()
+        changed = []
+        for note_title, attempts in attempts_by_note.items():
+            changed.extend(_apply(note_title, attempts))
+        _save(changed)
+
+def get_due_questions(limit=REVIEW_SESSION_SIZE, now=None, note_titles=None):
+    """
+    Questions à réviser, toutes notes confondues, de la plus en retard à la moins en retard
+    :param limit: Nombre maximal de questions
+    :param now: Date de référence (par défaut, maintenant)
+    :param note_titles: Si fourni, seules les questions de ces notes sont retenues
+    :return: Liste d'états (clés 'note_title', 'question', 'reponse', 'due'...)
+    """
+    now = (now or datetime.now()).isoformat()
+    with _lock:
+        _ensure_loaded()
+        schedule = _state()
+        due, kept = [], []
+        while schedule.due_heap and schedule.due_heap[0][0] <= now and len(due) < limit:
+            entry = heapq.heappop(schedule.due_heap)
+            state = schedule.states.get(entry[1])
+            # Entrée périmée : la question a été revue (nouvelle échéance) ou supprimée
+            if state is None or state["due"] != entry[0]:
+                continue
+            kept.append(entry)
+            if note_titles is None or state["note_title"] in note_titles:
+                due.append(dict(state))
+        for entry in kept:
+            heapq.heappush(schedule.due_heap, entry)
+    return due
+
+def count_due(now=None):
+    """
+    Nombre de questions dont la révision est due
+    """
+    now = (now or datetime.now()).isoformat()
+    with _lock:
+        _ensure_loaded()
+        return sum(1 for state in _state().states.values() if state["due"] <= now)
+
+def delete_note_schedule(note_title):
+    """
+    Oublie le planning des questions d'une note
+    """
+    with _lock, _write_lock():
+        _ensure_loaded()
+        states = _state().states
+        removed_keys = [key for key, state in states.items() if state["note_title"] == note_title]
+        for key in removed_keys:
+            del states[key]
+        if STORAGE_BACKEND == "sqlite":
+            database.delete_review_states(note_title)
+        else:
+            _save([], removed_keys=removed_keys)
+
+def delete_all_schedules():
+    """
+    Oublie tout le planning des révisions
+    """
+    with _lock:
+        schedule = _state()
+        schedule.states, schedule.due_heap = {}, []
+        if STORAGE_BACKEND == "sqlite":
+            database.delete_review_states()
+        else:
+            schedule.log_generation = None
+            with _write_lock():
+                remove_locked_file(_schedule_file())
+                if os.path.exists(_legacy_schedule_file()):
+                    os.remove(_legacy_schedule_file())
@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import math
+import heapq
+import sqlite3
+import logging
+import argparse
+import threading
+from types import SimpleNamespace
+from collections import Counter
+from contextlib import closing
+from config import SEARCH_BM25_K1, SEARCH_BM25_B, SEARCH_RESULTS_LIMIT
+from utils import workspace
+from utils.text import fold_accents, tokenize, stem
+
+# Index de recherche plein texte (index inversé, classement BM25) sur le contenu des notes
+# et sur les questions générées (champs 'text' et 'reponse'). L'index est mis à jour à chaque
+# modification d'une note ou d'un jeu de questions et persisté sur disque (SQLite, seuls les
+# documents modifiés sont réécrits) : au démarrage, seules les notes modifiées hors de
+# l'application sont réindexées. Chaque espace de travail a son index.
+SEARCH_INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    title TEXT NOT NULL,
+    text TEXT,
+    terms TEXT NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS note_versions (
+    title TEXT PRIMARY KEY,
+    version TEXT
+);
+"""
+
+_lock = threading.Lock()
+
+def _new_state():
+    return SimpleNamespace(
+        # Documents indexés : {identifiant: {"kind", "title", "text", "terms": {terme: fréquence}, "length"}}
+        # "text" n'est conservé que pour les questions (les notes sont relues pour les extraits)
+        documents=None,
+        # Index inversé, reconstruit en mémoire au chargement : {terme: {identifiant: fréquence}}
+        postings=None,
+        # État des notes au moment de leur indexation : {titre: [taille, date de modification]}
+        note_versions=None,
+        # Identifiants des questions indexées de chaque note : {titre: [identifiants]}
+        question_ids=None,
+        total_length=0,
+        # Documents et notes modifiés depuis la dernière sauvegarde
+        dirty_documents=set(),
+        dirty_notes=set(),
+    )
+
+def _state():
+    """
+    Index de l'espace de travail actif (voir utils.workspace)
+    """
+    return workspace.current().state("search_index", _new_state)
+
+def _index_file():
+    return os.path.join(workspace.current().cache_dir, "search_index.sqlite3")
+
+def analyze(text):
+    """
+    Découpe un texte en termes d'index : minuscules, sans accents, sans mots vides, racinisés
+    """
+    return [stem(token) for token in tokenize(text)]
+
+def _note_id(title):
+    return f"note:{title}"
+
+def _question_id(title, position):
+    return f"question:{position}:{title}"
+
+def _add_document(doc_id, document):
+    index = _state()
+    index.documents[doc_id] = document
+    index.dirty_documents.add(doc_id)
+    index.total_length += document["length"]
+    if document["kind"] == "question":
+        index.question_ids.setdefault(document["title"], []).append(doc_id)
+    for term, frequency in document["terms"].items():
+        index.postings.setdefault(term, {})[doc_id] = frequency
+
+def _remove_document(doc_id):
+    index = _state()
+    document = index.documents.pop(doc_id, None)
+    if document is None:
+        return
+    index.dirty_documents.add(doc_id)
+    index.total_length -= document["length"]
+    for term in document["terms"]:
+        postings = index.postings.get(term)
+        if postings is not None:
+            postings.pop(doc_id, None)
+            if not postings:
+                del index.postings[term]
+
+def _make_document(kind, title, text, keep_text=False):
+    terms = analyze(text)
+    return {
+        "kind": kind,
+        "title": title,
+        "text": text if keep_text else None,
+        "terms": dict(Counter(terms)),
+        "length": len(terms),
+    }
+
+def _connect():
+    os.makedirs(os.path.dirname(_index_file()), exist_ok=True)
+    conn = sqlite3.connect(_index_file())
+    conn.executescript(SCHEMA)
+    return conn
+
+def _save(full=False):
+    """
+    Écrit sur disque les documents et les notes modifiés depuis la dernière sauvegarde
+    :param full: Si True, remplace tout le contenu du fichier (après une reconstruction)
+    """
+    index = _state()
+    with closing(_connect()) as conn, conn:
+        if full:
+            conn.execute("DELETE FROM documents")
+            conn.execute("DELETE FROM note_versions")
+        for doc_id in index.dirty_documents:
+            document = index.documents.get(doc_id)
+            if document is None:
+                conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (doc_id, kind, title, text, terms, length) VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, document["kind"], document["title"], document["text"],
+                     json.dumps(document["terms"], ensure_ascii=False), document["length"]),
+                )
+        for title in index.dirty_notes:
+            if title in index.note_versions:
+                conn.execute(
+                    "INSERT OR REPLACE INTO note_versions (title, version) VALUES (?, ?)",
+                    (title, json.dumps(index.note_versions[title])),
+                )
+            else:
+                conn.execute("DELETE FROM note_versions WHERE title = ?", (title,))
+        conn.execute(f"PRAGMA user_version = {SEARCH_INDEX_VERSION}")
+    index.dirty_documents.clear()
+    index.dirty_notes.clear()
+
+def _reset():
+    index = _state()
+    index.documents, index.postings, index.note_versions, index.question_ids, index.total_length = {}, {}, {}, {}, 0
+    index.dirty_documents.clear()
+    index.dirty_notes.clear()
+
+def _index_note(title, content, version=None):
+    index = _state()
+    _remove_document(_note_id(title))
+    _add_document(_note_id(title), _make_document("note", title, content))
+    index.note_versions[title] = version
+    index.dirty_notes.add(title)
+
+def _index_questions(title, questions):
+    index = _state()
+    for doc_id in index.question_ids.pop(title, []):
+        _remove_document(doc_id)
+    for position, question in enumerate(questions or []):
+        if isinstance(question, dict) and "text" in question:
+            text = f"{question['text']}\n{question.get('reponse', '')}"
+            _add_document(_question_id(title, position), _make_document("question", title, text, keep_text=True))
+
+def _forget_note(title):
+    index = _state()
+    _remove_document(_note_id(title))
+    _index_questions(title, [])
+    index.note_versions.pop(title, None)
+    index.dirty_notes.add(title)
+
+def _ensure_loaded():
+    """
+    Charge l'index depuis le disque au premier appel, puis réindexe les notes ajoutées,
+    modifiées ou supprimées depuis la dernière sauvegarde. À appeler avec _lock.
+    """
+    index = _state()
+    if index.documents is not None:
+        return
+    _reset()
+    loaded = False
+    if os.path.exists(_index_file()):
+        try:
+            with closing(_connect()) as conn:
+                if conn.execute("PRAGMA user_version").fetchone()[0] == SEARCH_INDEX_VERSION:
+                    for doc_id, kind, title, text, terms, length in conn.execute(
+                        "SELECT doc_id, kind, title, text, terms, length FROM documents"
+                    ):
+                        _add_document(doc_id, {"kind": kind, "title": title, "text": text, "terms": json.loads(terms), "length": length})
+                    for title, version in conn.execute("SELECT title, version FROM note_versions"):
+                        index.note_versions[title] = json.loads(version)
+                    loaded = True
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            logging.warning("Index de recherche illisible, il sera reconstruit : %s", e)
+            _reset()
+    if not loaded:
+        _reset()
+        _sync_notes()
+        _save(full=True)
+        return
+    index.dirty_documents.clear()
+    if _sync_notes():
+        _save()
+
+def _sync_notes():
+    """
+    Réindexe les notes dont la taille ou la date de modification a changé
+    :return: True si l'index a été modifié
+    """
+    index = _state()
+    # Import local : note_manager met à jour l'index à chaque modification d'une note
+    from utils.note_manager import list_notes, get_note_content
+    from utils.question_store import load_note_questions
+
+    notes = {note["title"]: [note["size"], note["mtime"]] for note in list_notes()}
+    changed = False
+    for title in set(index.note_versions) - set(notes):
+        _forget_note(title)
+        changed = True
+    for title, version in notes.items():
+        if index.note_versions.get(title) == version:
+            continue
+        content = get_note_content(title)
+        if content is None:
+            continue
+        _index_note(title, content, version)
+        _index_questions(title, load_note_questions(title))
+        changed = True
+    if changed:
+        logging.info("Index de recherche mis à jour (%d documents)", len(index.documents))
+    return changed
+
+def index_note(title, content, version=None):
+    """
+    Ajoute ou met à jour une note dans l'index
+    :param version: Taille et date de modification de la note, telles que retournées par
+                    list_notes ; si None, la note sera réindexée au prochain démarrage
+    """
+    try:
+        with _lock:
+            _ensure_loaded()
+            _index_note(title, content, version)
+            _save()
+    except Exception as e:
+        logging.error("Erreur lors de l'indexation de la note %s : %s", title, e)
+
+def remove_note(title):
+    """
+    Retire une note et ses questions de l'index
+    """
+    try:
+        with _lock:
+            _ensure_loaded()
+            _forget_note(title)
+            _save()
+    except Exception as e:
+        logging.error("Erreur lors de la désindexation de la note %s : %s", title, e)
+
+def index_questions(title, questions):
+    """
+    Remplace les questions d'une note dans l'index
+    :param questions: Liste des questions, ou None pour les retirer
+    """
+    try:
+        with _lock:
+            _ensure_loaded()
+            _index_questions(title, questions)
+            _save()
+    except Exception as e:
+        logging.error("Erreur lors de l'indexation des questions de %s : %s", title, e)
+
+def rebuild_index():
+    """
+    Reconstruit entièrement l'index à partir des notes et des questions enregistrées
+    :return: Nombre de documents indexés
+    """
+    index = _state()
+    with _lock:
+        _reset()
+        _sync_notes()
+        _save(full=True)
+        return len(index.documents)
+
+def _snippet(text, query_terms, width=160):
+    """
+    Extrait du texte autour du premier terme de la requête trouvé
+    """
+    folded = fold_accents(text)
+    positions = [folded.find(term) for term in query_terms if folded.find(term) >= 0]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    snippet = " ".join(text[start:start + width].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if start + width < len(text) else "")
+
+def search(query, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Recherche les notes et questions correspondant à une requête, classées par score BM25
+    :param query: Texte de la requête
+    :param limit: Nombre maximal de résultats
+    :return: Liste de dictionnaires avec les clés 'kind' ("note" ou "question"), 'title',
+             'score' et 'snippet', du plus pertinent au moins pertinent
+    """
+    index = _state()
+    query_terms = list(dict.fromkeys(analyze(query)))
+    if not query_terms:
+        return []
+
+    with _lock:
+        _ensure_loaded()
+        document_count = len(index.documents)
+        if not document_count:
+            return []
+        average_length = index.total_length / document_count or 1
+        scores = Counter()
+        for term in query_terms:
+            postings = index.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                length_norm = 1 - SEARCH_BM25_B + SEARCH_BM25_B * index.documents[doc_id]["length"] / average_length
+                scores[doc_id] += idf * frequency * (SEARCH_BM25_K1 + 1) / (frequency + SEARCH_BM25_K1 * length_norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        hits = [(doc_id, score, index.documents[doc_id]) for doc_id, score in best]
+
+    from utils.note_manager import get_note_content
+
+    results = []
+    for doc_id, score, document in hits:
+        text = document["text"] if document["kind"] == "question" else get_note_content(document["title"]) or ""
+        results.append({
+            "kind": document["kind"],
+            "title": document["title"],
+            "score": score,
+            "snippet": _snippet(text, tokenize(query)),
+        })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index de recherche des notes et des questions.")
+    parser.add_argument("--rebuild", action="store_true", help="reconstruit entièrement l'index")
+    parser.add_argument("--user", help="espace de travail de cet utilisateur (mode multi-utilisateur)")
+    parser.add_argument("query", nargs="*", help="requête à rechercher")
+    args = parser.parse_args(argv)
+
+    with workspace.activate(args.user):
+        if args.rebuild:
+            print(f"Index reconstruit : {rebuild_index()} documents")
+        if args.query:
+            for result in search(" ".join(args.query)):
+                print(f"{result['score']:6.2f}  [{result['kind']}] {result['title']} : {result['snippet']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
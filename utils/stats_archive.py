@@ -0,0 +1,396 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+import numpy as np
+from config import STORAGE_BACKEND, STATS_SUMMARY_LAST_N
+from utils import database, workspace
+from utils.persistence import atomic_write_json, file_lock, read_json
+
+# Archive en colonnes de l'historique des tentatives, pour les analyses. Chaque question (note,
+# texte, réponse correcte) n'est stockée qu'une fois ; les tentatives sont des colonnes numpy
+# (identifiant de question, horodatage, score) lisibles par projection en mémoire (mmap), et
+# les agrégats de la page Performances se calculent par opérations vectorisées.
+# Les journaux restent la source de vérité (réponses de l'utilisateur comprises) : l'archive en
+# est une projection, complétée à chaque synchronisation par les seules tentatives nouvelles.
+# Les colonnes (tableaux bruts) et les questions (une ligne JSON par question) ne font que
+# grandir : les nouvelles lignes sont ajoutées en fin de fichier, et le manifeste, écrit en
+# dernier, donne le nombre de lignes valides. Sans tentative nouvelle, une synchronisation ne
+# lit que le manifeste. Chaque espace de travail a son archive, dans son dossier de statistiques.
+ARCHIVE_VERSION = 2
+
+# Colonnes des tentatives : {nom: type numpy}
+COLUMNS = {
+    "question_ids": np.uint32,
+    "timestamps": "datetime64[us]",
+    "scores": np.float32,
+}
+# Colonne des questions : identifiant de note de chaque question
+QUESTION_NOTES_DTYPE = np.uint32
+
+_lock = threading.Lock()
+
+class StatsArchive:
+    """
+    Archive chargée : titres des notes, note de chaque question et colonnes des tentatives
+    (les textes des questions sont lus à la demande, voir load_questions)
+    """
+
+    def __init__(self, notes, question_notes, columns):
+        # Titres des notes, indexés par identifiant de note
+        self.notes = notes
+        # Identifiant de note de chaque question, indexé par identifiant de question
+        self.question_notes = question_notes
+        self.question_ids = columns["question_ids"]
+        self.timestamps = columns["timestamps"]
+        self.scores = columns["scores"]
+
+    def __len__(self):
+        return len(self.scores)
+
+    def note_ids(self):
+        """
+        Identifiant de note de chaque tentative
+        """
+        return self.question_notes[self.question_ids]
+
+def _archive_dir():
+    return os.path.join(workspace.current().stats_dir, "_archive")
+
+def _manifest_file():
+    return os.path.join(_archive_dir(), "manifest.json")
+
+def _notes_file():
+    return os.path.join(_archive_dir(), "notes.json")
+
+def _questions_file():
+    return os.path.join(_archive_dir(), "questions.jsonl")
+
+def _column_path(name):
+    return os.path.join(_archive_dir(), f"{name}.bin")
+
+def _column_sizes(manifest):
+    """
+    Taille valide de chaque fichier de colonne, en octets : {nom: (type, nombre de lignes)}
+    """
+    sizes = {name: (dtype, manifest["count"]) for name, dtype in COLUMNS.items()}
+    sizes["question_notes"] = (QUESTION_NOTES_DTYPE, manifest["question_count"])
+    return sizes
+
+def _load_manifest():
+    """
+    :return: Manifeste, ou None si l'archive est absente, d'une autre version ou incomplète
+    """
+    try:
+        manifest = read_json(_manifest_file())
+        if not manifest or manifest.get("version") != ARCHIVE_VERSION or manifest.get("backend") != STORAGE_BACKEND:
+            return None
+        for name, (dtype, count) in _column_sizes(manifest).items():
+            if os.path.getsize(_column_path(name)) < np.dtype(dtype).itemsize * count:
+                raise ValueError(f"colonne {name} incomplète")
+        if os.path.getsize(_questions_file()) < manifest["questions_size"]:
+            raise ValueError("questions incomplètes")
+        return manifest
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning("Archive des statistiques illisible, elle sera reconstruite : %s", e)
+        return None
+
+def _load_column(name, dtype, count, mmap):
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    if mmap:
+        return np.memmap(_column_path(name), dtype=dtype, mode="r", shape=(count,))
+    return np.fromfile(_column_path(name), dtype=dtype, count=count)
+
+def _load_notes(manifest):
+    return (read_json(_notes_file(), []) or [])[:manifest["note_count"]]
+
+def _iter_questions(manifest):
+    with open(_questions_file(), "rb") as f:
+        data = f.read(manifest["questions_size"])
+    for line in data.splitlines():
+        yield json.loads(line)
+
+def _append_bytes(path, size, data):
+    """
+    Ajoute des octets à un fichier de l'archive, après l'avoir ramené à sa taille valide (une
+    synchronisation interrompue peut avoir laissé des octets au-delà)
+    """
+    with open(path, "ab") as f:
+        f.truncate(size)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _read_new_file_attempts(sources):
+    """
+    Lit la fin des journaux de tentatives, à partir de la position atteinte à la dernière
+    synchronisation. Seules les lignes complètes sont lues (un ajout peut être en cours).
+    :param sources: {titre: [position, inode]} des journaux déjà archivés
+    :return: (liste de (titre, tentative), nouvelles sources), ou None si un journal a été
+             supprimé ou réécrit depuis (l'archive doit être reconstruite)
+    """
+    # Import local : stats_manager construit les résumés à partir de l'archive
+    from utils.stats_manager import STATS_LOG_SUFFIX
+
+    stats_dir = workspace.current().stats_dir
+    logs = {
+        filename[:-len(STATS_LOG_SUFFIX)]: os.path.join(stats_dir, filename)
+        for filename in (os.listdir(stats_dir) if os.path.exists(stats_dir) else [])
+        if filename.endswith(STATS_LOG_SUFFIX)
+    }
+    if set(sources) - set(logs):
+        return None
+    attempts, new_sources = [], {}
+    for note_title in sorted(logs):
+        stat = os.stat(logs[note_title])
+        offset, inode = sources.get(note_title, [0, stat.st_ino])
+        if inode != stat.st_ino or stat.st_size < offset:
+            return None
+        if stat.st_size > offset:
+            with open(logs[note_title], "rb") as f:
+                f.seek(offset)
+                data = f.read(stat.st_size - offset)
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    attempts.append((note_title, json.loads(line)))
+                except json.JSONDecodeError:
+                    logging.warning("Ligne invalide ignorée dans %s", logs[note_title])
+            offset += end
+        new_sources[note_title] = [offset, stat.st_ino]
+    return attempts, new_sources
+
+def _read_new_database_attempts(last_id, count):
+    """
+    :return: (liste de (titre, tentative), identifiant de la dernière tentative), ou None si
+             des tentatives archivées ont été supprimées depuis
+    """
+    if database.count_attempts(last_id) != count:
+        return None
+    rows = database.get_attempts_after(last_id)
+    return [(note_title, attempt) for _, note_title, attempt in rows], rows[-1][0] if rows else last_id
+
+def _append(notes, question_index, attempts):
+    """
+    Convertit des tentatives en lignes de l'archive, en dédupliquant notes et questions
+    :param notes: Titres des notes archivées, complétés sur place
+    :param question_index: {(note, texte, réponse correcte): identifiant}, complété sur place
+    :return: (nouvelles questions, nouvelles lignes de chaque colonne)
+    """
+    note_index = {note_title: position for position, note_title in enumerate(notes)}
+    new_questions, question_ids, timestamps, scores = [], [], [], []
+    for note_title, attempt in attempts:
+        note_id = note_index.get(note_title)
+        if note_id is None:
+            note_id = note_index[note_title] = len(notes)
+            notes.append(note_title)
+        key = (note_id, attempt["question"], attempt["correct_answer"])
+        question_id = question_index.get(key)
+        if question_id is None:
+            question_id = question_index[key] = len(question_index)
+            new_questions.append(list(key))
+        question_ids.append(question_id)
+        timestamps.append(attempt["timestamp"])
+        scores.append(attempt["score"])
+    return new_questions, {
+        "question_ids": np.array(question_ids, dtype=COLUMNS["question_ids"]),
+        "timestamps": np.array(timestamps, dtype=COLUMNS["timestamps"]),
+        "scores": np.array(scores, dtype=COLUMNS["scores"]),
+        "question_notes": np.array([question[0] for question in new_questions], dtype=QUESTION_NOTES_DTYPE),
+    }
+
+def sync_archive(rebuild=False):
+    """
+    Complète l'archive avec les tentatives enregistrées depuis la dernière synchronisation, ou
+    la reconstruit si l'historique a été supprimé ou réécrit entre-temps. À appeler via
+    stats_manager.get_stats_archive, qui migre d'abord les anciens fichiers de statistiques.
+    :param rebuild: Si True, reconstruit entièrement l'archive
+    :return: Nombre de tentatives ajoutées
+    """
+    with _lock, file_lock(_manifest_file()):
+        manifest = None if rebuild else _load_manifest()
+        if manifest is not None:
+            if STORAGE_BACKEND == "sqlite":
+                new = _read_new_database_attempts(manifest["last_id"], manifest["count"])
+            else:
+                new = _read_new_file_attempts(manifest["sources"])
+            if new is None:
+                logging.info("Historique modifié depuis la dernière synchronisation : archive reconstruite")
+                manifest = None
+            elif not new[0]:
+                return 0
+        if manifest is None:
+            # Le manifeste est supprimé d'abord : une reconstruction interrompue n'est pas lue.
+            # Les fichiers d'une version précédente de l'archive sont supprimés avec lui.
+            os.makedirs(_archive_dir(), exist_ok=True)
+            for entry in os.scandir(_archive_dir()):
+                if entry.name == "manifest.json" or entry.name.endswith(".npy") or entry.name == "questions.json":
+                    os.remove(entry.path)
+            manifest = {"count": 0, "question_count": 0, "note_count": 0, "questions_size": 0}
+            notes, question_index = [], {}
+            if STORAGE_BACKEND == "sqlite":
+                new = _read_new_database_attempts(0, 0)
+            else:
+                new = _read_new_file_attempts({})
+        else:
+            # Seules les questions sont relues (pour la déduplication), pas les colonnes
+            notes = _load_notes(manifest)
+            question_index = {tuple(question): position for position, question in enumerate(_iter_questions(manifest))}
+
+        attempts, position = new
+        note_count = len(notes)
+        new_questions, rows = _append(notes, question_index, attempts)
+        for name, (dtype, count) in _column_sizes(manifest).items():
+            _append_bytes(_column_path(name), np.dtype(dtype).itemsize * count, rows[name].tobytes())
+        questions_data = "".join(
+            json.dumps(question, ensure_ascii=False, separators=(",", ":")) + "\n" for question in new_questions
+        ).encode("utf-8")
+        _append_bytes(_questions_file(), manifest["questions_size"], questions_data)
+        if len(notes) > note_count or not os.path.exists(_notes_file()):
+            atomic_write_json(_notes_file(), notes, separators=(",", ":"))
+
+        manifest = {
+            "version": ARCHIVE_VERSION,
+            "backend": STORAGE_BACKEND,
+            "count": manifest["count"] + len(attempts),
+            "question_count": len(question_index),
+            "note_count": len(notes),
+            "questions_size": manifest["questions_size"] + len(questions_data),
+        }
+        if STORAGE_BACKEND == "sqlite":
+            manifest["last_id"] = position
+        else:
+            manifest["sources"] = position
+        # Le manifeste est écrit en dernier : les lignes ajoutées par une synchronisation
+        # interrompue sont ignorées, puis écrasées à la suivante
+        atomic_write_json(_manifest_file(), manifest)
+        return len(attempts)
+
+def load_archive(mmap=True):
+    """
+    Charge l'archive telle qu'elle est sur le disque (voir sync_archive pour la mettre à jour)
+    :param mmap: Si True, les colonnes sont projetées en mémoire plutôt que lues
+    :return: StatsArchive (vide si l'archive n'existe pas encore)
+    """
+    manifest = _load_manifest()
+    if manifest is None:
+        return StatsArchive([], np.zeros(0, dtype=QUESTION_NOTES_DTYPE), {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()})
+    columns = {name: _load_column(name, dtype, count, mmap) for name, (dtype, count) in _column_sizes(manifest).items()}
+    return StatsArchive(_load_notes(manifest), columns.pop("question_notes"), columns)
+
+def load_questions():
+    """
+    Questions de l'archive, indexées par identifiant de question
+    :return: Liste de [identifiant de note, texte, réponse correcte]
+    """
+    manifest = _load_manifest()
+    return list(_iter_questions(manifest)) if manifest is not None else []
+
+def _number(value):
+    # Les scores entiers restent des entiers dans les résumés (affichage "5/5" et non "5.0/5")
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+def _day_groups(day_numbers, group_ids, group_count):
+    """
+    Regroupe les tentatives par (groupe, jour)
+    :return: (groupe de chaque paire, jour de chaque paire, indice de la paire de chaque tentative)
+    """
+    first_day = day_numbers.min()
+    span = int(day_numbers.max() - first_day) + 1
+    keys, inverse = np.unique(group_ids.astype(np.int64) * span + (day_numbers - first_day), return_inverse=True)
+    return keys // span, keys % span + first_day, inverse
+
+def compute_summaries(archive, last_n=STATS_SUMMARY_LAST_N):
+    """
+    Résumés par note, au format de stats_manager.update_summary, calculés par opérations
+    vectorisées sur les colonnes de l'archive
+    :return: Dictionnaire {titre: {"count", "sum", "max", "last_scores", "days"}}, trié par titre
+    """
+    if not len(archive):
+        return {}
+    note_ids = archive.note_ids()
+    scores = np.asarray(archive.scores, dtype=np.float64)
+    note_count = len(archive.notes)
+    counts = np.bincount(note_ids, minlength=note_count)
+    sums = np.bincount(note_ids, weights=scores, minlength=note_count)
+    maxima = np.full(note_count, -np.inf)
+    np.maximum.at(maxima, note_ids, scores)
+    # Tri stable par note : les tentatives de chaque note restent dans l'ordre d'enregistrement
+    order = np.argsort(note_ids, kind="stable")
+    ends = np.cumsum(counts)
+
+    day_numbers = np.asarray(archive.timestamps).astype("datetime64[D]").astype(np.int64)
+    pair_notes, pair_days, inverse = _day_groups(day_numbers, note_ids, note_count)
+    day_counts = np.bincount(inverse)
+    day_sums = np.bincount(inverse, weights=scores)
+    day_labels = pair_days.astype("datetime64[D]").astype(str)
+
+    summaries = {}
+    for note_id in np.argsort(archive.notes, kind="stable"):
+        if not counts[note_id]:
+            continue
+        last = order[max(ends[note_id] - last_n, ends[note_id] - counts[note_id]):ends[note_id]]
+        summaries[archive.notes[note_id]] = {
+            "count": int(counts[note_id]),
+            "sum": _number(sums[note_id]),
+            "max": _number(maxima[note_id]),
+            "last_scores": [_number(score) for score in scores[last]],
+            "days": {},
+        }
+    for pair in range(len(pair_notes)):
+        summaries[archive.notes[pair_notes[pair]]]["days"][day_labels[pair]] = {
+            "count": int(day_counts[pair]),
+            "sum": _number(day_sums[pair]),
+        }
+    return summaries
+
+def daily_average_scores(archive):
+    """
+    Score moyen par jour, toutes notes confondues
+    :return: (jours au format AAAA-MM-JJ, scores moyens), du plus ancien au plus récent
+    """
+    if not len(archive):
+        return [], []
+    day_numbers = np.asarray(archive.timestamps).astype("datetime64[D]").astype(np.int64)
+    _, days, inverse = _day_groups(day_numbers, np.zeros(len(archive), dtype=np.int64), 1)
+    averages = np.bincount(inverse, weights=archive.scores) / np.bincount(inverse)
+    return days.astype("datetime64[D]").astype(str).tolist(), averages.tolist()
+
+def archive_size():
+    """
+    Taille de l'archive sur le disque, en octets
+    """
+    archive_dir = _archive_dir()
+    if not os.path.exists(archive_dir):
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(archive_dir) if entry.is_file())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive en colonnes de l'historique des tentatives.")
+    parser.add_argument("--rebuild", action="store_true", help="reconstruit entièrement l'archive")
+    parser.add_argument("--user", help="espace de travail de cet utilisateur (mode multi-utilisateur)")
+    args = parser.parse_args(argv)
+
+    # Import local : stats_manager construit les résumés à partir de l'archive
+    from utils.stats_manager import get_stats_archive, STATS_LOG_SUFFIX
+
+    with workspace.activate(args.user):
+        archive = get_stats_archive(rebuild=args.rebuild)
+        print(f"Archive : {len(archive)} tentatives, {len(archive.question_notes)} questions, {len(archive.notes)} notes")
+        print(f"Taille de l'archive : {archive_size() / 1024:.0f} Ko")
+        stats_dir = workspace.current().stats_dir
+        if STORAGE_BACKEND != "sqlite" and os.path.exists(stats_dir):
+            logs_size = sum(
+                entry.stat().st_size for entry in os.scandir(stats_dir) if entry.name.endswith(STATS_LOG_SUFFIX)
+            )
+            print(f"Taille des journaux : {logs_size / 1024:.0f} Ko")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
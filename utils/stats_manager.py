@@ -1,72 +1,381 @@
 import os
 import json
+from types import SimpleNamespace
 from datetime import datetime
-from config import STATS_DIR
+from config import STORAGE_BACKEND, STATS_SUMMARY_LAST_N
+from utils import database, scheduler, stats_archive, workspace
+from utils.persistence import append_lines, atomic_write_json, atomic_write_text, file_lock, remove_locked_file
 import logging
 
+# Les tentatives sont stockées dans un journal en ajout seul (une ligne JSON par tentative)
+STATS_LOG_SUFFIX = "_stats.jsonl"
+LEGACY_STATS_SUFFIX = "_stats.json"
+
+# Les journaux et le résumé sont ceux de l'espace de travail actif (voir utils.workspace)
+
+def _state():
+    return workspace.current().state(
+        "stats_manager", lambda: SimpleNamespace(migration_done=False, summaries_checked=False)
+    )
+
+def _stats_dir():
+    return workspace.current().stats_dir
+
+def _summary_file():
+    """
+    Résumé des performances par note, mis à jour à chaque enregistrement de tentatives
+    """
+    return os.path.join(_stats_dir(), "_summary.json")
+
+def _stats_log_path(note_title):
+    return os.path.join(_stats_dir(), f"{note_title}{STATS_LOG_SUFFIX}")
+
+def _legacy_stats_path(note_title):
+    return os.path.join(_stats_dir(), f"{note_title}{LEGACY_STATS_SUFFIX}")
+
+def _read_attempts(stats_file):
+    """
+    Lit un journal de tentatives. Une ligne incomplète (écriture interrompue) est ignorée.
+    """
+    attempts = []
+    with open(stats_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                attempts.append(json.loads(line))
+            except json.JSONDecodeError:
+                logging.warning(f"Ligne invalide ignorée dans {stats_file}")
+    return attempts
+
+def _iter_lines_reversed(path, block_size=8192):
+    """
+    Parcourt les lignes d'un fichier de la dernière à la première, sans lire tout le fichier
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode("utf-8")
+        if remainder.strip():
+            yield remainder.decode("utf-8")
+
+def _new_summary():
+    return {"count": 0, "sum": 0, "max": None, "last_scores": [], "days": {}}
+
+def update_summary(note_summary, attempts):
+    """
+    Met à jour le résumé d'une note avec de nouvelles tentatives, en O(nombre de tentatives ajoutées)
+    :param note_summary: Résumé existant, ou None pour en créer un
+    :param attempts: Tentatives à ajouter
+    :return: Résumé mis à jour
+    """
+    note_summary = note_summary or _new_summary()
+    for attempt in attempts:
+        score = attempt["score"]
+        note_summary["count"] += 1
+        note_summary["sum"] += score
+        if note_summary["max"] is None or score > note_summary["max"]:
+            note_summary["max"] = score
+        note_summary["last_scores"].append(score)
+        day = note_summary["days"].setdefault(attempt["timestamp"][:10], {"count": 0, "sum": 0})
+        day["count"] += 1
+        day["sum"] += score
+    note_summary["last_scores"] = note_summary["last_scores"][-STATS_SUMMARY_LAST_N:]
+    return note_summary
+
+def _load_summaries():
+    summary_file = _summary_file()
+    if not os.path.exists(summary_file):
+        return None
+    try:
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Résumé des stats illisible, il sera reconstruit: {e}")
+        return None
+
+def _save_summaries(summaries):
+    atomic_write_json(_summary_file(), summaries, separators=(",", ":"))
+
+def rebuild_summaries():
+    """
+    Reconstruit les résumés de toutes les notes à partir de l'historique complet (calcul
+    vectorisé sur l'archive en colonnes, voir utils.stats_archive)
+    """
+    summaries = stats_archive.compute_summaries(get_stats_archive())
+    if STORAGE_BACKEND == "sqlite":
+        database.replace_summaries(summaries)
+    else:
+        with file_lock(_summary_file()):
+            _save_summaries(summaries)
+    return summaries
+
+def _ensure_summaries():
+    """
+    Vérifie une fois par processus que chaque historique a un résumé (historiques créés
+    avant l'introduction des résumés), et reconstruit les résumés sinon
+    """
+    state = _state()
+    if state.summaries_checked:
+        return
+    if STORAGE_BACKEND == "sqlite":
+        summaries = database.load_summaries()
+        notes_with_attempts = database.notes_with_attempts()
+    else:
+        _ensure_migrated()
+        summaries = _load_summaries()
+        notes_with_attempts = {
+            filename[:-len(STATS_LOG_SUFFIX)]
+            for filename in (os.listdir(_stats_dir()) if os.path.exists(_stats_dir()) else [])
+            if filename.endswith(STATS_LOG_SUFFIX)
+        }
+    if summaries is None or set(summaries) != notes_with_attempts:
+        rebuild_summaries()
+    state.summaries_checked = True
+
+def _append_attempts(note_title, attempts):
+    """
+    Ajoute des tentatives à la fin du journal d'une note, sous verrou et avec une seule
+    synchronisation disque : plusieurs sessions peuvent enregistrer en même temps
+    """
+    append_lines(
+        _stats_log_path(note_title),
+        [json.dumps(attempt, ensure_ascii=False, separators=(",", ":")) for attempt in attempts],
+    )
+
+def migrate_json_stats():
+    """
+    Convertit les anciens fichiers <note>_stats.json en journaux <note>_stats.jsonl.
+    Les tentatives déjà présentes dans le journal sont conservées après celles du fichier JSON.
+    La migration peut être relancée sans risque : si le journal commence déjà par les
+    tentatives du fichier JSON (arrêt avant sa suppression), elles ne sont pas recopiées.
+    :return: Nombre de fichiers migrés
+    """
+    migrated = 0
+    stats_dir = _stats_dir()
+    if not os.path.exists(stats_dir):
+        return migrated
+    for filename in os.listdir(stats_dir):
+        if not filename.endswith(LEGACY_STATS_SUFFIX):
+            continue
+        note_title = filename[:-len(LEGACY_STATS_SUFFIX)]
+        legacy_file = _legacy_stats_path(note_title)
+        log_file = _stats_log_path(note_title)
+        try:
+            with file_lock(log_file):
+                with open(legacy_file, 'r', encoding='utf-8') as f:
+                    attempts = json.load(f).get("attempts", [])
+                existing = _read_attempts(log_file) if os.path.exists(log_file) else []
+                if existing[:len(attempts)] != attempts:
+                    atomic_write_text(log_file, "".join(
+                        json.dumps(attempt, ensure_ascii=False, separators=(",", ":")) + "\n"
+                        for attempt in attempts + existing
+                    ))
+                os.remove(legacy_file)
+            migrated += 1
+        except Exception as e:
+            logging.error(f"Erreur lors de la migration des stats de {note_title}: {e}")
+    return migrated
+
+def _ensure_migrated():
+    state = _state()
+    if not state.migration_done:
+        migrate_json_stats()
+        state.migration_done = True
+
 def save_quiz_result(note_title, question_text, user_answer, correct_answer, score):
     """
     Sauvegarde le résultat d'une question de quiz
     """
-    if not os.path.exists(STATS_DIR):
-        os.makedirs(STATS_DIR)
-        
-    stats_file = os.path.join(STATS_DIR, f"{note_title}_stats.json")
-    
-    # Charger les stats existantes ou créer un nouveau dictionnaire
-    if os.path.exists(stats_file):
-        with open(stats_file, 'r') as f:
-            stats = json.load(f)
-    else:
-        stats = {"attempts": []}
-    
-    # Ajouter la nouvelle tentative
-    attempt = {
-        "timestamp": datetime.now().isoformat(),
+    save_quiz_results(note_title, [{
         "question": question_text,
         "user_answer": user_answer,
         "correct_answer": correct_answer,
         "score": score
+    }])
+
+def save_quiz_results(note_title, results):
+    """
+    Sauvegarde les résultats de toutes les questions d'un quiz en une seule écriture
+    :param note_title: Titre de la note
+    :param results: Liste de dictionnaires avec les clés 'question', 'user_answer', 'correct_answer' et 'score'
+    """
+    save_quiz_session({note_title: results})
+
+def _attempt_record(timestamp, result):
+    attempt = {
+        "timestamp": timestamp,
+        "question": result["question"],
+        "user_answer": result["user_answer"],
+        "correct_answer": result["correct_answer"],
+        "score": result["score"]
     }
-    
-    stats["attempts"].append(attempt)
-    
-    # Sauvegarder les stats
-    with open(stats_file, 'w') as f:
-        json.dump(stats, f, indent=4, ensure_ascii=False)
+    if result.get("question_id"):
+        attempt["question_id"] = result["question_id"]
+    return attempt
+
+def save_quiz_session(results_by_note):
+    """
+    Sauvegarde les résultats d'une soumission de quiz, éventuellement sur plusieurs notes
+    (session de révision) : un ajout par journal de note, puis une seule mise à jour du
+    résumé et du planning des révisions
+    :param results_by_note: Dictionnaire {titre de la note: résultats}, chaque résultat ayant
+                            les clés 'question', 'user_answer', 'correct_answer' et 'score', et
+                            'question_id' (identifiant dans la banque de questions) si elle est connue
+    """
+    _ensure_migrated()
+    timestamp = datetime.now().isoformat()
+    attempts_by_note = {
+        note_title: [
+            _attempt_record(timestamp, result)
+            for result in results
+        ]
+        for note_title, results in results_by_note.items()
+        if results
+    }
+    if not attempts_by_note:
+        return
+    if STORAGE_BACKEND == "sqlite":
+        _record_session(attempts_by_note)
+        return
+    # Le verrou du résumé couvre l'ajout aux journaux et la mise à jour des résumés : une
+    # autre session (ou un autre processus) ne peut pas reconstruire les résumés entre les
+    # deux, ni écraser une mise à jour concurrente
+    with file_lock(_summary_file()):
+        _record_session(attempts_by_note)
+
+def _record_session(attempts_by_note):
+    _ensure_summaries()
+    # Le planning des révisions est chargé (ou reconstruit depuis l'historique) avant l'ajout
+    # des nouvelles tentatives, pour qu'elles ne soient pas comptées deux fois
+    scheduler.load_schedule()
+    if STORAGE_BACKEND == "sqlite":
+        database.save_attempts_by_note(attempts_by_note, update_summary=update_summary)
+    else:
+        for note_title, attempts in attempts_by_note.items():
+            _append_attempts(note_title, attempts)
+        summaries = _load_summaries() or {}
+        for note_title, attempts in attempts_by_note.items():
+            summaries[note_title] = update_summary(summaries.get(note_title), attempts)
+        _save_summaries(summaries)
+    scheduler.record_session(attempts_by_note)
 
 def get_note_stats(note_title):
     """
     Récupère les statistiques pour une note donnée
     """
-    stats_file = os.path.join(STATS_DIR, f"{note_title}_stats.json")
+    if STORAGE_BACKEND == "sqlite":
+        return database.get_note_stats(note_title)
+    _ensure_migrated()
+    stats_file = _stats_log_path(note_title)
     if os.path.exists(stats_file):
-        with open(stats_file, 'r') as f:
-            return json.load(f)
+        return {"attempts": _read_attempts(stats_file)}
     return {"attempts": []}
 
 def get_all_stats():
     """
     Récupère toutes les statistiques
     """
+    if STORAGE_BACKEND == "sqlite":
+        return database.get_all_stats()
+    return get_all_stats_from_files()
+
+def get_all_stats_from_files():
+    """
+    Récupère toutes les statistiques stockées dans les journaux du dossier stats
+    """
+    _ensure_migrated()
     all_stats = {}
-    if os.path.exists(STATS_DIR):
-        for filename in os.listdir(STATS_DIR):
-            if filename.endswith('_stats.json'):
-                note_title = filename.replace('_stats.json', '')
-                with open(os.path.join(STATS_DIR, filename), 'r') as f:
-                    all_stats[note_title] = json.load(f)
+    stats_dir = _stats_dir()
+    if os.path.exists(stats_dir):
+        for filename in os.listdir(stats_dir):
+            if filename.endswith(STATS_LOG_SUFFIX):
+                note_title = filename[:-len(STATS_LOG_SUFFIX)]
+                all_stats[note_title] = {"attempts": _read_attempts(os.path.join(stats_dir, filename))}
     return all_stats
 
+def get_stats_summary():
+    """
+    Récupère les résumés par note sans lire l'historique détaillé
+    :return: Dictionnaire {note: {"count", "sum", "max", "last_scores", "days"}}
+    """
+    _ensure_summaries()
+    if STORAGE_BACKEND == "sqlite":
+        return database.load_summaries()
+    return _load_summaries() or {}
+
+def get_stats_archive(rebuild=False):
+    """
+    Archive en colonnes de l'historique, complétée avec les tentatives nouvelles
+    :param rebuild: Si True, reconstruit entièrement l'archive
+    :return: utils.stats_archive.StatsArchive
+    """
+    _ensure_migrated()
+    stats_archive.sync_archive(rebuild=rebuild)
+    return stats_archive.load_archive()
+
+def get_daily_scores():
+    """
+    Score moyen par jour, toutes notes confondues
+    :return: (jours au format AAAA-MM-JJ, scores moyens)
+    """
+    return stats_archive.daily_average_scores(get_stats_archive())
+
+def get_note_attempts(note_title, offset=0, limit=20):
+    """
+    Récupère une page de l'historique d'une note, de la tentative la plus récente à la plus ancienne
+    :param note_title: Titre de la note
+    :param offset: Nombre de tentatives récentes à sauter
+    :param limit: Nombre maximal de tentatives retournées
+    :return: Liste des tentatives
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return database.get_note_attempts(note_title, offset, limit)
+    _ensure_migrated()
+    stats_file = _stats_log_path(note_title)
+    if not os.path.exists(stats_file):
+        return []
+    attempts = []
+    for position, line in enumerate(_iter_lines_reversed(stats_file)):
+        if position < offset:
+            continue
+        if len(attempts) >= limit:
+            break
+        try:
+            attempts.append(json.loads(line))
+        except json.JSONDecodeError:
+            logging.warning(f"Ligne invalide ignorée dans {stats_file}")
+    return attempts
+
 def delete_note_stats(note_title):
     """
     Supprime l'historique des stats pour une note donnée
     """
-    stats_file = os.path.join(STATS_DIR, f"{note_title}_stats.json")
     try:
-        if os.path.exists(stats_file):
-            os.remove(stats_file)
-            return True
+        scheduler.delete_note_schedule(note_title)
+        if STORAGE_BACKEND == "sqlite":
+            return database.delete_note_stats(note_title)
+        deleted = False
+        for stats_file in (_stats_log_path(note_title), _legacy_stats_path(note_title)):
+            with file_lock(stats_file):
+                if remove_locked_file(stats_file):
+                    deleted = True
+        with file_lock(_summary_file()):
+            summaries = _load_summaries()
+            if summaries and note_title in summaries:
+                del summaries[note_title]
+                _save_summaries(summaries)
+        return deleted
     except Exception as e:
         logging.error(f"Erreur lors de la suppression des stats de {note_title}: {e}")
     return False
@@ -76,11 +385,19 @@ def delete_all_stats():
     Supprime tout l'historique des stats
     """
     try:
-        if os.path.exists(STATS_DIR):
-            for filename in os.listdir(STATS_DIR):
-                if filename.endswith('_stats.json'):
-                    os.remove(os.path.join(STATS_DIR, filename))
+        scheduler.delete_all_schedules()
+        if STORAGE_BACKEND == "sqlite":
+            return database.delete_all_stats()
+        stats_dir = _stats_dir()
+        if os.path.exists(stats_dir):
+            for filename in os.listdir(stats_dir):
+                if filename.endswith(STATS_LOG_SUFFIX) or filename.endswith(LEGACY_STATS_SUFFIX):
+                    stats_file = os.path.join(stats_dir, filename)
+                    with file_lock(stats_file):
+                        remove_locked_file(stats_file)
+            with file_lock(_summary_file()):
+                remove_locked_file(_summary_file())
             return True
     except Exception as e:
         logging.error(f"Erreur lors de la suppression de toutes les stats: {e}")
-    return False 
\ No newline at end of file
+    return False
@@ -0,0 +1,46 @@
+import re
+import unicodedata
+
+# Outils de traitement du texte partagés (pré-correction locale, recherche)
+
+# Mots vides du français, sans accents (les mots sont comparés après suppression des accents).
+# Les négations (ne, pas, ni, jamais...) sont conservées : elles changent le sens d'une réponse.
+FRENCH_STOPWORDS = frozenset("""
+a ai au aux avec ce ces c ca cela celle celui cet cette d dans de des du elle elles en est et etc
+eux il ils j je l la le les leur leurs lui m ma mais me meme mes moi mon n nos notre nous
+on ont ou par pour qu que quel quelle quelles quels qui s sa se ses si son sont
+sur t ta te tes toi ton tu un une vos votre vous y etre avoir fait faire peut etait
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def fold_accents(text):
+    """
+    Met le texte en minuscules et supprime les accents ("Élève" -> "eleve")
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+def tokenize(text, keep_stopwords=False):
+    """
+    Découpe un texte en mots normalisés (minuscules, sans accents)
+    :param keep_stopwords: Si False, les mots vides du français sont retirés
+    :return: Liste de mots
+    """
+    tokens = _TOKEN_PATTERN.findall(fold_accents(text))
+    if keep_stopwords:
+        return tokens
+    return [token for token in tokens if token not in FRENCH_STOPWORDS]
+
+def stem(token):
+    """
+    Racinisation légère du français : retire les marques de pluriel les plus courantes
+    ("processus" et les mots courts sont laissés tels quels)
+    """
+    if len(token) <= 3 or token.endswith("us") or token.endswith("ss"):
+        return token
+    if token.endswith("aux"):
+        return token[:-3] + "al"
+    if token.endswith("s") or token.endswith("x"):
+        return token[:-1]
+    return token
@@ -0,0 +1,148 @@
+import os
+import re
+import threading
+import contextvars
+from contextlib import contextmanager
+from config import NOTES_DIR, QUESTIONS_DIR, STATS_DIR, CACHE_DIR, JOBS_DIR, DB_PATH, WORKSPACES_DIR
+from utils.persistence import atomic_write_text
+
+# Espaces de travail : chaque utilisateur a ses dossiers de données (notes, questions,
+# statistiques, index, tâches, base SQLite), sa clé API et l'état en mémoire des modules
+# (index, caches, planning des révisions). L'espace de travail actif est porté par une
+# variable de contexte : chaque session de l'application active celui de son utilisateur, et
+# les threads lancés pour elle en héritent (voir utils.metrics.bind_context). Sans utilisateur,
+# l'espace de travail par défaut est celui des dossiers de config.py (mode mono-utilisateur).
+
+# Identifiant d'utilisateur, qui est aussi le nom de son dossier
+_USER_PATTERN = re.compile(r"[a-z0-9][a-z0-9._-]{0,63}")
+
+class Workspace:
+    """
+    Dossiers, clé API et état en mémoire des modules d'un utilisateur
+    """
+
+    def __init__(self, user, notes_dir, questions_dir, stats_dir, cache_dir, jobs_dir, db_path, env_file):
+        self.user = user
+        self.notes_dir = notes_dir
+        self.questions_dir = questions_dir
+        self.stats_dir = stats_dir
+        self.cache_dir = cache_dir
+        self.jobs_dir = jobs_dir
+        self.db_path = db_path
+        self.env_file = env_file
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def state(self, name, factory):
+        """
+        État en mémoire d'un module dans cet espace de travail, créé au premier appel
+        :param name: Nom du module
+        :param factory: Fonction sans argument qui crée l'état initial
+        """
+        with self._lock:
+            if name not in self._states:
+                self._states[name] = factory()
+            return self._states[name]
+
+    def ensure_dirs(self):
+        for directory in (self.notes_dir, self.questions_dir, self.stats_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def api_key(self, inherit=True):
+        """
+        Clé API de l'utilisateur (fichier .env de l'espace de travail), ou à défaut celle de
+        l'instance (variable d'environnement DEEPSEEK_KEY)
+        :param inherit: Si False, ignore la clé de l'instance
+        """
+        key = None
+        if os.path.exists(self.env_file):
+            from dotenv import dotenv_values
+
+            key = dotenv_values(self.env_file).get("DEEPSEEK_KEY")
+        return key or (os.getenv("DEEPSEEK_KEY") if inherit else None) or ""
+
+    def save_api_key(self, key):
+        atomic_write_text(self.env_file, f'DEEPSEEK_KEY="{key}"')
+
+    def delete_api_key(self):
+        if os.path.exists(self.env_file):
+            os.remove(self.env_file)
+
+_workspaces = {}
+_workspaces_lock = threading.Lock()
+_current = contextvars.ContextVar("workspace", default=None)
+
+def normalize_user(user):
+    """
+    Vérifie et normalise un identifiant d'utilisateur (minuscules, sans espaces autour)
+    :raises ValueError: si l'identifiant contient d'autres caractères que des lettres
+                        minuscules, des chiffres, ".", "_" et "-"
+    """
+    normalized = user.strip().lower()
+    if not _USER_PATTERN.fullmatch(normalized):
+        raise ValueError(f"Identifiant d'utilisateur invalide : {user!r}")
+    return normalized
+
+def get_workspace(user=None):
+    """
+    Espace de travail d'un utilisateur, ou l'espace par défaut si user est None
+    """
+    if user is not None:
+        user = normalize_user(user)
+    with _workspaces_lock:
+        workspace = _workspaces.get(user)
+        if workspace is None:
+            if user is None:
+                workspace = Workspace(None, NOTES_DIR, QUESTIONS_DIR, STATS_DIR, CACHE_DIR, JOBS_DIR, DB_PATH, ".env")
+            else:
+                root = os.path.join(WORKSPACES_DIR, user)
+                workspace = Workspace(
+                    user,
+                    os.path.join(root, "notes"),
+                    os.path.join(root, "questions"),
+                    os.path.join(root, "stats"),
+                    os.path.join(root, "cache"),
+                    os.path.join(root, "jobs"),
+                    os.path.join(root, "notemaster.sqlite3"),
+                    os.path.join(root, ".env"),
+                )
+            _workspaces[user] = workspace
+        return workspace
+
+def current():
+    """
+    Espace de travail actif
+    """
+    return _current.get() or get_workspace()
+
+def set_current(user):
+    """
+    Active l'espace de travail d'un utilisateur pour la suite du contexte courant (une
+    exécution du script de l'application)
+    :return: Espace de travail activé
+    """
+    workspace = get_workspace(user)
+    _current.set(workspace)
+    return workspace
+
+@contextmanager
+def activate(user):
+    """
+    Active l'espace de travail d'un utilisateur dans ce bloc
+    """
+    token = _current.set(get_workspace(user))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+def list_users():
+    """
+    Utilisateurs ayant un espace de travail
+    """
+    if not os.path.isdir(WORKSPACES_DIR):
+        return []
+    return sorted(
+        entry.name for entry in os.scandir(WORKSPACES_DIR)
+        if entry.is_dir() and _USER_PATTERN.fullmatch(entry.name)
+    )